@@ -0,0 +1,137 @@
+'''命令行批量生成工序卡
+
+从 JSONL 文件读取生成请求，每行一个 json 对象，包含“模板编码”以及需要补充的信息（项目名称、编制、批准等），
+可以用“文件名”指定输出的文件名（去掉路径和不允许的字符，重名时追加序号）。使用多个渲染工作进程生成后写入输出目录，并在输出目录中写入结果清单 manifest.jsonl。
+
+运行方式：python -m generate requests.jsonl -o output -w 4
+'''
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from generate.config import POOL_SIZE
+from generate.batch import get_card_names
+from generate.worker_pool import RenderPool
+from generate.output_cache import OutputCache, submit
+from generate.template_store import TemplateStore
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def read_requests(path: Path) -> list[tuple[int, dict]]:
+    '''读取生成请求，返回（行号，请求）列表，跳过空行'''
+    requests = []
+    with open(path, mode='r', encoding='utf8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                requests.append((line_number, json.loads(line)))
+    return requests
+
+
+def get_templates(codes: set[str]) -> dict[str, dict]:
+    '''按模板编码索引的工序卡模板，只读取请求中用到的模板，编码重复时使用最后一个'''
+    store = TemplateStore()
+    templates = {}
+    for code in codes:
+        for item in store.find(模板编码=code).values():
+            templates[code] = item
+    return templates
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    '''计算分位数，values 需要已经排序'''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def run(input_path: Path, output_path: Path, workers: int, backend: str | None, use_cache: bool) -> int:
+    '''执行批量生成，返回失败的数量'''
+    requests = read_requests(input_path)
+    templates = get_templates({request['模板编码'] for _, request in requests if request.get('模板编码')})
+    output_path.mkdir(parents=True, exist_ok=True)
+    # 请求中未指定文件名时，按“工序编码_工序名称”命名
+    items = [
+        templates.get(request.get('模板编码'), {}) | {key: value for key, value in request.items() if key != '文件名'}
+        for _, request in requests
+    ]
+    # 指定的文件名去掉路径和不允许的字符，与其他请求的文件名重复时追加序号
+    names = get_card_names(items, [request.get('文件名') for _, request in requests])
+    cache = OutputCache() if use_cache else None
+    manifest = []
+    latencies = []
+    with RenderPool(backend, size=workers) as pool:
+        # 工作进程启动和模板编译的耗时单独统计，不计入吞吐量
+        started = time.perf_counter()
+        pool.wait_ready()
+        print(f'{workers} 个工作进程启动耗时 {time.perf_counter() - started:.2f} 秒', file=sys.stderr)
+        started = time.perf_counter()
+        # 同时提交的请求不超过工作进程数量的两倍，耗时统计不包含长时间的排队
+        pending: dict[Future, int] = {}
+        submitted: dict[int, float] = {}
+        next_index = 0
+        while next_index < len(requests) or pending:
+            while next_index < len(requests) and len(pending) < workers * 2:
+                line_number, request = requests[next_index]
+                if request.get('模板编码') not in templates:
+                    manifest.append({
+                        'line': line_number, '模板编码': request.get('模板编码'), 'status': 'error',
+                        'error': f'未找到模板编码：{request.get('模板编码')}',
+                    })
+                else:
+                    submitted[next_index] = time.perf_counter()
+                    pending[submit(pool, items[next_index], cache)] = next_index
+                next_index += 1
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                latency = time.perf_counter() - submitted[index]
+                record = {'line': requests[index][0], '模板编码': items[index]['模板编码']}
+                try:
+                    file_path = output_path / names[index]
+                    if file_path.resolve().parent != output_path.resolve():
+                        raise ValueError(f'文件名不能包含路径：{names[index]}')
+                    file_path.write_bytes(future.result())
+                except Exception as error:
+                    record |= {'status': 'error', 'error': str(error)}
+                else:
+                    latencies.append(latency)
+                    record |= {'status': 'ok', 'file': names[index], 'latency_ms': round(latency * 1000, 1)}
+                manifest.append(record)
+                print(f'[{len(manifest)}/{len(requests)}] {record['status']} {names[index]}', file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    manifest.sort(key=lambda record: record['line'])
+    with open(output_path / MANIFEST_NAME, mode='w', encoding='utf8') as file:
+        for record in manifest:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    failed = sum(1 for record in manifest if record['status'] != 'ok')
+    latencies.sort()
+    print(f'生成 {len(manifest) - failed} 份，失败 {failed} 份，耗时 {elapsed:.2f} 秒')
+    print(f'吞吐量 {(len(manifest) - failed) / elapsed if elapsed else 0:.2f} 份/秒，'
+          f'延迟 p50 {percentile(latencies, 0.5) * 1000:.0f} ms，p95 {percentile(latencies, 0.95) * 1000:.0f} ms')
+    if cache is not None:
+        print(f'缓存 {cache.stats()}')
+    print(f'结果清单：{output_path / MANIFEST_NAME}')
+    return failed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m generate', description='从 JSONL 文件批量生成工序卡')
+    parser.add_argument('input', type=Path, help='生成请求的 JSONL 文件')
+    parser.add_argument('-o', '--output', type=Path, default=Path('output'), help='输出目录，默认为 output')
+    parser.add_argument('-w', '--workers', type=int, default=POOL_SIZE, help='渲染工作进程数量')
+    parser.add_argument('-b', '--backend', default=None, help='渲染后端，默认使用 PCG_RENDER_BACKEND')
+    parser.add_argument('--no-cache', action='store_true', help='不使用生成结果缓存')
+    args = parser.parse_args(argv)
+    failed = run(args.input, args.output, max(1, args.workers), args.backend, not args.no_cache)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+'''生成结果的临时存放
+
+生成的 docx 和 zip 在 source 目录中保存一段时间，方便在后台找回。
+每个结果使用时间加随机串作为编号，先写入临时文件再重命名，同一秒内的多次生成不会互相覆盖；
+过期时间记录在内存中的最小堆里，由后台线程按时删除，生成请求本身不需要遍历目录。
+'''
+import os
+import time
+import heapq
+import uuid
+import datetime
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import Iterator
+from generate.config import ARTIFACT_PATH, ARTIFACT_TTL
+
+TEMP_SUFFIX = '.tmp'
+
+
+@dataclass(frozen=True)
+class Artifact:
+    '''一个保存的生成结果'''
+    id: str
+    path: Path
+    # 过期时间，time.time() 的时间戳
+    expires: float
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def new_artifact_id() -> str:
+    '''生成编号：时间便于人工查找，随机串保证不重复'''
+    return f'{datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}-{uuid.uuid4().hex[:12]}'
+
+
+class ArtifactStore:
+    '''按过期时间自动清理的生成结果目录，ttl 的单位为秒'''
+
+    def __init__(self, path: Path = ARTIFACT_PATH, ttl: float = ARTIFACT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.path.mkdir(parents=True, exist_ok=True)
+        # (过期时间, 文件路径) 的最小堆
+        self.expiry: list[tuple[float, Path]] = []
+        self.condition = threading.Condition()
+        self.closing = False
+        self.evicted = 0
+        self.load()
+        self.thread = threading.Thread(target=self.run_janitor, name='artifact-janitor', daemon=True)
+        self.thread.start()
+
+    def load(self):
+        '''启动时登记目录中已有的文件，按修改时间计算过期时间，残留的临时文件直接删除'''
+        for file in self.path.iterdir():
+            if not file.is_file() or file.name.startswith('~$'):
+                continue
+            if file.suffix == TEMP_SUFFIX:
+                file.unlink(missing_ok=True)
+                continue
+            heapq.heappush(self.expiry, (file.stat().st_mtime + self.ttl, file))
+
+    @contextmanager
+    def create(self, suffix: str) -> Iterator[tuple[Artifact, Path]]:
+        '''创建一个结果，返回结果信息和需要写入的临时文件，正常退出后重命名为正式文件'''
+        artifact_id = new_artifact_id()
+        temp_path = self.path / f'{artifact_id}{suffix}{TEMP_SUFFIX}'
+        artifact = Artifact(artifact_id, self.path / f'{artifact_id}{suffix}', time.time() + self.ttl)
+        try:
+            yield artifact, temp_path
+            os.replace(temp_path, artifact.path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        with self.condition:
+            heapq.heappush(self.expiry, (artifact.expires, artifact.path))
+            self.condition.notify()
+
+    def save(self, data: bytes, suffix: str) -> Artifact:
+        '''保存一个结果'''
+        with self.create(suffix) as (artifact, temp_path):
+            temp_path.write_bytes(data)
+        return artifact
+
+    def get_companion_path(self, artifact: Artifact, suffix: str) -> Path:
+        '''与结果同名、后缀不同的附属文件（例如 PDF 预览）的路径'''
+        return artifact.path.with_suffix(suffix)
+
+    def add_companion(self, artifact: Artifact, suffix: str) -> Path:
+        '''登记已经写入的附属文件，与结果同时过期'''
+        path = self.get_companion_path(artifact, suffix)
+        with self.condition:
+            heapq.heappush(self.expiry, (artifact.expires, path))
+            self.condition.notify()
+        return path
+
+    def close(self):
+        '''停止后台清理线程'''
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+
+    # ------------------------------------------
+    #  后台清理线程
+    #  MARK: 清理
+    # ------------------------------------------
+
+    def run_janitor(self):
+        '''等待到最早的过期时间后删除过期的结果'''
+        while True:
+            with self.condition:
+                if self.closing:
+                    return
+                now = time.time()
+                expired = []
+                while self.expiry and self.expiry[0][0] <= now:
+                    expired.append(heapq.heappop(self.expiry)[1])
+                if not expired:
+                    timeout = self.expiry[0][0] - now if self.expiry else None
+                    self.condition.wait(timeout)
+                    continue
+            for file in expired:
+                try:
+                    file.unlink(missing_ok=True)
+                except OSError:
+                    # 文件被占用（例如在 Windows 上被打开）时稍后重试
+                    with self.condition:
+                        heapq.heappush(self.expiry, (time.time() + 60, file))
+                    continue
+                self.evicted += 1
@@ -0,0 +1,96 @@
+'''批量生成工序卡
+
+多个模板共用同一份补充信息，提交到渲染进程池并发生成，生成完成的工序卡依次写入同一个 zip，
+不需要等所有工序卡都生成完，也不需要把所有 docx 同时放在内存中。生成失败的工序卡记录在
+zip 中的“生成失败.txt”里，不影响其他工序卡。
+'''
+import re
+import zipfile
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import as_completed
+from typing import Callable
+from generate.worker_pool import RenderPool
+from generate.service import RenderClient
+from generate.output_cache import OutputCache, submit
+
+ERROR_FILE_NAME = '生成失败.txt'
+# 文件名中不允许出现的字符
+INVALID_NAME_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+@dataclass
+class BatchResult:
+    '''一份工序卡的批量生成结果，成功时 error 为空'''
+    index: int
+    name: str
+    error: str | None = None
+
+    @property
+    def summary(self) -> str:
+        '''错误信息的最后一行，用于页面提示'''
+        return self.error.strip().splitlines()[-1] if self.error else ''
+
+
+def clean_card_name(name: str) -> str:
+    '''去掉文件名中的路径和不允许的字符，统一为 .docx'''
+    stem = str(name)
+    if stem.lower().endswith('.docx'):
+        stem = stem[:-len('.docx')]
+    # 路径分隔符替换后，再去掉开头的 . 避免出现 .. 和隐藏文件
+    stem = INVALID_NAME_CHARS.sub('-', stem).strip('.-')
+    return f'{stem or '工序卡'}.docx'
+
+
+def get_card_name(item: dict) -> str:
+    '''工序卡在 zip 中的文件名：工序编码_工序名称.docx'''
+    return clean_card_name('_'.join(str(item.get(key) or '') for key in ('工序编码', '工序名称')).strip('_'))
+
+
+def get_card_names(items: list[dict], names: list[str | None] | None = None) -> list[str]:
+    '''为每份工序卡生成不重复的文件名，重名时追加序号
+
+    names 为用户指定的文件名，为空的按“工序编码_工序名称”命名；比较时不区分大小写（Windows 的文件名不区分大小写）。
+    '''
+    result = []
+    used = set()
+    for index, item in enumerate(items):
+        name = clean_card_name(names[index]) if names and names[index] else get_card_name(item)
+        stem, number = name[:-len('.docx')], 1
+        while name.lower() in used:
+            number += 1
+            name = f'{stem}({number}).docx'
+        used.add(name.lower())
+        result.append(name)
+    return result
+
+
+def render_batch(pool: RenderPool | RenderClient, items: list[dict], supplement: dict, archive_path: Path,
+                 on_progress: Callable[[int, int, BatchResult], None] | None = None,
+                 cache: OutputCache | None = None) -> list[BatchResult]:
+    '''用同一份补充信息并发生成多份工序卡，按完成顺序写入 archive_path，返回按输入顺序排列的结果
+
+    on_progress 在每份工序卡完成时调用，参数为已完成数量、总数和该工序卡的结果。
+    cache 不为空时，已经生成过的工序卡直接使用缓存的结果。
+    '''
+    items = [item | supplement for item in items]
+    names = get_card_names(items)
+    futures = {submit(pool, item, cache): index for index, item in enumerate(items)}
+    results: list[BatchResult | None] = [None] * len(items)
+    # docx 本身已经压缩过，zip 中直接存储
+    with zipfile.ZipFile(archive_path, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                archive.writestr(names[index], future.result())
+                result = BatchResult(index, names[index])
+            except Exception as error:
+                result = BatchResult(index, names[index], str(error) or type(error).__name__)
+            results[index] = result
+            if on_progress is not None:
+                on_progress(done, len(items), result)
+        errors = [result for result in results if result.error]
+        if errors:
+            report = '\n\n'.join(f'{result.name}\n{result.error}' for result in errors)
+            archive.writestr(ERROR_FILE_NAME, report, compress_type=zipfile.ZIP_DEFLATED)
+    return results
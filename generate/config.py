@@ -0,0 +1,71 @@
+import os
+import sys
+from pathlib import Path
+
+# ------------------------------------------
+#  生成服务的配置项，均可以通过环境变量覆盖
+#  MARK: 配置项
+# ------------------------------------------
+
+# 工序卡的渲染后端：word 通过 Word COM 接口绘制，仅支持安装了 Office 的 Windows
+# docx 直接基于 docx 模板生成 WordprocessingML，不依赖 Word，可以在 Linux 服务器上运行
+RENDER_BACKEND = os.environ.get('PCG_RENDER_BACKEND', 'word' if sys.platform == 'win32' else 'docx')
+
+# 渲染工作进程池：常驻的工作进程数量
+POOL_SIZE = int(os.environ.get('PCG_POOL_SIZE', '2'))
+# 单个工作进程生成多少份工序卡后重启，用于回收 Word 等长期运行积累的资源
+POOL_MAX_TASKS = int(os.environ.get('PCG_POOL_MAX_TASKS', '50'))
+# 工作进程占用的内存超过该值（MB）后重启，0 表示不限制
+POOL_MAX_MEMORY = int(os.environ.get('PCG_POOL_MAX_MEMORY', '1024'))
+# 单份工序卡的渲染超时时间（秒），超时的工作进程会被强制结束
+RENDER_TIMEOUT = float(os.environ.get('PCG_RENDER_TIMEOUT', '120'))
+# 空闲工作进程的健康检查间隔（秒）
+HEALTH_CHECK_INTERVAL = float(os.environ.get('PCG_HEALTH_CHECK_INTERVAL', '30'))
+
+# 生成结果缓存：相同的模板和补充信息直接返回之前生成的 docx
+OUTPUT_CACHE_PATH = Path(os.environ.get('PCG_OUTPUT_CACHE_PATH', Path(__file__).parent.parent / 'cache' / 'output'))
+# 生成结果缓存的容量上限（MB），超过后删除最久未使用的结果，0 表示不缓存
+OUTPUT_CACHE_MAX_SIZE = int(os.environ.get('PCG_OUTPUT_CACHE_MAX_SIZE', '512'))
+
+# 生成结果的存放目录，用于在后台找回生成的工序卡
+ARTIFACT_PATH = Path(os.environ.get('PCG_ARTIFACT_PATH', Path(__file__).parent.parent / 'source'))
+# 生成结果的保存时间（秒），过期后由后台线程删除
+ARTIFACT_TTL = float(os.environ.get('PCG_ARTIFACT_TTL', '600'))
+
+# 后台生成任务：同时执行的任务数量，每个任务再把工序卡交给渲染进程池
+JOB_WORKERS = int(os.environ.get('PCG_JOB_WORKERS', '4'))
+# 最多排队的任务数量，超过后拒绝新的任务
+JOB_QUEUE_SIZE = int(os.environ.get('PCG_JOB_QUEUE_SIZE', '100'))
+
+# 独立的渲染服务：监听的地址和端口
+SERVICE_HOST = os.environ.get('PCG_SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.environ.get('PCG_SERVICE_PORT', '8765'))
+# 渲染服务最多同时接收的请求数量（包括排队中的），超过后返回 503
+SERVICE_MAX_REQUESTS = int(os.environ.get('PCG_SERVICE_MAX_REQUESTS', '32'))
+# 页面使用的渲染服务地址，多个副本用逗号分隔，例如 http://127.0.0.1:8765,http://127.0.0.1:8766
+# 为空时在页面进程中启动渲染进程池
+RENDER_SERVICE_URLS = [url.strip().rstrip('/') for url in os.environ.get('PCG_RENDER_SERVICE_URLS', '').split(',') if url.strip()]
+
+# PDF 预览：LibreOffice 的 soffice 路径，找不到时不提供 PDF 预览
+SOFFICE_PATH = os.environ.get(
+    'PCG_SOFFICE_PATH', r'C:\Program Files\LibreOffice\program\soffice.exe' if sys.platform == 'win32' else 'soffice'
+)
+# 能够 import uno 的 python（一般是 LibreOffice 自带的 python），为空时自动查找，找不到时每次转换都重新启动 LibreOffice
+SOFFICE_PYTHON_PATH = os.environ.get('PCG_SOFFICE_PYTHON', '')
+# 常驻的 LibreOffice 进程数量，0 表示不转换 PDF
+PDF_POOL_SIZE = int(os.environ.get('PCG_PDF_POOL_SIZE', '1'))
+# 单份工序卡转换 PDF 的超时时间（秒）
+PDF_TIMEOUT = float(os.environ.get('PCG_PDF_TIMEOUT', '60'))
+
+# 模板缩略图的缓存目录
+THUMBNAIL_CACHE_PATH = Path(os.environ.get('PCG_THUMBNAIL_CACHE_PATH', Path(__file__).parent.parent / 'cache' / 'thumbnails'))
+
+# 工序卡模板数据库，不存在时从 database/工序卡模板.json 导入
+TEMPLATE_DB_PATH = Path(os.environ.get('PCG_TEMPLATE_DB_PATH', Path(__file__).parent.parent / 'database' / '工序卡模板.db'))
+# 模板修改先追加到数据库的 WAL 日志中，后台按此间隔（秒）把日志合并回数据库文件，0 表示由 SQLite 自动合并
+TEMPLATE_CHECKPOINT_INTERVAL = float(os.environ.get('PCG_TEMPLATE_CHECKPOINT_INTERVAL', '30'))
+# WAL 日志超过此大小（MB）时立即合并
+TEMPLATE_JOURNAL_MAX_SIZE = int(os.environ.get('PCG_TEMPLATE_JOURNAL_MAX_SIZE', '16'))
+
+# 基础资料 csv 的列式快照目录，csv 修改后自动重新生成
+SNAPSHOT_PATH = Path(os.environ.get('PCG_SNAPSHOT_PATH', Path(__file__).parent.parent / 'cache' / 'snapshots'))
@@ -0,0 +1,147 @@
+'''渲染后端一致性检查
+
+使用 database/工序卡模板.json 中的模板作为样例，通过所有可用的渲染后端生成工序卡，
+比较规范化后的 document.xml、页数以及表格中每个单元格的文字。
+
+运行方式：python -m generate.conformance
+'''
+import io
+import sys
+import json
+import datetime
+import zipfile
+from pathlib import Path
+from lxml import etree
+from generate.renderer import Renderer, list_renderers
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+path = Path(__file__).parent.parent / 'database' / '工序卡模板.json'
+
+# 与渲染内容无关、每次保存都可能变化的元素和属性
+VOLATILE_TAGS = {'proofErr', 'lastRenderedPageBreak', 'bookmarkStart', 'bookmarkEnd'}
+VOLATILE_ATTRIBUTES = {'paraId', 'textId'}
+
+# 样例中需要补充填写的信息
+SAMPLE_SUPPLEMENT = {
+    '项目名称': '上海19号线',
+    '项目编码': 'SH19',
+    '密级/保密期限': '普通商密',
+    '文件编号': 'AJP1023290A-22-01',
+    '零部件图号': 'AJP1023290A',
+    '编制': '黎运阳',
+    '编制日期': datetime.date(2026, 1, 21),
+    '校对': '张权',
+    '校对日期': datetime.date(2026, 1, 21),
+    '审核': '毛幸福',
+    '审核日期': datetime.date(2026, 1, 21),
+    '标准化': '黎运阳',
+    '标准化日期': datetime.date(2026, 1, 21),
+    '会签': '张权',
+    '会签日期': datetime.date(2026, 1, 21),
+    '批准': '毛幸福',
+    '批准日期': datetime.date(2026, 1, 21),
+    '失效日期': datetime.date(2026, 12, 21),
+    '文件版本': '1',
+}
+
+
+def get_sample_items() -> list[dict]:
+    '''获取用于一致性检查的样例工序卡配置'''
+    with open(path, mode='r', encoding='utf8') as file:
+        return [item | SAMPLE_SUPPLEMENT for item in json.loads(file.read())]
+
+
+def get_document_root(docx_bytes: bytes):
+    '''读取 docx 中 document.xml 的根节点'''
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as archive:
+        return etree.fromstring(archive.read('word/document.xml'))
+
+
+def canonicalize(docx_bytes: bytes) -> str:
+    '''去除修订标识等无关内容后，按 C14N 规范化 document.xml'''
+    root = get_document_root(docx_bytes)
+    for element in list(root.iter()):
+        if not isinstance(element.tag, str):
+            element.getparent().remove(element)
+            continue
+        if etree.QName(element).localname in VOLATILE_TAGS:
+            element.getparent().remove(element)
+            continue
+        for key in list(element.attrib):
+            localname = etree.QName(key).localname
+            if localname.startswith('rsid') or localname in VOLATILE_ATTRIBUTES:
+                del element.attrib[key]
+    return etree.tostring(root, method='c14n').decode('utf-8')
+
+
+def count_pages(docx_bytes: bytes) -> int:
+    '''按显式分页符、段前分页和分节符统计页数'''
+    root = get_document_root(docx_bytes)
+    breaks = len(root.findall(f'.//{{{W}}}br[@{{{W}}}type="page"]'))
+    breaks += len(root.findall(f'.//{{{W}}}pageBreakBefore'))
+    breaks += len(root.findall(f'.//{{{W}}}pPr/{{{W}}}sectPr'))
+    return breaks + 1
+
+
+def get_table_texts(docx_bytes: bytes) -> list[list[list[str]]]:
+    '''按文档顺序获取所有表格（包括嵌套表格）中每个单元格的文字'''
+    root = get_document_root(docx_bytes)
+    tables = []
+    for tbl in root.iter(f'{{{W}}}tbl'):
+        rows = []
+        for tr in tbl.findall(f'{{{W}}}tr'):
+            cells = []
+            for tc in tr.findall(f'{{{W}}}tc'):
+                texts = []
+                for p in tc.findall(f'{{{W}}}p'):
+                    texts.append(''.join(t.text or '' for t in p.iter(f'{{{W}}}t')))
+                cells.append('\n'.join(texts))
+            rows.append(cells)
+        tables.append(rows)
+    return tables
+
+
+def compare(label: str, expected: bytes, actual: bytes) -> list[str]:
+    '''比较两个 docx，返回不一致的描述'''
+    problems = []
+    if count_pages(expected) != count_pages(actual):
+        problems.append(f'{label}：页数不一致，{count_pages(expected)} != {count_pages(actual)}')
+    expected_tables = get_table_texts(expected)
+    actual_tables = get_table_texts(actual)
+    if len(expected_tables) != len(actual_tables):
+        problems.append(f'{label}：表格数量不一致，{len(expected_tables)} != {len(actual_tables)}')
+    for i, (expected_rows, actual_rows) in enumerate(zip(expected_tables, actual_tables)):
+        if expected_rows != actual_rows:
+            problems.append(f'{label}：第 {i + 1} 个表格的单元格文字不一致')
+    if canonicalize(expected) != canonicalize(actual):
+        problems.append(f'{label}：规范化后的 document.xml 不一致')
+    return problems
+
+
+def run_conformance(renderers: list[Renderer] | None = None, items: list[dict] | None = None) -> list[str]:
+    '''对所有后端执行一致性检查，第一个后端作为参照，返回发现的问题'''
+    renderers = list_renderers(available_only=True) if renderers is None else renderers
+    items = get_sample_items() if items is None else items
+    problems = []
+    for index, item in enumerate(items):
+        reference = None
+        for renderer in renderers:
+            label = f'样例 {index + 1}（{item.get('模板编码')}）/{renderer.name}'
+            result = renderer.render_to_bytes(item)
+            # 同一后端重复渲染的结果必须一致
+            problems.extend(compare(f'{label} 重复渲染', result, renderer.render_to_bytes(item)))
+            if reference is None:
+                reference = (renderer, result)
+            else:
+                problems.extend(compare(f'{label} 对比 {reference[0].name}', reference[1], result))
+    return problems
+
+
+if __name__ == '__main__':
+    renderers = list_renderers(available_only=True)
+    print(f'参与检查的后端：{'、'.join(renderer.name for renderer in renderers)}')
+    problems = run_conformance(renderers)
+    for problem in problems:
+        print(problem)
+    print('一致性检查通过' if not problems else f'发现 {len(problems)} 个问题')
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,36 @@
+import datetime
+
+
+def format_value(value) -> str:
+    '''将填报的值统一转换为写入文档的文本'''
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def get_context(item: dict) -> dict:
+    '''将工序卡配置映射为模板中的占位变量'''
+    return {
+        'confidentiality_level': format_value(item.get('密级/保密期限')),
+        'project_name': format_value(item.get('项目名称')),
+        'process_name': format_value(item.get('工序名称')),
+        'process_code': format_value(item.get('工序编码')),
+        'document_number': format_value(item.get('文件编号')),
+        'component_part_number': format_value(item.get('零部件图号')),
+        'applicable_vehicle_models': format_value(item.get('适用车型')),
+        'professional_classification': format_value(item.get('专业分类')),
+        'compile_person': format_value(item.get('编制')),
+        'compile_time': format_value(item.get('编制日期')),
+        'proofread_person': format_value(item.get('校对')),
+        'proofread_time': format_value(item.get('校对日期')),
+        'review_person': format_value(item.get('审核')),
+        'review_time': format_value(item.get('审核日期')),
+        'standardization_person': format_value(item.get('标准化')),
+        'standardization_time': format_value(item.get('标准化日期')),
+        'countersign_person': format_value(item.get('会签')),
+        'countersign_time': format_value(item.get('会签日期')),
+        'ratify_person': format_value(item.get('批准')),
+        'ratify_time': format_value(item.get('批准日期')),
+    }
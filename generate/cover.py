@@ -0,0 +1,161 @@
+'''工序卡首页（封面）的预生成骨架
+
+首页的外框、密级横幅、“工艺文件”标题以及所有标签都是固定的，只生成一次 xml 骨架并缓存，
+骨架中用具名插槽标出需要填写的字段。每次生成时只把字段值填入插槽，得到可以直接通过
+Word 的 Range.InsertXML 一次性插入的 Flat OPC 文档。
+'''
+import functools
+from xml.sax.saxutils import escape
+from generate.context import get_context
+from generate.rich_text import RichText, Style
+
+CM_TO_POINT = 28.35
+FONT_NAME = '思源宋体'
+# 插槽标记，骨架中以 SLOT + 插槽名 + SLOT 的形式出现
+SLOT = '\x00'
+
+# A4 横向的页面尺寸及页边距（左 2.2cm，上下右 0.5cm）
+PAGE_WIDTH = 29.7 * CM_TO_POINT
+PAGE_HEIGHT = 21.0 * CM_TO_POINT
+LEFT = 2.2 * CM_TO_POINT
+TOP = 0.5 * CM_TO_POINT
+WIDTH = PAGE_WIDTH - LEFT - 0.5 * CM_TO_POINT
+HEIGHT = PAGE_HEIGHT - TOP - 0.5 * CM_TO_POINT
+
+# 内部矩形：预留标题高度 1.15cm，与外部矩形的间距 0.5cm
+HEADER_HEIGHT = 1.15 * CM_TO_POINT
+PADDING = 0.5 * CM_TO_POINT
+INNER_LEFT = LEFT + PADDING
+INNER_TOP = TOP + HEADER_HEIGHT
+INNER_WIDTH = WIDTH - 2 * PADDING
+INNER_HEIGHT = HEIGHT - HEADER_HEIGHT - PADDING
+
+PACKAGE_HEAD = (
+    '<?xml version="1.0" standalone="yes"?>'
+    '<?mso-application progid="Word.Document"?>'
+    '<pkg:package xmlns:pkg="http://schemas.microsoft.com/office/2006/xmlPackage">'
+    '<pkg:part pkg:name="/_rels/.rels" pkg:contentType="application/vnd.openxmlformats-package.relationships+xml">'
+    '<pkg:xmlData><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships></pkg:xmlData></pkg:part>'
+    '<pkg:part pkg:name="/word/document.xml" pkg:contentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml">'
+    '<pkg:xmlData><w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" xmlns:o="urn:schemas-microsoft-com:office:office"><w:body>'
+)
+PACKAGE_TAIL = '</w:body></w:document></pkg:xmlData></pkg:part></pkg:package>'
+
+
+def slot(name: str) -> str:
+    '''生成一个具名插槽'''
+    return f'{SLOT}{name}{SLOT}'
+
+
+def run(text: str, size: float, bold: bool = False) -> str:
+    '''生成一段统一格式的文字'''
+    return RichText(Style(font=FONT_NAME, size=size, bold=bold)).add(text).to_xml()
+
+
+def paragraph(runs: str, align: str = 'left', tab: float | None = None) -> str:
+    '''生成一个段落，tab 为右对齐制表位的位置（磅）'''
+    properties = ''
+    if tab is not None:
+        properties += f'<w:tabs><w:tab w:val="right" w:pos="{round(tab * 20)}"/></w:tabs>'
+    properties += '<w:spacing w:before="0" w:after="0"/><w:ind w:left="0" w:right="0"/>'
+    properties += f'<w:jc w:val="{align}"/>'
+    return f'<w:p><w:pPr>{properties}</w:pPr>{runs}</w:p>'
+
+
+def shape(left: float, top: float, width: float, height: float, content: str,
+          stroked: bool = False, anchor: str = 'middle', behind: bool = False, wrap: bool = False) -> str:
+    '''生成一个相对页面定位的矩形文本框，位置和尺寸的单位为磅'''
+    style = (
+        f'position:absolute;margin-left:{left:.2f}pt;margin-top:{top:.2f}pt;'
+        f'width:{width:.2f}pt;height:{height:.2f}pt;z-index:{-1 if behind else 1};'
+        'mso-position-horizontal-relative:page;mso-position-vertical-relative:page;'
+        f'v-text-anchor:{anchor}'
+    )
+    stroke = 'stroked="t" strokecolor="black" strokeweight="1.2pt"' if stroked else 'stroked="f"'
+    wrap_style = '' if wrap else ' style="mso-wrap-style:none"'
+    return (
+        f'<w:r><w:pict><v:rect style="{style}" filled="f" {stroke}>'
+        f'<v:textbox inset="0,0,0,0"{wrap_style}><w:txbxContent>{content}</w:txbxContent></v:textbox>'
+        '</v:rect></w:pict></w:r>'
+    )
+
+
+def field(label: str, name: str) -> str:
+    '''生成“标签：值”形式的字段，值带粗下划线'''
+    text = RichText(Style(font=FONT_NAME, size=15)).field(label, slot(name), Style(underline='thick'))
+    return paragraph(text.to_xml())
+
+
+def signatures(items: list[tuple[str, str]]) -> str:
+    '''生成一行签署信息，每一项由标签和插槽名前缀组成，姓名和日期带粗下划线'''
+    text = RichText(Style(font=FONT_NAME, size=13))
+    for label, name in items:
+        text.field(label, f'{slot(f'{name}_person')}  {slot(f'{name}_time')}', Style(underline='thick')).add('；')
+    return paragraph(text.to_xml(), align='center')
+
+
+@functools.cache
+def get_cover_skeleton() -> tuple[tuple[str, ...], tuple[str, ...]]:
+    '''生成首页骨架，返回静态片段与插槽名，二者交替拼接即为完整的 xml'''
+    model_top = INNER_TOP + 4.0 * CM_TO_POINT
+    number_top = model_top + 2.0 * CM_TO_POINT
+    sign_top = number_top + 5.0 * CM_TO_POINT
+    approve_top = sign_top + 1.2 * CM_TO_POINT
+    company_top = approve_top + 3.5 * CM_TO_POINT
+    date_top = company_top + 1.2 * CM_TO_POINT
+    field_left = INNER_LEFT + 3.5 * CM_TO_POINT
+    field_right = INNER_LEFT + INNER_WIDTH - 11.0 * CM_TO_POINT
+    field_width = 15 * CM_TO_POINT
+    line_height = 1.5 * CM_TO_POINT
+
+    shapes = [
+        # 外框及左上角的密级横幅
+        shape(
+            LEFT, TOP, WIDTH, HEIGHT,
+            paragraph(run(' 株机公司普通商密▲5年 \t工艺22', 15), tab=WIDTH - 0.25 * CM_TO_POINT),
+            stroked=True, anchor='top', behind=True, wrap=True,
+        ),
+        # 内框及“工艺文件”标题
+        shape(
+            INNER_LEFT, INNER_TOP, INNER_WIDTH, INNER_HEIGHT,
+            paragraph(run('工艺文件', 42, bold=True), align='center'),
+            stroked=True, anchor='top', behind=True, wrap=True,
+        ),
+        shape(field_left, model_top, field_width, line_height, field('产品型号：', 'project_name')),
+        shape(field_right, model_top, field_width, line_height, field('文件名称：', 'process_name')),
+        shape(field_left, number_top, field_width, line_height, field('文件编号：', 'document_number')),
+        shape(field_right, number_top, field_width, line_height, field('零部件图号：', 'component_part_number')),
+        shape(
+            INNER_LEFT + 4.0 * CM_TO_POINT, sign_top, INNER_WIDTH, line_height,
+            signatures([('编制 ：', 'compile'), ('校对：', 'proofread'), ('审核：', 'review')]),
+        ),
+        shape(
+            INNER_LEFT + 4.0 * CM_TO_POINT, approve_top, INNER_WIDTH, line_height,
+            signatures([('标准化：', 'standardization'), ('会签：', 'countersign'), ('批准：', 'ratify')]),
+        ),
+        shape(
+            INNER_LEFT + 8.0 * CM_TO_POINT, company_top, INNER_WIDTH, line_height,
+            paragraph(run('中车株洲电力机车有限公司城轨制造中心', 15, bold=True), align='center'),
+        ),
+        shape(
+            INNER_LEFT + 8.5 * CM_TO_POINT, date_top, INNER_WIDTH, line_height,
+            paragraph(run('2026年01月21日第1版共8页', 15), align='center'),
+        ),
+    ]
+    skeleton = PACKAGE_HEAD + f'<w:p>{''.join(shapes)}</w:p>' + PACKAGE_TAIL
+    pieces = skeleton.split(SLOT)
+    return tuple(pieces[0::2]), tuple(pieces[1::2])
+
+
+def get_cover_xml(item: dict) -> str:
+    '''将工序卡的字段填入首页骨架，返回完整的 Flat OPC xml'''
+    statics, names = get_cover_skeleton()
+    context = get_context(item)
+    result = [statics[0]]
+    for name, static in zip(names, statics[1:]):
+        result.append(escape(context[name]))
+        result.append(static)
+    return ''.join(result)
@@ -0,0 +1,106 @@
+'''基础资料 csv 的列式快照
+
+csv 是文本格式，每次读取都要从头解析，带有多行单元格时更慢。每个 csv 第一次读取时解析一次，
+按列保存为 Arrow IPC（Feather）格式的快照文件，之后从快照读取：文件以内存映射的方式打开，
+只读取需要的列（例如只读取物料编码），不需要解析文本，也不会把用不到的列读进内存。
+
+快照的文件名中带有 csv 内容的哈希值，csv 修改后哈希值变化，自然会重新生成新的快照，旧的快照随后删除。
+正在被映射的旧快照删除失败时（Windows）留到下一次再删。快照中所有列都按文本保存，空单元格为空值，
+与 pd.read_csv(dtype=str) 的结果一致，编码中的前导 0 等不会被当作数字改掉。
+'''
+import os
+import hashlib
+import tempfile
+import contextlib
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from generate.config import SNAPSHOT_PATH
+
+
+def get_snapshot_prefix(path: Path) -> str:
+    '''同一个 csv 的快照文件名前缀，带上路径的哈希值，不同目录中的同名文件互不影响'''
+    path = Path(path).resolve()
+    return f'{path.stem}-{hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:8]}'
+
+
+def get_snapshot_path(path: Path, digest: str) -> Path:
+    '''csv 内容为 digest 时的快照路径'''
+    return SNAPSHOT_PATH / f'{get_snapshot_prefix(path)}-{digest[:16]}.arrow'
+
+
+def remove_old_snapshots(path: Path, snapshot_path: Path):
+    '''删除同一个 csv 的旧快照，正在使用的文件删除失败时忽略'''
+    for old_path in SNAPSHOT_PATH.glob(f'{get_snapshot_prefix(path)}-*.arrow'):
+        if old_path != snapshot_path:
+            with contextlib.suppress(OSError):
+                old_path.unlink()
+
+
+def build_snapshot(path: Path, snapshot_path: Path):
+    '''解析 csv 并写入快照，先写临时文件再改名，其他进程不会读到写了一半的快照'''
+    frame = pd.read_csv(path, encoding='utf-8', dtype=str)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    SNAPSHOT_PATH.mkdir(parents=True, exist_ok=True)
+    file, temp_path = tempfile.mkstemp(suffix='.tmp', dir=SNAPSHOT_PATH)
+    os.close(file)
+    try:
+        # 不压缩，读取时才能直接映射
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        try:
+            os.replace(temp_path, snapshot_path)
+        except OSError:
+            # 其他进程已经生成了同样的快照并正在使用
+            if not snapshot_path.exists():
+                raise
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+    remove_old_snapshots(path, snapshot_path)
+
+
+def read_snapshot(path: Path, digest: str, columns: list[str] | None = None) -> pd.DataFrame:
+    '''从快照读取 csv 的数据，只读取 columns 中的列；digest 为 csv 内容的哈希值，对应的快照不存在时先生成'''
+    snapshot_path = get_snapshot_path(path, digest)
+    if not snapshot_path.exists():
+        build_snapshot(path, snapshot_path)
+    try:
+        table = feather.read_table(snapshot_path, columns=columns, memory_map=True)
+    except pa.ArrowInvalid:
+        # 快照损坏时重新生成
+        build_snapshot(path, snapshot_path)
+        table = feather.read_table(snapshot_path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+if __name__ == '__main__':
+    import time
+    from generate.template_cache import get_file_digest
+    for csv_path in sorted((Path(__file__).parent.parent / 'database').glob('*.csv')):
+        digest = get_file_digest(csv_path)
+        frame = read_snapshot(csv_path, digest)
+        assert frame.equals(pd.read_csv(csv_path, encoding='utf-8', dtype=str)), csv_path
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = Path(directory) / '物料基础资料.csv'
+        pd.DataFrame({
+            '物料编码': [f'{number:06d}' for number in range(200000)],
+            '物料名称': '螺栓',
+            '物料计数单位': '个',
+            '备注': '第一行\n第二行，带有"引号"',
+        }).to_csv(csv_path, index=False)
+        digest = get_file_digest(csv_path)
+        started = time.perf_counter()
+        pd.read_csv(csv_path, encoding='utf-8', dtype=str)
+        parsed = time.perf_counter()
+        read_snapshot(csv_path, digest)
+        built = time.perf_counter()
+        codes = read_snapshot(csv_path, digest, ['物料编码'])
+        print(f'20 万行：解析 csv {(parsed - started) * 1000:.0f} ms，生成快照 {(built - parsed) * 1000:.0f} ms，'
+              f'读取物料编码 {(time.perf_counter() - built) * 1000:.1f} ms')
+        assert list(codes.columns) == ['物料编码'] and codes['物料编码'].iloc[1] == '000001'
+        csv_path.write_text('物料编码,物料名称\nA,a\n', encoding='utf-8')
+        assert read_snapshot(csv_path, get_file_digest(csv_path))['物料名称'].tolist() == ['a']
+        assert len(list(SNAPSHOT_PATH.glob(f'{get_snapshot_prefix(csv_path)}-*.arrow'))) == 1
+        remove_old_snapshots(csv_path, SNAPSHOT_PATH / 'none')
+    print('快照检查通过')
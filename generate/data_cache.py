@@ -0,0 +1,165 @@
+'''进程内共用的数据缓存
+
+基础资料 csv、模板等数据在整个服务进程中只解析一份，所有会话共用，不再每个会话各自读取一遍，
+csv 从列式快照中读取（见 csv_snapshot）。
+文件按 (修改时间, 大小, 内容哈希) 判断是否变化：修改时间和大小没变时直接命中，变化时重新计算哈希，
+内容相同（例如只是被重新保存）仍然命中，内容不同才重新解析。写文件后调用 invalidate 立即失效，
+其他会话下一次读取时就会拿到新的数据。缓存的对象由所有会话共用，调用方不能修改，需要修改时先复制。
+'''
+import sys
+import functools
+import itertools
+import threading
+from pathlib import Path
+from typing import Any, Callable, Hashable, TypeVar
+import pandas as pd
+from generate.template_cache import get_file_digest
+from generate.csv_snapshot import read_snapshot
+
+T = TypeVar('T')
+# 估算容器占用的内存时最多逐个计算的元素数量
+SAMPLE_SIZE = 1000
+
+
+def get_memory_size(value: Any) -> int:
+    '''估算对象占用的内存（字节），DataFrame 按 pandas 的统计，容器递归累加，元素很多时按前一部分元素推算'''
+    seen = set()
+
+    def measure_items(items, count: int) -> int:
+        sample = list(itertools.islice(items, SAMPLE_SIZE))
+        total = sum(measure(item) for item in sample)
+        return total if count <= len(sample) else total * count // len(sample)
+
+    def measure(value: Any) -> int:
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+            usage = value.memory_usage(deep=True)
+            return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += measure_items(value.keys(), len(value)) + measure_items(value.values(), len(value))
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += measure_items(value, len(value))
+        elif hasattr(value, '__dict__') and not isinstance(value, type):
+            size += measure(vars(value))
+        return size
+
+    return measure(value)
+
+
+class CacheEntry:
+    def __init__(self, fingerprint: Hashable, value: Any):
+        self.fingerprint = fingerprint
+        self.value = value
+        self.size = get_memory_size(value)
+
+
+class DataCache:
+    '''按指纹缓存解析结果，指纹变化时重新加载'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: dict[tuple, CacheEntry] = {}
+        # 同一份数据只由一个线程加载，其他线程等待结果
+        self.load_locks: dict[tuple, threading.Lock] = {}
+        # 文件的 (修改时间, 大小) 对应的内容哈希，修改时间和大小没变时不重新计算
+        self.digests: dict[Path, tuple[tuple[int, int], str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, fingerprint: Hashable, loader: Callable[[], T]) -> T:
+        '''指纹与缓存中的一致时返回缓存的对象，否则调用 loader 加载'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self.hits += 1
+                return entry.value
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry.fingerprint == fingerprint:
+                    self.hits += 1
+                    return entry.value
+            value = loader()
+            entry = CacheEntry(fingerprint, value)
+            with self.lock:
+                self.entries[key] = entry
+                self.misses += 1
+            return value
+
+    def get_file_fingerprint(self, path: Path) -> str:
+        '''文件内容的哈希值，修改时间和大小没变时使用上次的结果'''
+        stat = path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.digests.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, get_file_digest(path))
+            with self.lock:
+                self.digests[path] = cached
+        return cached[1]
+
+    def get_file(self, path: Path, loader: Callable[[Path], T], name: str = '') -> T:
+        '''读取文件并缓存解析结果，同一文件的不同解析方式用 name 区分'''
+        path = Path(path).resolve()
+        return self.get((str(path), name), self.get_file_fingerprint(path), lambda: loader(path))
+
+    def invalidate(self, path: Path | None = None):
+        '''写文件后调用，使该文件的所有缓存失效；不传 path 时清空所有缓存'''
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+                self.digests.clear()
+                return
+            path = Path(path).resolve()
+            for key in [key for key in self.entries if key[0] == str(path)]:
+                del self.entries[key]
+            self.digests.pop(path, None)
+
+    def stats(self) -> dict:
+        '''缓存的条目数、占用的内存和命中率'''
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'memory': sum(entry.size for entry in self.entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else 0.0,
+                'items': {
+                    f'{Path(key[0]).name}{f"[{key[1]}]" if key[1] else ""}': entry.size
+                    for key, entry in self.entries.items()
+                },
+            }
+
+
+@functools.cache
+def get_data_cache() -> DataCache:
+    '''进程内共用的数据缓存'''
+    return DataCache()
+
+
+def read_csv(path: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    '''读取基础资料 csv，所有会话共用同一份；数据从列式快照中读取，给出 columns 时只读取这些列，所有列都是文本'''
+    cache = get_data_cache()
+    return cache.get_file(
+        path, lambda path: read_snapshot(path, cache.get_file_fingerprint(path), columns), ','.join(columns or [])
+    )
+
+
+if __name__ == '__main__':
+    import time
+    database_path = Path(__file__).parent.parent / 'database'
+    for csv_path in sorted(database_path.glob('*.csv')):
+        started = time.perf_counter()
+        read_csv(csv_path)
+        loaded = time.perf_counter()
+        for _ in range(1000):
+            read_csv(csv_path)
+        print(f'{csv_path.name}：首次 {(loaded - started) * 1000:.2f} ms，'
+              f'命中 {(time.perf_counter() - loaded) * 1000 / 1000:.3f} ms/次')
+    stats = get_data_cache().stats()
+    print(f'{stats["entries"]} 个条目，{stats["memory"] / 1024:.1f} KB，命中率 {stats["hit_ratio"]:.1%}')
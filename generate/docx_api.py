@@ -0,0 +1,271 @@
+import re
+import copy
+from pathlib import Path
+from docx.oxml.ns import qn
+from generate.context import format_value, get_context
+from generate.rich_text import RichText
+from generate.template_cache import get_compiled_template
+from generate.reference_index import get_reference_index
+from generate.layout import FONT_SIZE, TWIPS_PER_POINT, measure_row, paginate
+
+root_path = Path(__file__).parent.parent
+template_path = root_path / 'template' / '工序卡模板.docx'
+
+# 工序控制点在工序流程图页中的图例符号
+FLAG_SYMBOLS = {
+    '是否关键工步': '▲',
+    '是否特殊过程': '◆',
+    '是否八防工序': '★',
+    '是否五防工序': '●',
+    '是否关键质量控制点': '■',
+}
+# 单元格左右边距之和（磅），计算折行时从单元格宽度中扣除
+CELL_PADDING = 10.8
+PAGE_COUNT_PATTERN = re.compile(r'共(\d+)页')
+
+
+def get_workstep_rows(item: dict) -> list[list[str]]:
+    '''按作业顺序生成组装工序卡中工步表格的行内容'''
+    action_names = get_reference_index('作业动作').names
+    rows = []
+    worksteps = sorted(item.get('工步', []), key=lambda ch: ch['作业顺序'] or 0)
+    for workstep in worksteps:
+        actions = []
+        for action in workstep['动作']:
+            text = action_names.get(action['作业动作编码'], action['作业动作编码'])
+            if action['工艺参数要求']:
+                text += f'：{action['工艺参数要求']}'
+            actions.append(text)
+        flags = ''.join(symbol for key, symbol in FLAG_SYMBOLS.items() if workstep.get(key))
+        rows.append([
+            format_value(workstep['作业顺序']),
+            format_value(workstep['工步名称']),
+            format_value(workstep['注意内容']),
+            '\n'.join(actions),
+            flags,
+            format_value(workstep['资质要求']),
+        ])
+    return rows
+
+
+def get_material_rows(item: dict) -> list[list[str]]:
+    '''生成工位作业内容页中物料与工装工具表格的行内容'''
+    material_names = get_reference_index('物料').names
+    equipment_names = get_reference_index('工艺装备').names
+    materials = [material_names.get(code, code) for code in item.get('物料清单', [])]
+    equipments = []
+    for workstep in item.get('工步', []):
+        for code in workstep['工艺装备']:
+            name = equipment_names.get(code, code)
+            if name not in equipments:
+                equipments.append(name)
+    rows = []
+    for i in range(max(len(materials), len(equipments))):
+        rows.append([
+            str(i + 1),
+            materials[i] if i < len(materials) else '',
+            equipments[i] if i < len(equipments) else '',
+            '',
+        ])
+    return rows
+
+
+def get_part_rows(item: dict) -> list[list[str]]:
+    '''生成工序物料卡中组成零部件的条目，每个条目占半行'''
+    material_names = get_reference_index('物料').names
+    rows = []
+    for i, code in enumerate(item.get('物料清单', [])):
+        rows.append([str(i + 1), code, material_names.get(code, code), '', '', ''])
+    return rows
+
+
+def set_cell_text(tc, text: str | RichText):
+    '''替换单元格文字，沿用第一个段落与文字的格式'''
+    paragraphs = tc.findall(qn('w:p'))
+    paragraph = paragraphs[0]
+    for other in paragraphs[1:]:
+        tc.remove(other)
+    run_pr = None
+    first_run = paragraph.find(qn('w:r'))
+    if first_run is not None and first_run.find(qn('w:rPr')) is not None:
+        run_pr = first_run.find(qn('w:rPr'))
+    elif paragraph.find(qn('w:pPr') + '/' + qn('w:rPr')) is not None:
+        run_pr = paragraph.find(qn('w:pPr') + '/' + qn('w:rPr'))
+    for child in list(paragraph):
+        if child.tag != qn('w:pPr'):
+            paragraph.remove(child)
+    if isinstance(text, str):
+        text = RichText().add(text)
+    text.fill_paragraph(paragraph, run_pr)
+
+
+def fill_rows(tbl, rows: list[list[str | RichText]], start: int, stop: int | None = None):
+    '''将内容依次写入表格 start 到 stop 之间的空白行，行数不够时复制最后一个空白行'''
+    blank_rows = tbl.findall(qn('w:tr'))[start:stop]
+    for _ in range(len(rows) - len(blank_rows)):
+        new_row = copy.deepcopy(blank_rows[-1])
+        blank_rows[-1].addnext(new_row)
+        blank_rows.append(new_row)
+    for tr, values in zip(blank_rows, rows):
+        for tc, value in zip(tr.findall(qn('w:tc')), values):
+            set_cell_text(tc, value)
+
+
+def get_tables(root) -> list:
+    '''获取正文中的顶层表格，每个顶层表格对应工序卡中的一页'''
+    return root.find(qn('w:body')).findall(qn('w:tbl'))
+
+
+def get_row_height(tr) -> float | None:
+    '''模板中设置的行高（磅），没有设置时返回 None'''
+    height = tr.find(qn('w:trPr') + '/' + qn('w:trHeight'))
+    return None if height is None else int(height.get(qn('w:val'))) / TWIPS_PER_POINT
+
+
+def set_row_height(tr, height: float):
+    '''设置最小行高（磅）'''
+    tr_pr = tr.find(qn('w:trPr'))
+    if tr_pr is None:
+        tr_pr = tr.makeelement(qn('w:trPr'), {})
+        tr.insert(0, tr_pr)
+    tr_height = tr_pr.find(qn('w:trHeight'))
+    if tr_height is None:
+        tr_height = tr_pr.makeelement(qn('w:trHeight'), {})
+        tr_pr.insert(0, tr_height)
+    tr_height.set(qn('w:val'), str(round(height * TWIPS_PER_POINT)))
+    tr_height.attrib.pop(qn('w:hRule'), None)
+
+
+def get_row_metrics(tr) -> tuple[list[float], float]:
+    '''模板空白行中各单元格可用的文字宽度和行距（磅）'''
+    widths = []
+    for tc in tr.findall(qn('w:tc')):
+        width = int(tc.find(qn('w:tcPr') + '/' + qn('w:tcW')).get(qn('w:w'))) / TWIPS_PER_POINT
+        widths.append(width - CELL_PADDING)
+    spacing = tr.find('.//' + qn('w:spacing'))
+    if spacing is not None and spacing.get(qn('w:lineRule')) == 'exact':
+        line_height = int(spacing.get(qn('w:line'))) / TWIPS_PER_POINT
+    else:
+        line_height = FONT_SIZE * 1.3
+    return widths, line_height
+
+
+def add_pages(page_tbl, count: int) -> list:
+    '''在页面表格之后复制 count 个续页，连同表头和页脚，返回包括原页面在内的所有页面表格'''
+    pages = [page_tbl]
+    # 模板中页面表格之后的空段落使下一个表格从新的一页开始，续页也照此排列
+    separator = page_tbl.getnext()
+    for _ in range(count):
+        new_page = copy.deepcopy(page_tbl)
+        anchor = pages[-1]
+        if separator is not None and separator.tag == qn('w:p'):
+            new_separator = copy.deepcopy(separator)
+            anchor.addnext(new_separator)
+            anchor = new_separator
+        anchor.addnext(new_page)
+        pages.append(new_page)
+    return pages
+
+
+def fill_pages(page_tbl, rows: list[list[str]], start: int, stop: int | None = None, nested: bool = False,
+               per_page: int = 1) -> int:
+    '''将内容依次写入页面中表格 start 到 stop 之间的空白行，超出一页的部分放到续页，返回增加的页数
+
+    nested 表示内容表格嵌套在页面表格中；per_page 个条目合并为一行（工序物料卡左右两栏）时，
+    按条目计算高度，每页可容纳的高度相应放大。
+    '''
+    tbl = page_tbl.find('.//' + qn('w:tbl')) if nested else page_tbl
+    blank_rows = tbl.findall(qn('w:tr'))[start:stop]
+    widths, line_height = get_row_metrics(blank_rows[0])
+    widths = widths[:len(widths) // per_page]
+    capacity = sum(max(get_row_height(tr) or 0.0, line_height) for tr in blank_rows)
+    # 设置了行高的区域（工步表格）按内容重新分配行高，最后一行占满剩余高度，页脚保持在页面底部
+    stretch = get_row_height(blank_rows[-1]) is not None
+    heights = [measure_row(row, widths, line_height, line_height) for row in rows]
+    pages = paginate(heights, capacity * per_page)
+    for page_table, page in zip(add_pages(page_tbl, len(pages) - 1), pages):
+        tbl = page_table.find('.//' + qn('w:tbl')) if nested else page_table
+        page_rows = [rows[index] for index in page]
+        if per_page > 1:
+            half = max(len(blank_rows), -(-len(page_rows) // per_page))
+            columns = [page_rows[index * half:(index + 1) * half] for index in range(per_page)]
+            page_rows = [
+                sum((column[i] if i < len(column) else [''] * len(rows[0]) for column in columns), [])
+                for i in range(len(columns[0]))
+            ]
+            fill_rows(tbl, page_rows, start, stop)
+            continue
+        fill_rows(tbl, page_rows, start, stop)
+        if page_rows and stretch:
+            filled = tbl.findall(qn('w:tr'))[start:start + max(len(page_rows), len(blank_rows))]
+            used = 0.0
+            for tr, index in zip(filled[:-1], page):
+                set_row_height(tr, heights[index])
+                used += heights[index]
+            for tr in filled[len(page_rows):-1]:
+                used += get_row_height(tr) or line_height
+            set_row_height(filled[-1], max(capacity - used, line_height))
+    return len(pages) - 1
+
+
+def fill_workstep_table(page_tbl, item: dict) -> int:
+    '''填写组装工序卡中的工步表格，返回增加的续页数'''
+    # 第 3 行为表头，第 4、5 行为空白工步行，其余为页脚
+    return fill_pages(page_tbl, get_workstep_rows(item), 3, 5)
+
+
+def fill_material_table(page_tbl, item: dict) -> int:
+    '''填写工位作业内容页中的物料与工装工具表格，返回增加的续页数'''
+    return fill_pages(page_tbl, get_material_rows(item), 1, nested=True)
+
+
+def fill_part_table(page_tbl, item: dict) -> int:
+    '''填写工序物料卡中的组成零部件表格，条目先填左半边再填右半边，返回增加的续页数'''
+    return fill_pages(page_tbl, get_part_rows(item), 2, nested=True, per_page=2)
+
+
+def update_page_count(root, extra: int):
+    '''续页增加后更新“共 N 页”，页数可能与前后的文字分在不同的 run 中'''
+    if not extra:
+        return
+    # 只检查含有“共”字的段落
+    paragraphs = {next(t.iterancestors(qn('w:p'))) for t in root.iter(qn('w:t')) if t.text and '共' in t.text}
+    for p in paragraphs:
+        texts = list(p.iter(qn('w:t')))
+        text = ''.join(t.text or '' for t in texts)
+        # 从后往前替换，前面匹配的位置不受影响
+        for match in reversed(list(PAGE_COUNT_PATTERN.finditer(text))):
+            start, end = match.span(1)
+            count = str(int(match.group(1)) + extra)
+            offset = 0
+            for t in texts:
+                value = t.text or ''
+                low, high = max(start, offset), min(end, offset + len(value))
+                if low < high:
+                    t.text = value[:low - offset] + (count if low == start else '') + value[high - offset:]
+                offset += len(value)
+
+
+def create_document_bytes(item: dict) -> bytes:
+    '''生成工序卡并直接返回文档的字节流，模板的解析结果在进程内缓存'''
+    compiled = get_compiled_template(template_path)
+    root = compiled.render(get_context(item))
+    # 续页插入后顶层表格的序号会变化，先取出各页面表格
+    tables = get_tables(root)
+    extra = fill_workstep_table(tables[3], item)
+    extra += fill_material_table(tables[1], item)
+    extra += fill_part_table(tables[5], item)
+    update_page_count(root, extra)
+    return compiled.save(root)
+
+
+def create_document(file_path: Path, item: dict):
+    '''不依赖 Word，直接基于 docx 模板生成工序卡'''
+    file_path.write_bytes(create_document_bytes(item))
+
+
+if __name__ == '__main__':
+    import json
+    (root_path / 'source').mkdir(parents=True, exist_ok=True)
+    with open(root_path / 'database' / '工序卡模板.json', mode='r', encoding='utf8') as file:
+        create_document(file_path=root_path / 'source' / 'test.docx', item=json.loads(file.read())[-1])
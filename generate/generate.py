@@ -1,80 +1,243 @@
 import datetime
 import streamlit as st
 import pandas as pd
-import json
 from pathlib import Path
-from docxtpl import DocxTemplate
-from generate.word_api import create_document
+from generate.worker_pool import RenderPool
+from generate.output_cache import OutputCache, submit
+from generate.config import ARTIFACT_PATH, ARTIFACT_TTL, RENDER_SERVICE_URLS
+from generate.service import RenderClient
+from generate.artifact_store import Artifact, ArtifactStore
+from generate.batch import BatchResult, ERROR_FILE_NAME, get_card_name, render_batch
+from generate.pdf_converter import ConversionError, PdfConverter
+from generate.jobs import Job, JobQueue, JobQueueFull, Report
+from generate.thumbnail import PLACEHOLDER_URL, get_thumbnail_renderer, get_thumbnail_urls
+from generate.html_preview import render_preview
+from generate.template_store import get_template_store
+from generate.data_cache import get_data_cache
 
 title = '工序卡生成'
 st.set_page_config(page_title=title, layout='wide')
 st.title(title)
 
-path = Path(__file__).parent.parent / 'database' / '工序卡模板.json'
 template_path = Path(__file__).parent.parent / 'template' / '工序卡模板.docx'
-source_path = Path(__file__).parent.parent / 'source'
-
-def make_main_run(item: dict):
-    # 绘图的主逻辑'''
-    temp_name = f'{datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.docx'
-    temp_path = source_path / temp_name
-    create_document(temp_path, item)
-
-    # 检查并删除多余的文档
-    reuqest_time = datetime.datetime.now() - datetime.timedelta(minutes=10)
-    for item_file in source_path.iterdir():
-        if not item_file.is_file():
-            continue
-        if item_file.suffix.lower() != '.docx':
-            continue
-        if item_file.name[0: 2] == "~$":
-            continue
-        file_time = datetime.datetime.strptime(item_file.stem, '%Y-%m-%d-%H-%M-%S')
-        if file_time < reuqest_time:
-            item_file.unlink()
-    # 返回文件的字节流
-    with open(temp_path, 'rb') as _file:
-        _bytes = _file.read()
-    return temp_name, _bytes
-
-
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_template_data() -> dict:
-    '''获取本地模板配置文件中的数据'''
-    with open(path, mode='r', encoding='utf8') as file:
-        return json.loads(file.read())
 
+@st.cache_resource
+def get_render_pool() -> RenderPool | RenderClient:
+    '''所有会话共用的渲染进程池，配置了渲染服务时改为调用渲染服务'''
+    if RENDER_SERVICE_URLS:
+        return RenderClient(RENDER_SERVICE_URLS)
+    return RenderPool().start()
 
-@st.dialog('生成补充信息', width='large', dismissible=False)
-def generate_page(index: int):
-    '''生成工序卡需要补充信息的页面'''
-    temp_config = get_template_data()[index]
-    st.text('这里填写需要你补充的信息')
+
+@st.cache_resource
+def get_output_cache() -> OutputCache | None:
+    '''所有会话共用的生成结果缓存，使用渲染服务时由服务负责缓存'''
+    if RENDER_SERVICE_URLS:
+        return None
+    return OutputCache()
+
+
+@st.cache_resource
+def get_artifact_store() -> ArtifactStore:
+    '''所有会话共用的生成结果目录，过期的结果由后台线程清理'''
+    return ArtifactStore()
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    '''所有会话共用的后台生成任务队列'''
+    return JobQueue()
+
+
+@st.cache_resource
+def get_pdf_converter() -> PdfConverter:
+    '''所有会话共用的 LibreOffice 进程池，用于生成 PDF 预览'''
+    return PdfConverter()
+
+
+def make_main_run(item: dict) -> str:
+    # 绘图的主逻辑，提交到后台任务队列后立即返回任务编号'''
+    pool, cache, store, converter = get_render_pool(), get_output_cache(), get_artifact_store(), get_pdf_converter()
+
+    def run(report: Report) -> Artifact:
+        docx_bytes = submit(pool, item, cache).result()
+        artifact = store.save(docx_bytes, '.docx')
+        report(0, 1, '正在转换 PDF 预览')
+        # PDF 与 docx 保存在一起，同时过期；转换失败不影响 docx 的下载
+        if converter.is_available():
+            pdf_path = store.get_companion_path(artifact, '.pdf')
+            try:
+                seconds = converter.convert(artifact.path, pdf_path)
+            except ConversionError as error:
+                report(1, 1, get_card_name(item), pdf_error=str(error))
+            else:
+                store.add_companion(artifact, '.pdf')
+                report(1, 1, get_card_name(item), pdf=pdf_path, pdf_seconds=seconds)
+        return artifact
+
+    return add_job(get_job_queue().submit(get_card_name(item), run))
+
+
+def make_batch_run(items: list[dict], supplement: dict) -> str:
+    '''批量生成的主逻辑，所有工序卡打包到一个 zip 中，返回任务编号'''
+    pool, cache, store = get_render_pool(), get_output_cache(), get_artifact_store()
+
+    def run(report: Report) -> Artifact:
+        def on_progress(done: int, total: int, result: BatchResult):
+            error = f'{result.name} 生成失败：{result.summary}' if result.error else None
+            report(done, total, result.name, error)
+
+        with store.create('.zip') as (artifact, temp_path):
+            render_batch(pool, items, supplement, temp_path, on_progress, cache)
+        return artifact
+
+    return add_job(get_job_queue().submit(f'批量生成 {len(items)} 份工序卡', run, total=len(items)))
+
+
+def add_job(job_id: str) -> str:
+    '''记录当前会话提交的任务，页面重新运行后仍然可以查看'''
+    st.session_state.setdefault('jobs', []).append(job_id)
+    return job_id
+
+
+def show_job_status(job: Job, key: str):
+    '''显示一个任务的进度和结果'''
+    if job.status == 'queued':
+        st.progress(0.0, text='排队中')
+    elif job.status == 'running':
+        st.progress(job.progress, text=f'已完成 {job.done}/{job.total}：{job.message}')
+    for error in job.errors:
+        st.error(error)
+    if job.status == 'failed':
+        st.error(f'生成失败：{job.error}')
+        if job.traceback:
+            with st.expander('错误详情'):
+                st.code(job.traceback, language=None)
+    elif job.status == 'done' and not job.artifact.path.exists():
+        # 生成结果超过保存时间后会被后台删除，任务还在列表中时不再提供下载
+        st.info('生成结果已过期删除，需要时请重新生成')
+    elif job.status == 'done':
+        if job.errors:
+            st.warning(f'{job.total - len(job.errors)} 份生成成功，{len(job.errors)} 份生成失败，失败原因见压缩包中的 {ERROR_FILE_NAME}')
+        artifact = job.artifact
+        pdf_path = job.details.get('pdf')
+        if pdf_path is not None and pdf_path.exists():
+            st.download_button(
+                label='下载 PDF',
+                data=pdf_path.read_bytes,
+                file_name=pdf_path.name,
+                mime='application/pdf',
+                icon=':material/picture_as_pdf:',
+                on_click='ignore',
+                key=f'{key}_pdf_{job.id}',
+            )
+        st.download_button(
+            label='下载压缩包' if artifact.path.suffix == '.zip' else '下载绘制结果',
+            data=artifact.path.read_bytes,
+            file_name=artifact.name,
+            mime='application/zip' if artifact.path.suffix == '.zip' else 'application/docx',
+            icon=':material/download:',
+            on_click='ignore',
+            key=f'{key}_{job.id}',
+        )
+        if 'pdf_error' in job.details:
+            st.warning(f'PDF 预览生成失败：{job.details['pdf_error']}')
+        # PDF 预览只在对话框中显示，页面下方的任务列表只提供下载
+        if key == 'dialog' and pdf_path is not None and pdf_path.exists():
+            st.caption(f'PDF 转换耗时 {job.details['pdf_seconds']:.2f} 秒')
+            if not get_pdf_converter().is_resident():
+                st.caption(get_pdf_converter().get_mode())
+            st.pdf(pdf_path, height=600)
+
+
+@st.fragment(run_every=1)
+def poll_job(job_id: str):
+    '''在对话框中轮询未完成的任务，完成后重新运行页面，以静态的方式显示结果'''
+    job = get_job_queue().get(job_id)
+    if job is None or job.is_finished:
+        st.rerun()
+    show_job_status(job, 'dialog')
+
+
+@st.dialog('生成结果', width='large', dismissible=False)
+def job_page(job_id: str):
+    '''显示对话框中提交的任务，页面重新运行后仍然保持打开，直到点击返回'''
+    job = get_job_queue().get(job_id)
+    st.caption('关闭对话框不会中断生成，可以在页面下方的生成任务中继续查看')
+    if job is None:
+        st.warning('任务已经过期')
+    elif job.is_finished:
+        show_job_status(job, 'dialog')
+    else:
+        poll_job(job_id)
+    if st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_job'):
+        st.session_state.pop('dialog_job', None)
+        st.rerun()
+
+
+@st.fragment(run_every=2)
+def show_jobs():
+    '''轮询当前会话提交的所有任务'''
+    jobs = [get_job_queue().get(job_id) for job_id in st.session_state.get('jobs', [])]
+    jobs = [job for job in jobs if job is not None]
+    if not jobs:
+        return
+    metrics = get_job_queue().metrics()
+    st.markdown('##### 生成任务')
+    st.caption(f'排队中 {metrics['depth']} 个，执行中 {metrics['running']} 个，最近平均排队 {metrics['wait_avg']:.1f} 秒')
+    for job in reversed(jobs):
+        with st.expander(job.title, expanded=not job.is_finished):
+            show_job_status(job, 'list')
+
+
+@st.fragment(run_every=1)
+def wait_thumbnails():
+    '''缩略图在后台绘制，全部绘制完成后重新运行页面显示出来'''
+    if not get_thumbnail_renderer().has_pending():
+        st.rerun()
+
+
+def get_template_data() -> list[dict]:
+    '''获取模板数据库中的所有模板，所有会话共用同一份，不能直接修改'''
+    return list(get_template_store().get_cached()[0].values())
+
+
+def input_supplement() -> dict:
+    '''填写生成工序卡需要补充的信息，单个生成和批量生成共用'''
+    supplement = {}
     with st.container(horizontal=True):
-        temp_config['项目名称'] = st.text_input('项目名称')
-        temp_config['项目编码'] = st.text_input('项目编码')
-        temp_config['密级/保密期限'] = st.selectbox('密级/保密期限', options=['普通商密', '工作秘密'])
+        supplement['项目名称'] = st.text_input('项目名称')
+        supplement['项目编码'] = st.text_input('项目编码')
+        supplement['密级/保密期限'] = st.selectbox('密级/保密期限', options=['普通商密', '工作秘密'])
     with st.container(horizontal=True):
-        temp_config['文件编号'] = st.text_input('文件编号')
-        temp_config['零部件图号'] = st.text_input('零部件图号')
+        supplement['文件编号'] = st.text_input('文件编号')
+        supplement['零部件图号'] = st.text_input('零部件图号')
     with st.container(horizontal=True):
-        temp_config['编制'] = st.text_input('编制')
-        temp_config['编制日期'] = st.date_input('编制日期', datetime.datetime.now())
-        temp_config['校对'] = st.text_input('校对')
-        temp_config['校对日期'] = st.date_input('校对日期', datetime.datetime.now())
+        supplement['编制'] = st.text_input('编制')
+        supplement['编制日期'] = st.date_input('编制日期', datetime.datetime.now())
+        supplement['校对'] = st.text_input('校对')
+        supplement['校对日期'] = st.date_input('校对日期', datetime.datetime.now())
     with st.container(horizontal=True):
-        temp_config['审核'] = st.text_input('审核')
-        temp_config['审核日期'] = st.date_input('审核日期', datetime.datetime.now())
-        temp_config['标准化'] = st.text_input('标准化')
-        temp_config['标准化日期'] = st.date_input('标准化日期', datetime.datetime.now())
+        supplement['审核'] = st.text_input('审核')
+        supplement['审核日期'] = st.date_input('审核日期', datetime.datetime.now())
+        supplement['标准化'] = st.text_input('标准化')
+        supplement['标准化日期'] = st.date_input('标准化日期', datetime.datetime.now())
     with st.container(horizontal=True):
-        temp_config['会签'] = st.text_input('会签')
-        temp_config['会签日期'] = st.date_input('会签日期', datetime.datetime.now())
-        temp_config['批准'] = st.text_input('批准')
-        temp_config['批准日期'] = st.date_input('批准日期', datetime.datetime.now())
+        supplement['会签'] = st.text_input('会签')
+        supplement['会签日期'] = st.date_input('会签日期', datetime.datetime.now())
+        supplement['批准'] = st.text_input('批准')
+        supplement['批准日期'] = st.date_input('批准日期', datetime.datetime.now())
     with st.container(horizontal=True):
-        temp_config['失效日期'] = st.date_input('失效日期', datetime.datetime.now() + datetime.timedelta(weeks=48))
-        temp_config['文件版本'] = st.text_input('文件版本')
+        supplement['失效日期'] = st.date_input('失效日期', datetime.datetime.now() + datetime.timedelta(weeks=48))
+        supplement['文件版本'] = st.text_input('文件版本')
+    return supplement
+
+
+@st.dialog('生成补充信息', width='large', dismissible=False)
+def generate_page(index: int):
+    '''生成工序卡需要补充信息的页面'''
+    st.text('这里填写需要你补充的信息')
+    temp_config = get_template_data()[index] | input_supplement()
 
     event = st.data_editor(
         pd.DataFrame(
@@ -93,25 +256,49 @@ def generate_page(index: int):
         ),
         hide_index=True
     )
-    st.info('对应的生成记录会在后台保存10分钟，找回请检查后台文件中的source文件夹')
+    with st.expander('内容预览', expanded=True, icon=':material/preview:'):
+        st.html(render_preview(temp_config))
+    st.info(f'对应的生成记录会在后台保存{ARTIFACT_TTL / 60:g}分钟，找回请检查后台文件中的{ARTIFACT_PATH.name}文件夹')
     temp_empty = st.empty()
     with temp_empty:
         with st.container(horizontal=True):
             submit_label = st.button('开始生成', icon=':material/send:', shortcut='enter')
             cancel_label = st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_0')
     if submit_label:
-        with st.spinner("正在生成文档中", show_time=True):
-            temp_name, docx_bytes = make_main_run(temp_config)
         temp_empty.empty()
+        try:
+            st.session_state['dialog_job'] = make_main_run(temp_config)
+        except JobQueueFull as error:
+            st.error(str(error))
+            st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_1')
+        else:
+            st.rerun()
+    elif cancel_label:
+        st.rerun()
+
+
+@st.dialog('批量生成补充信息', width='large', dismissible=False)
+def batch_generate_page(indexes: list[int]):
+    '''批量生成工序卡的页面，所有选中的模板共用同一份补充信息'''
+    local_data = get_template_data()
+    items = [local_data[index] for index in indexes]
+    st.text(f'已选择 {len(items)} 个模板，以下补充信息会用于所有选中的模板')
+    supplement = input_supplement()
+    st.info(f'对应的生成记录会在后台保存{ARTIFACT_TTL / 60:g}分钟，找回请检查后台文件中的{ARTIFACT_PATH.name}文件夹')
+    temp_empty = st.empty()
+    with temp_empty:
         with st.container(horizontal=True):
-            cancel_label = st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_1')
-            st.download_button(
-                label='下载绘制结果',
-                data=docx_bytes,
-                file_name=temp_name,
-                mime='application/docx',
-                icon=':material/download:',
-            )
+            submit_label = st.button('开始生成', icon=':material/send:', shortcut='enter')
+            cancel_label = st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_0')
+    if submit_label:
+        temp_empty.empty()
+        try:
+            st.session_state['dialog_job'] = make_batch_run(items, supplement)
+        except JobQueueFull as error:
+            st.error(str(error))
+            st.button('返回', icon=':material/close:', shortcut='esc', key='cancel_1')
+        else:
+            st.rerun()
     elif cancel_label:
         st.rerun()
 
@@ -120,20 +307,36 @@ st.markdown('##### 选择你要生成工序卡的对应模板')
 with st.container(horizontal=True):
     generate_label = st.button('生成', icon=':material/build:', shortcut='alt+g')
     refresh_label = st.button('刷新', icon=':material/refresh:', shortcut='alt+f')
-local_data = get_template_data()
+local_items, versions = get_template_store().get_cached()
+local_data = list(local_items.values())
+thumbnails = get_thumbnail_urls(local_items, versions)
 temp_data = pd.DataFrame({
     '模板编码': [item['模板编码'] for item in local_data],  # pyright: ignore[reportArgumentType]
     '工序编码': [item['工序编码'] for item in local_data],  # pyright: ignore[reportArgumentType]
     '工序名称': [item['工序名称'] for item in local_data],  # pyright: ignore[reportArgumentType]
     '适用车型': [item['适用车型'] for item in local_data],  # pyright: ignore[reportArgumentType]
     '专业分类': [item['专业分类'] for item in local_data],  # pyright: ignore[reportArgumentType]
+    '预览': thumbnails,
 })
-event = st.dataframe(temp_data, hide_index=True, on_select='rerun', selection_mode='single-row')
+event = st.dataframe(
+    temp_data, hide_index=True, on_select='rerun', selection_mode='multi-row',
+    column_config={'预览': st.column_config.ImageColumn('预览', help='工序卡版式的缩略图')},
+)
 
 if refresh_label:
-    get_template_data.clear()
+    # 模板修改后读取时会自动重新加载，这里强制重新读取一次
+    get_data_cache().invalidate()
+    st.rerun()
 elif generate_label:
     if len(event.selection.rows) == 0:  # type: ignore
         st.toast(f'未选择任何行无法修改', icon='🚨')
-    else:
+    elif len(event.selection.rows) == 1:  # type: ignore
         generate_page(event.selection.rows[0])  # type: ignore
+    else:
+        batch_generate_page(event.selection.rows)  # type: ignore
+elif 'dialog_job' in st.session_state:
+    job_page(st.session_state['dialog_job'])
+elif PLACEHOLDER_URL in thumbnails:
+    wait_thumbnails()
+
+show_jobs()
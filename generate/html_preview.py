@@ -0,0 +1,61 @@
+'''工序卡内容的 HTML 预览
+
+在正式生成 Word 之前，用 Jinja 模板把工序卡的封面字段、按作业顺序排列的工步表格（控制点、动作）
+和物料清单渲染成 HTML，在对话框中通过 st.html 显示。表格内容与 docx 后端使用同一套行数据，
+模板只编译一次，修改补充信息时可以即时看到结果。
+'''
+import time
+import functools
+from pathlib import Path
+import jinja2
+from generate.context import format_value, get_context
+from generate.docx_api import FLAG_SYMBOLS, get_material_rows, get_workstep_rows
+
+template_path = Path(__file__).parent.parent / 'template' / '工序卡预览.html.j2'
+
+# 封面签署栏：标题、人员字段、日期字段
+SIGNATURES = [
+    ('编制', 'compile_person', 'compile_time'),
+    ('校对', 'proofread_person', 'proofread_time'),
+    ('审核', 'review_person', 'review_time'),
+    ('标准化', 'standardization_person', 'standardization_time'),
+    ('会签', 'countersign_person', 'countersign_time'),
+    ('批准', 'ratify_person', 'ratify_time'),
+]
+
+
+@functools.cache
+def get_environment() -> jinja2.Environment:
+    '''模板环境，编译后的模板缓存在环境中，模板文件修改后自动重新编译'''
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(template_path.parent, encoding='utf-8'),
+        autoescape=True,
+        auto_reload=True,
+        undefined=jinja2.StrictUndefined,
+    )
+
+
+def render_preview(item: dict) -> str:
+    '''渲染工序卡内容的 HTML'''
+    cover = get_context(item)
+    return get_environment().get_template(template_path.name).render(
+        cover=cover,
+        version=format_value(item.get('文件版本')),
+        expiry=format_value(item.get('失效日期')),
+        signatures=[(label, cover[person], cover[date]) for label, person, date in SIGNATURES],
+        worksteps=get_workstep_rows(item),
+        legend=[(label.removeprefix('是否'), symbol) for label, symbol in FLAG_SYMBOLS.items()],
+        materials=get_material_rows(item),
+    )
+
+
+if __name__ == '__main__':
+    import json
+    with open(Path(__file__).parent.parent / 'database' / '工序卡模板.json', encoding='utf-8') as file:
+        items = json.load(file)
+    for item in items:
+        big = dict(item, 工步=[dict(workstep, 作业顺序=index) for index in range(300) for workstep in item['工步'][:1]])
+        for name, data in (('原始', item), ('300 个工步', big)):
+            started = time.perf_counter()
+            html = render_preview(data)
+            print(f'{item['模板编码']} {name}：{len(html)} 字符，{(time.perf_counter() - started) * 1000:.1f} ms')
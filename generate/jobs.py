@@ -0,0 +1,143 @@
+'''后台生成任务
+
+页面提交生成任务后立即得到任务编号，任务由固定数量的后台线程执行，页面只轮询任务的状态、
+进度和结果，渲染的耗时不再阻塞页面的脚本线程。任务保存在进程内，页面重新运行后仍然可以查询，
+完成的任务保留一段时间后删除。
+'''
+import time
+import uuid
+import queue
+import threading
+import traceback
+import dataclasses
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+from generate.artifact_store import Artifact
+from generate.config import JOB_WORKERS, JOB_QUEUE_SIZE, ARTIFACT_TTL
+
+# 计算等待时间统计时使用的最近任务数量
+WAIT_SAMPLES = 100
+
+
+class JobQueueFull(RuntimeError):
+    '''排队的任务过多'''
+
+
+@dataclass
+class Job:
+    '''一个生成任务的状态，status 为 queued、running、done 或 failed'''
+    id: str
+    title: str
+    status: str = 'queued'
+    done: int = 0
+    total: int = 1
+    message: str = ''
+    # 单份工序卡失败的原因，批量生成时部分失败不影响任务本身完成
+    errors: list[str] = field(default_factory=list)
+    artifact: Artifact | None = None
+    error: str | None = None
+    # 任务失败时的完整错误堆栈，页面上可以展开查看
+    traceback: str | None = None
+    # 任务附带的其他结果，例如 PDF 预览的路径和转换耗时
+    details: dict = field(default_factory=dict)
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+
+    @property
+    def progress(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+
+# 任务执行时用于汇报进度的函数：已完成数量、总数、说明、单份失败的原因，关键字参数记录到 details 中
+Report = Callable[..., None]
+
+
+class JobQueue:
+    '''有界的后台任务队列，workers 个线程按提交顺序执行任务，keep 为完成的任务保留的时间（秒）'''
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE, keep: float = ARTIFACT_TTL):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.jobs: dict[str, Job] = {}
+        self.pending: queue.Queue[tuple[Job, Callable[[Report], Artifact]]] = queue.Queue(max_queued)
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.threads = [
+            threading.Thread(target=self.run_worker, name=f'generate-job-{index}', daemon=True)
+            for index in range(max(1, workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, title: str, func: Callable[[Report], Artifact], total: int = 1) -> str:
+        '''提交任务并立即返回任务编号，func 接收汇报进度的函数，返回保存的生成结果'''
+        job = Job(uuid.uuid4().hex, title, total=total)
+        with self.lock:
+            self.prune()
+            self.jobs[job.id] = job
+        try:
+            self.pending.put_nowait((job, func))
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job.id]
+            raise JobQueueFull('排队的生成任务过多，请稍后再试')
+        return job.id
+
+    def get(self, job_id: str) -> Job | None:
+        '''获取任务状态的副本，任务不存在或已经过期时返回 None'''
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else dataclasses.replace(job, errors=list(job.errors), details=dict(job.details))
+
+    def metrics(self) -> dict:
+        '''队列长度、执行中的任务数量以及最近任务的排队时间（秒）'''
+        with self.lock:
+            waits = sorted(self.waits)
+            running = sum(1 for job in self.jobs.values() if job.status == 'running')
+            oldest = min((job.submitted for job in self.jobs.values() if job.status == 'queued'), default=None)
+        return {
+            'depth': self.pending.qsize(),
+            'running': running,
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            'wait_current': time.time() - oldest if oldest is not None else 0.0,
+        }
+
+    def prune(self):
+        '''删除完成超过保留时间的任务，调用时需要持有锁'''
+        expired = time.time() - self.keep
+        for job_id in [job.id for job in self.jobs.values() if job.finished and job.finished < expired]:
+            del self.jobs[job_id]
+
+    def report(self, job: Job, done: int, total: int, message: str, error: str | None = None, **details):
+        with self.lock:
+            job.done, job.total, job.message = done, total, message
+            if error:
+                job.errors.append(error)
+            job.details.update(details)
+
+    def run_worker(self):
+        '''后台线程的主循环'''
+        while True:
+            job, func = self.pending.get()
+            with self.lock:
+                job.status = 'running'
+                job.started = time.time()
+                self.waits.append(job.started - job.submitted)
+            try:
+                artifact = func(lambda *args, **details: self.report(job, *args, **details))
+            except Exception as error:
+                with self.lock:
+                    job.status, job.error = 'failed', str(error) or type(error).__name__
+                    job.traceback = traceback.format_exc()
+            else:
+                with self.lock:
+                    job.status, job.artifact, job.done = 'done', artifact, job.total
+            finally:
+                with self.lock:
+                    job.finished = time.time()
@@ -0,0 +1,110 @@
+'''表格内容的分页
+
+工步、物料等表格的行数不固定，模板中每一页的表格区域高度却是固定的。这里按卡片字体的字符宽度
+估算每一行折行后的高度，再一次顺序遍历把行分配到各页，放不下的行放到续页。
+字符宽度按字体和字号缓存：安装了卡片字体时从字体文件读取字形宽度，没有时按全角、半角估算。
+所有长度的单位都是磅。
+'''
+import functools
+import unicodedata
+
+# 卡片使用的字体，按顺序选择第一个已安装的
+FONT_FAMILIES = ['思源宋体', 'Source Han Serif SC', 'Source Han Serif CN', 'Noto Serif CJK SC', 'SimSun']
+# 模板正文的字号（五号）
+FONT_SIZE = 10.5
+TWIPS_PER_POINT = 20
+
+
+@functools.cache
+def load_font(families: tuple[str, ...]):
+    '''加载第一个已安装的字体文件，没有 matplotlib 或字体时返回 None'''
+    try:
+        from matplotlib import font_manager, ft2font
+    except ImportError:
+        return None
+    for family in families:
+        try:
+            path = font_manager.findfont(font_manager.FontProperties(family=family), fallback_to_default=False)
+        except ValueError:
+            continue
+        return ft2font.FT2Font(path)
+    return None
+
+
+class FontMetrics:
+    '''一种字体和字号的字符宽度，每个字符只计算一次'''
+
+    def __init__(self, families: tuple[str, ...], size: float):
+        self.size = size
+        self.font = load_font(families)
+        self.widths: dict[str, float] = {}
+
+    def get_char_width(self, char: str) -> float:
+        width = self.widths.get(char)
+        if width is None:
+            width = self.widths[char] = self.measure_char(char)
+        return width
+
+    def measure_char(self, char: str) -> float:
+        if self.font is not None and self.font.get_char_index(ord(char)):
+            # 按 1 磅设置字号，字形的线性宽度（16.16 定点数）即为 em 的比例
+            self.font.set_size(1, 72)
+            glyph = self.font.load_char(ord(char))
+            return glyph.linearHoriAdvance / 65536 * self.size
+        # 没有字体时全角字符按一个字号宽，其余按半个字号宽
+        return self.size if unicodedata.east_asian_width(char) in ('W', 'F') else self.size / 2
+
+    def count_lines(self, text: str, width: float) -> int:
+        '''文字在给定宽度内折行后的行数，按字符折行（中文排版的折行方式），换行符另起一行'''
+        lines = 0
+        for paragraph in text.split('\n'):
+            lines += 1
+            used = 0.0
+            for char in paragraph:
+                char_width = self.get_char_width(char)
+                if used + char_width > width and used > 0:
+                    lines += 1
+                    used = 0.0
+                used += char_width
+        return lines
+
+
+@functools.cache
+def get_font_metrics(families: tuple[str, ...] = tuple(FONT_FAMILIES), size: float = FONT_SIZE) -> FontMetrics:
+    '''进程内共用的字体度量'''
+    return FontMetrics(families, size)
+
+
+def measure_row(values: list[str], widths: list[float], line_height: float, min_height: float = 0.0,
+                metrics: FontMetrics | None = None) -> float:
+    '''一行表格的高度：各单元格折行后最多的行数乘以行距，不低于 min_height'''
+    metrics = metrics or get_font_metrics()
+    lines = max((metrics.count_lines(value, width) for value, width in zip(values, widths) if value), default=1)
+    return max(lines * line_height, min_height)
+
+
+def paginate(heights: list[float], capacity: float) -> list[range]:
+    '''按顺序把各行分配到页中，每页的总高度不超过 capacity，返回每页的行号范围
+
+    一行本身超过一页时单独占一页；没有行时返回一个空页，模板的第一页总是保留。
+    '''
+    pages = []
+    start, used = 0, 0.0
+    for index, height in enumerate(heights):
+        if used + height > capacity and index > start:
+            pages.append(range(start, index))
+            start, used = index, 0.0
+        used += height
+    pages.append(range(start, len(heights)))
+    return pages
+
+
+if __name__ == '__main__':
+    import time
+    metrics = get_font_metrics()
+    print(f'字体：{metrics.font.family_name if metrics.font else "未安装，按全角、半角估算"}')
+    rows = [[str(index), '安装座椅', '检查螺栓紧固' * (index % 4), '拧紧螺栓：力矩 45N·m\n涂防松标记', '▲■', ''] for index in range(600)]
+    started = time.perf_counter()
+    heights = [measure_row(row, [70, 110, 150, 188, 117, 118], 20, 20) for row in rows]
+    pages = paginate(heights, 361.6)
+    print(f'{len(rows)} 行分为 {len(pages)} 页，耗时 {(time.perf_counter() - started) * 1000:.1f} ms')
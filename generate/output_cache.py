@@ -0,0 +1,132 @@
+'''生成结果缓存
+
+工序卡的内容完全由模板记录、补充信息、渲染后端的版本、docx 模板文件以及物料、工艺装备、作业动作的名称决定，
+以这些内容的哈希值为键把生成的 docx 保存在磁盘上，相同的请求直接返回保存的结果。
+缓存按最近使用的顺序淘汰，总大小不超过设定的上限。
+'''
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import Future
+from generate.config import OUTPUT_CACHE_PATH, OUTPUT_CACHE_MAX_SIZE
+from generate.context import format_value
+from generate.template_cache import get_template_digest
+from generate.renderer import get_renderer
+from generate.docx_api import template_path
+from generate.data_cache import get_data_cache
+from generate.reference_index import REFERENCE_TABLES
+from generate.worker_pool import RenderPool
+
+SUFFIX = '.docx'
+# 生成时从中读取名称的基础资料，内容变化后之前生成的结果不再可用
+NAME_TABLES = ('物料', '工艺装备', '作业动作')
+
+
+def get_request_key(item: dict, renderer, template_path: Path) -> str:
+    '''计算一次生成请求的键：模板记录与补充信息、渲染后端名称和版本、docx 模板和基础资料的哈希值'''
+    cache = get_data_cache()
+    content = json.dumps(
+        {
+            'item': item,
+            'renderer': [renderer.name, renderer.version],
+            'template': get_template_digest(template_path),
+            'reference': [cache.get_file_fingerprint(REFERENCE_TABLES[name][0]) for name in NAME_TABLES],
+        },
+        ensure_ascii=False, sort_keys=True, default=format_value,
+    )
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class OutputCache:
+    '''磁盘上的最近最少使用缓存，每个结果保存为一个 docx 文件，max_size 的单位为 MB'''
+
+    def __init__(self, path: Path = OUTPUT_CACHE_PATH, max_size: int = OUTPUT_CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size * 1024 * 1024
+        self.lock = threading.Lock()
+        # 键 -> 文件大小，越靠后越是最近使用的
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.size = 0
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.path.mkdir(parents=True, exist_ok=True)
+        # 按上次使用的时间恢复已有的缓存
+        files = sorted(
+            (file.stat().st_mtime_ns, file.stem, file.stat().st_size)
+            for file in self.path.iterdir() if file.suffix == SUFFIX
+        )
+        for _, key, size in files:
+            self.entries[key] = size
+            self.size += size
+        with self.lock:
+            self.evict()
+
+    def get_file_path(self, key: str) -> Path:
+        return self.path / f'{key}{SUFFIX}'
+
+    def get(self, key: str) -> bytes | None:
+        '''读取缓存的结果，不存在时返回 None'''
+        with self.lock:
+            if key not in self.entries:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            try:
+                data = self.get_file_path(key).read_bytes()
+                # 更新修改时间，重启后仍然可以按使用顺序淘汰
+                os.utime(self.get_file_path(key))
+            except FileNotFoundError:
+                self.size -= self.entries.pop(key)
+                self.counters['misses'] += 1
+                return None
+            self.counters['hits'] += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        '''保存一个结果，先写入临时文件再重命名，避免读到写了一半的文件'''
+        if len(data) > self.max_size:
+            return
+        file_path = self.get_file_path(key)
+        temp_path = file_path.with_name(f'{key}.{threading.get_ident()}.tmp')
+        temp_path.write_bytes(data)
+        os.replace(temp_path, file_path)
+        with self.lock:
+            self.size -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.size += len(data)
+            self.evict()
+
+    def evict(self):
+        '''删除最久未使用的结果，直到总大小不超过上限，调用时需要持有锁'''
+        while self.entries and self.size > self.max_size:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.counters['evictions'] += 1
+            self.get_file_path(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        '''缓存的命中统计和占用情况'''
+        with self.lock:
+            return self.counters | {'entries': len(self.entries), 'size': self.size}
+
+
+def submit(pool: RenderPool, item: dict, cache: OutputCache | None = None) -> Future:
+    '''提交渲染请求，命中缓存时直接返回已经完成的 Future，否则生成完成后写入缓存'''
+    if cache is None:
+        return pool.submit(item)
+    key = get_request_key(item, get_renderer(pool.backend), template_path)
+    data = cache.get(key)
+    if data is not None:
+        future = Future()
+        future.set_result(data)
+        return future
+
+    def store(future: Future):
+        if not future.cancelled() and future.exception() is None:
+            cache.put(key, future.result())
+
+    future = pool.submit(item)
+    future.add_done_callback(store)
+    return future
@@ -0,0 +1,259 @@
+'''通过 LibreOffice 将 docx 转换为 PDF
+
+保持少量常驻的无界面 LibreOffice（soffice）进程，每个进程使用独立的用户配置目录并监听本机端口，
+转换时通过 UNO 接口打开文档并导出 PDF，不需要为每个文件重新启动 LibreOffice。
+uno 模块一般只有 LibreOffice 自带的 python 才有，所以用能够 import uno 的 python 为每个 soffice
+启动一个转换进程（uno_bridge.py），通过标准输入输出传递转换请求，页面所在的 python 不需要 uno 模块。
+每次转换最长 PDF_TIMEOUT 秒，超时后结束这一组进程，下次转换时重新启动。
+找不到能够 import uno 的 python 时退化为每次调用 soffice --convert-to（每次都要冷启动 LibreOffice），
+各个位置仍然使用各自已经初始化好的配置目录，避免多个转换争用同一个配置。
+'''
+import os
+import sys
+import json
+import signal
+import warnings
+import time
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from generate.config import SOFFICE_PATH, SOFFICE_PYTHON_PATH, PDF_POOL_SIZE, PDF_TIMEOUT
+
+# LibreOffice 启动后等待 UNO 接口可用的最长时间（秒）
+START_TIMEOUT = 30.0
+BRIDGE_PATH = Path(__file__).parent / 'uno_bridge.py'
+
+
+class ConversionError(RuntimeError):
+    '''PDF 转换失败'''
+
+
+def find_soffice() -> str | None:
+    '''查找 soffice 的路径，找不到时返回 None'''
+    if SOFFICE_PATH and Path(SOFFICE_PATH).exists():
+        return SOFFICE_PATH
+    return shutil.which(SOFFICE_PATH or 'soffice')
+
+
+def find_uno_python(soffice: str) -> str | None:
+    '''查找能够 import uno 的 python：配置的路径、LibreOffice 自带的 python、当前的 python、系统的 python3'''
+    program_path = Path(soffice).resolve().parent
+    candidates = [
+        SOFFICE_PYTHON_PATH,
+        program_path / 'python.exe',
+        program_path / 'python',
+        program_path.parent / 'Resources' / 'python',
+        sys.executable,
+        shutil.which('python3'),
+    ]
+    for candidate in candidates:
+        if not candidate or not Path(candidate).exists():
+            continue
+        try:
+            result = subprocess.run(
+                [str(candidate), '-c', 'import uno'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30,
+            )
+        except (subprocess.SubprocessError, OSError):
+            continue
+        if result.returncode == 0:
+            return str(candidate)
+    return None
+
+
+def kill_tree(process: subprocess.Popen):
+    '''强制结束进程以及它启动的子进程，soffice 只是启动 soffice.bin 的外壳'''
+    if process.poll() is not None:
+        return
+    try:
+        if sys.platform == 'win32':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elif os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.kill()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Office:
+    '''一个常驻的 LibreOffice 进程和它的转换进程，同一时间只处理一个转换；python 为空时每次通过命令行转换'''
+
+    def __init__(self, soffice: str, python: str | None):
+        self.soffice = soffice
+        self.python = python
+        self.profile = tempfile.TemporaryDirectory(prefix='pcg-soffice-')
+        self.profile_url = Path(self.profile.name).as_uri()
+        self.process: subprocess.Popen | None = None
+        self.bridge: subprocess.Popen | None = None
+        self.timed_out = False
+        if python is not None:
+            try:
+                self.start()
+            except ConversionError:
+                # 启动失败时在第一次转换时重试
+                pass
+
+    def start(self):
+        '''启动 LibreOffice 和转换进程，等待转换进程连接上 UNO 接口'''
+        port = get_free_port()
+        self.process = subprocess.Popen(
+            [
+                self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+                f'-env:UserInstallation={self.profile_url}',
+                f'--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext',
+            ],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            # 单独的进程组，超时时连同 soffice.bin 一起结束
+            start_new_session=sys.platform != 'win32',
+        )
+        self.bridge = subprocess.Popen(
+            [self.python, str(BRIDGE_PATH), str(port), str(START_TIMEOUT)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, encoding='utf-8',
+        )
+        response = self.request(None, START_TIMEOUT + 5)
+        if not response.get('ready'):
+            self.stop()
+            raise ConversionError(f'LibreOffice 启动失败：{response.get('error', '')}')
+
+    def request(self, message: dict | None, timeout: float) -> dict:
+        '''向转换进程发送一个请求并等待回复，超时后结束 LibreOffice 和转换进程'''
+        self.timed_out = False
+        watchdog = threading.Timer(timeout, self.kill)
+        watchdog.start()
+        try:
+            if message is not None:
+                self.bridge.stdin.write(json.dumps(message, ensure_ascii=False) + '\n')
+                self.bridge.stdin.flush()
+            line = self.bridge.stdout.readline()
+        except OSError:
+            line = ''
+        finally:
+            watchdog.cancel()
+        if not line:
+            timed_out = self.timed_out
+            self.stop()
+            if timed_out:
+                raise ConversionError(f'LibreOffice 在 {timeout:.0f} 秒内没有完成，已结束该进程')
+            raise ConversionError('LibreOffice 转换进程意外退出')
+        return json.loads(line)
+
+    def kill(self):
+        '''超时时强制结束，正在等待的 request 随即返回'''
+        self.timed_out = True
+        for process in (self.bridge, self.process):
+            if process is not None:
+                kill_tree(process)
+
+    def stop(self):
+        '''结束 LibreOffice 进程：先关闭转换进程的输入让它退出 LibreOffice，没有退出时强制结束'''
+        if self.bridge is not None:
+            try:
+                self.bridge.stdin.close()
+            except OSError:
+                pass
+        for process in (self.bridge, self.process):
+            if process is None:
+                continue
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                kill_tree(process)
+                process.wait()
+        if self.bridge is not None:
+            self.bridge.stdout.close()
+        self.bridge = self.process = None
+
+    def close(self):
+        self.stop()
+        self.profile.cleanup()
+
+    def convert(self, docx_path: Path, pdf_path: Path):
+        '''将 docx 转换为 pdf'''
+        if self.python is None:
+            self.convert_with_command(docx_path, pdf_path)
+            return
+        if self.bridge is None:
+            self.start()
+        response = self.request({'docx': str(docx_path.absolute()), 'pdf': str(pdf_path.absolute())}, PDF_TIMEOUT)
+        if not response.get('ok'):
+            raise ConversionError(f'PDF 转换失败：{response.get('error', '')}')
+
+    def convert_with_command(self, docx_path: Path, pdf_path: Path):
+        '''没有能够 import uno 的 python 时通过命令行转换'''
+        with tempfile.TemporaryDirectory() as out_dir:
+            try:
+                subprocess.run(
+                    [
+                        self.soffice, '--headless', '--norestore', f'-env:UserInstallation={self.profile_url}',
+                        '--convert-to', 'pdf', '--outdir', out_dir, str(docx_path.absolute()),
+                    ],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PDF_TIMEOUT, check=True,
+                )
+            except (subprocess.SubprocessError, OSError) as error:
+                raise ConversionError(f'LibreOffice 转换失败：{error}') from error
+            result = Path(out_dir) / f'{docx_path.stem}.pdf'
+            if not result.exists():
+                raise ConversionError('LibreOffice 没有生成 PDF')
+            shutil.move(result, pdf_path)
+
+
+class PdfConverter:
+    '''常驻 LibreOffice 进程池，size 为进程数量'''
+
+    def __init__(self, size: int = PDF_POOL_SIZE):
+        self.soffice = find_soffice()
+        self.size = size
+        self.python: str | None = None
+        self.offices: queue.Queue[Office] = queue.Queue()
+        if self.is_available():
+            self.python = find_uno_python(self.soffice)
+            if self.python is None:
+                warnings.warn(self.get_mode(), RuntimeWarning, stacklevel=2)
+            for _ in range(size):
+                self.offices.put(Office(self.soffice, self.python))
+
+    def is_available(self) -> bool:
+        '''是否安装了 LibreOffice 且启用了转换'''
+        return self.soffice is not None and self.size > 0
+
+    def is_resident(self) -> bool:
+        '''是否使用常驻的 LibreOffice 进程，否则每次转换都要重新启动 LibreOffice'''
+        return self.python is not None
+
+    def get_mode(self) -> str:
+        '''转换方式的说明，用于页面提示'''
+        if self.is_resident():
+            return f'使用 {self.size} 个常驻的 LibreOffice 进程转换'
+        return '没有找到能够 import uno 的 python（可以通过 PCG_SOFFICE_PYTHON 指定），每次转换都会重新启动 LibreOffice，速度较慢'
+
+    def convert(self, docx_path: Path, pdf_path: Path) -> float:
+        '''将 docx 转换为 pdf，返回转换耗时（秒），所有进程都在使用时排队等待'''
+        if not self.is_available():
+            raise ConversionError('没有找到 LibreOffice，无法转换 PDF')
+        office = self.offices.get()
+        started = time.perf_counter()
+        try:
+            office.convert(docx_path, pdf_path)
+        except ConversionError:
+            raise
+        except Exception as error:
+            # 转换进程的回复不是预期的内容时重新启动该进程，下次转换使用新的进程
+            office.stop()
+            raise ConversionError(f'PDF 转换失败：{error}') from error
+        finally:
+            self.offices.put(office)
+        return time.perf_counter() - started
+
+    def close(self):
+        while not self.offices.empty():
+            self.offices.get().close()
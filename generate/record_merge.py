@@ -0,0 +1,242 @@
+'''多人同时维护时的乐观并发控制
+
+基础资料的每一行以“第一列编码 + 同一编码中的第几行”标识（作业动作等表中编码允许重复），
+行内容的哈希值作为这一行的版本号。保存时比较打开页面时的数据（base）与编辑后的数据（mine），
+只把改动的行写回最新的文件（current）：最新文件中这一行的版本号仍然等于 base 时才写入（比较并交换），
+否则说明其他人也修改了这一行，记为冲突，保留其他人的内容。不同的行互不影响。
+
+工序卡模板以数据库中的版本号做比较并交换，版本号不一致时按字段做三方合并，见 merge_template。
+
+上传批量更新的数据时按同样的行标识与现有数据比较（diff_frames），用 pandas 整列计算每行的哈希值，
+得到新增、修改、删除的行，确认后只把这些行应用到最新的文件中（apply_diff），比较之后被其他人改过的行记为冲突。
+'''
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+import pandas as pd
+from generate.data_cache import get_data_cache
+
+# 同一进程内写基础资料文件的锁，读取最新文件、合并、写回在锁内完成
+write_lock = threading.Lock()
+
+
+def normalize_value(value) -> str:
+    '''单元格的值统一为文本，空值为空字符串，读取文件和页面编辑后的类型差异不影响比较'''
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def get_row_version(values) -> str:
+    '''一行的版本号：内容的哈希值'''
+    text = json.dumps([normalize_value(value) for value in values], ensure_ascii=False)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get_row_keys(frame: pd.DataFrame) -> list[tuple[str, int]]:
+    '''每一行的标识：第一列的编码，以及这是该编码的第几行'''
+    counts: dict[str, int] = {}
+    keys = []
+    for value in frame.iloc[:, 0]:
+        code = normalize_value(value)
+        keys.append((code, counts.get(code, 0)))
+        counts[code] = counts.get(code, 0) + 1
+    return keys
+
+
+def merge_rows(base: pd.DataFrame, mine: pd.DataFrame, current: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
+    '''把 mine 相对 base 的修改合并到 current 中，返回合并后的数据和冲突的说明
+
+    base 和 mine 的索引相同的行是同一行，mine 中没有的索引是删除的行，新的索引是新增的行。
+    '''
+    columns = list(current.columns)
+    mine = mine.reindex(columns=columns)
+    base = base.reindex(columns=columns)
+    rows = [list(row) for row in current.itertuples(index=False)]
+    positions = {key: index for index, key in enumerate(get_row_keys(current))}
+    versions = [get_row_version(row) for row in rows]
+    deleted = set()
+    conflicts = []
+    for (code, occurrence), (label, base_row) in zip(get_row_keys(base), base.iterrows()):
+        base_version = get_row_version(base_row)
+        position = positions.get((code, occurrence))
+        if label in mine.index:
+            mine_row = list(mine.loc[label])
+            mine_version = get_row_version(mine_row)
+            if mine_version == base_version:
+                continue
+            if position is not None and versions[position] == base_version:
+                rows[position] = mine_row
+            elif position is None or versions[position] != mine_version:
+                # 最新文件中这一行已经被其他人修改或删除，保留其他人的内容
+                conflicts.append(f'{code}：其他人{'删除' if position is None else '修改'}了这一行')
+        elif position is not None:
+            if versions[position] == base_version:
+                deleted.add(position)
+            else:
+                conflicts.append(f'{code}：其他人修改了这一行，没有删除')
+    rows = [row for index, row in enumerate(rows) if index not in deleted]
+    rows.extend(list(row) for row in mine.loc[mine.index.difference(base.index, sort=False)].itertuples(index=False))
+    return pd.DataFrame(rows, columns=columns), conflicts
+
+
+def write_csv(path: Path, frame: pd.DataFrame):
+    '''写入临时文件后替换，其他人读取时不会读到写了一半的文件'''
+    temp_path = path.with_suffix('.tmp')
+    frame.to_csv(temp_path, encoding='utf-8', index=False)
+    os.replace(temp_path, path)
+
+
+def save_rows(path: Path, base: pd.DataFrame, mine: pd.DataFrame) -> tuple[int, list[str]]:
+    '''把页面上的修改合并到最新的文件中，返回合并后的行数和冲突的说明'''
+    with write_lock:
+        # 与页面上的数据一样按文本读取
+        current = pd.read_csv(path, encoding='utf-8', dtype=str)
+        merged, conflicts = merge_rows(base, mine, current)
+        write_csv(path, merged)
+    get_data_cache().invalidate(path)
+    return len(merged), conflicts
+
+
+# ------------------------------------------
+#  按编码批量导入
+#  MARK: 批量导入
+# ------------------------------------------
+
+
+def read_table(source) -> pd.DataFrame:
+    '''按文本读取 csv，编码等字段保持原样（例如不会把 001 读成 1），空单元格为空字符串'''
+    return pd.read_csv(source, encoding='utf-8', dtype=str, keep_default_na=False)
+
+
+def index_by_key(frame: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+    '''以 (第一列的编码, 该编码的第几行) 为索引，同时计算每行内容的哈希值'''
+    code = frame.iloc[:, 0]
+    keys = pd.MultiIndex.from_arrays([code, frame.groupby(code, sort=False).cumcount()], names=['编码', '序号'])
+    hashes = pd.util.hash_pandas_object(frame, index=False)
+    return frame.set_axis(keys), hashes.set_axis(keys)
+
+
+@dataclass
+class FrameDiff:
+    '''上传的数据与现有数据按编码比较的结果，索引为 (编码, 序号)'''
+    inserts: pd.DataFrame
+    updates: pd.DataFrame
+    deletes: pd.DataFrame
+    # 修改和删除的行在比较时的哈希值，应用时最新文件中的哈希值不同说明其他人改过
+    base_hashes: pd.Series
+
+    def summary(self, delete: bool = True) -> str:
+        text = f'新增 {len(self.inserts)} 行，修改 {len(self.updates)} 行'
+        return text + (f'，删除 {len(self.deletes)} 行' if delete else '')
+
+
+def check_columns(columns: list[str], incoming: pd.DataFrame):
+    '''上传的数据必须与目标表的列一致，顺序可以不同'''
+    missing = [column for column in columns if column not in incoming.columns]
+    extra = [column for column in incoming.columns if column not in columns]
+    if missing or extra:
+        raise ValueError(
+            '上传的数据与目标表的列不一致' + (f'，缺少：{"、".join(missing)}' if missing else '') +
+            (f'，多出：{"、".join(map(str, extra))}' if extra else '')
+        )
+
+
+def diff_frames(current: pd.DataFrame, incoming: pd.DataFrame) -> FrameDiff:
+    '''比较现有数据和上传的数据，两者都按 read_table 读取'''
+    check_columns(list(current.columns), incoming)
+    current, current_hashes = index_by_key(current)
+    incoming, incoming_hashes = index_by_key(incoming[list(current.columns)])
+    common = incoming.index.intersection(current.index, sort=False)
+    changed = common[incoming_hashes.loc[common].to_numpy() != current_hashes.loc[common].to_numpy()]
+    deleted = current.index.difference(incoming.index, sort=False)
+    return FrameDiff(
+        inserts=incoming.loc[incoming.index.difference(current.index, sort=False)],
+        updates=incoming.loc[changed],
+        deletes=current.loc[deleted],
+        base_hashes=current_hashes.loc[changed.append(deleted)],
+    )
+
+
+def apply_diff(path: Path, diff: FrameDiff, delete: bool = True) -> tuple[int, list[str]]:
+    '''把比较结果应用到最新的文件中，返回改动的行数和冲突的说明
+
+    修改和删除只在最新文件中这一行仍然与比较时相同时才应用；新增的行在最新文件中已经存在时，
+    内容相同则忽略，不同则记为冲突。
+    '''
+    with write_lock:
+        latest, latest_hashes = index_by_key(read_table(path))
+        conflicts = []
+
+        def check(keys: pd.Index, done, reason: str) -> pd.Index:
+            '''保留最新文件中哈希值仍然与比较时相同的行；已经是目标状态的行跳过，其余记为冲突'''
+            present = keys.isin(latest_hashes.index)
+            # 缺失的行填 0 而不是 NaN，避免哈希值被转换为浮点数
+            hashes = latest_hashes.reindex(keys, fill_value=0).to_numpy()
+            same = present & (hashes == diff.base_hashes.loc[keys].to_numpy())
+            conflicts.extend(f'{code}：{reason}' for code, _ in keys[~same & ~done(present, hashes)])
+            return keys[same]
+
+        target_hashes = pd.util.hash_pandas_object(diff.updates, index=False).to_numpy()
+        updates = check(diff.updates.index, lambda present, hashes: present & (hashes == target_hashes),
+                        '比较之后其他人修改或删除了这一行，没有更新')
+        latest.loc[updates] = diff.updates.loc[updates].to_numpy()
+        deletes = diff.deletes.index[:0]
+        if delete:
+            deletes = check(diff.deletes.index, lambda present, hashes: ~present, '比较之后其他人修改了这一行，没有删除')
+        existing = diff.inserts.index.intersection(latest.index, sort=False)
+        same = latest_hashes.loc[existing].to_numpy() == pd.util.hash_pandas_object(diff.inserts.loc[existing], index=False).to_numpy()
+        conflicts.extend(f'{code}：其他人已经新增了这一行，内容不同，没有新增' for code, _ in existing[~same])
+        inserts = diff.inserts.index.difference(latest.index, sort=False)
+        merged = pd.concat([latest.drop(index=deletes), diff.inserts.loc[inserts]])
+        write_csv(path, merged.reset_index(drop=True))
+    get_data_cache().invalidate(path)
+    return len(updates) + len(deletes) + len(inserts), conflicts
+
+
+def merge_template(base: dict, mine: dict, theirs: dict) -> tuple[dict, list[str]]:
+    '''工序卡模板按字段三方合并：只有一方修改的字段取修改后的值，双方修改为不同的值时为冲突，暂取 mine 的值
+
+    工步和物料清单作为整体比较，返回合并后的模板和冲突的字段。
+    '''
+    merged = {}
+    conflicts = []
+    for key in dict.fromkeys([*theirs, *mine]):
+        base_value, mine_value, their_value = base.get(key), mine.get(key), theirs.get(key)
+        if mine_value == base_value:
+            merged[key] = their_value
+        else:
+            merged[key] = mine_value
+            if their_value != base_value and their_value != mine_value:
+                conflicts.append(key)
+    return merged, conflicts
+
+
+if __name__ == '__main__':
+    base = pd.DataFrame({'编码': ['A', 'A', 'B', 'C'], '名称': ['a1', 'a2', 'b', 'c']})
+    # 我：修改第二个 A、删除 C、新增 D；其他人：修改 B、修改 C
+    mine = base.copy()
+    mine.loc[1, '名称'] = 'a2-我'
+    mine = pd.concat([mine.drop(index=3), pd.DataFrame({'编码': ['D'], '名称': ['d']}, index=[4])])
+    current = base.copy()
+    current.loc[2, '名称'] = 'b-其他人'
+    current.loc[3, '名称'] = 'c-其他人'
+    merged, conflicts = merge_rows(base, mine, current)
+    assert merged['名称'].tolist() == ['a1', 'a2-我', 'b-其他人', 'c-其他人', 'd'], merged
+    assert conflicts == ['C：其他人修改了这一行，没有删除'], conflicts
+    merged, conflicts = merge_template(
+        {'模板编码': 'T1', '工序名称': '安装', '工步': []},
+        {'模板编码': 'T1', '工序名称': '安装座椅', '工步': []},
+        {'模板编码': 'T1', '工序名称': '安装', '工步': [{'作业顺序': 0}]},
+    )
+    assert merged == {'模板编码': 'T1', '工序名称': '安装座椅', '工步': [{'作业顺序': 0}]} and not conflicts
+    current = pd.DataFrame({'编码': ['A', 'A', 'B', 'C', '001'], '名称': ['a1', 'a2', 'b', 'c', 'x']})
+    incoming = pd.DataFrame({'名称': ['a1', 'a2-新', 'c', 'x', 'd'], '编码': ['A', 'A', 'C', '001', 'D']})
+    diff = diff_frames(current, incoming)
+    assert (len(diff.inserts), len(diff.updates), len(diff.deletes)) == (1, 1, 1), diff
+    print('合并检查通过')
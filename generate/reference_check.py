@@ -0,0 +1,86 @@
+'''工序卡模板引用的基础资料检查
+
+模板中的设计方案项、物料清单、工步的工艺装备和动作的作业动作编码都引用基础资料中的编码，
+基础资料修改或删除后这些引用可能失效。检查时把所有模板展开为每种引用一张 DataFrame，
+与基础资料索引中的编码做一次反连接（不在编码集合中的行），得到每个模板失效的引用。
+'''
+import pandas as pd
+from generate.reference_index import get_reference_index
+
+# 引用字段：(报告中的字段名, 基础资料索引)
+REFERENCE_FIELDS = {
+    '设计方案项': '构型',
+    '物料清单': '物料',
+    '工艺装备': '工艺装备',
+    '作业动作编码': '作业动作',
+}
+REPORT_COLUMNS = ['模板', '字段', '位置', '编码']
+
+
+def flatten_templates(templates: dict[int, dict]) -> dict[str, pd.DataFrame]:
+    '''把模板中的引用展开为 (模板, 位置, 编码) 的表，每种引用一张，空的引用不检查'''
+    rows = {field: ([], [], []) for field in REFERENCE_FIELDS}
+
+    def append(field: str, template_id: int, position: str, code):
+        if code is not None and code != '':
+            ids, positions, codes = rows[field]
+            ids.append(template_id)
+            positions.append(position)
+            codes.append(code)
+
+    for template_id, item in templates.items():
+        append('设计方案项', template_id, '', item.get('设计方案项'))
+        for index, code in enumerate(item.get('物料清单') or []):
+            append('物料清单', template_id, f'第{index + 1}项', code)
+        for step, workstep in enumerate(item.get('工步') or []):
+            for code in workstep.get('工艺装备') or []:
+                append('工艺装备', template_id, f'工步{step + 1}', code)
+            for index, action in enumerate(workstep.get('动作') or []):
+                append('作业动作编码', template_id, f'工步{step + 1}动作{index + 1}', action.get('作业动作编码'))
+    return {
+        field: pd.DataFrame({'模板': ids, '位置': positions, '编码': codes}, columns=['模板', '位置', '编码'])
+        for field, (ids, positions, codes) in rows.items()
+    }
+
+
+def check_references(templates: dict[int, dict]) -> pd.DataFrame:
+    '''所有失效的引用，每行一个：模板、字段、位置、编码'''
+    reports = []
+    for field, frame in flatten_templates(templates).items():
+        codes = pd.Index(get_reference_index(REFERENCE_FIELDS[field]).codes)
+        # 反连接：编码不在基础资料中的行
+        dangling = frame[~frame['编码'].isin(codes)]
+        if not dangling.empty:
+            reports.append(dangling.assign(字段=field))
+    if not reports:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(reports, ignore_index=True)[REPORT_COLUMNS].sort_values('模板', kind='stable', ignore_index=True)
+
+
+def get_dangling_references(templates: dict[int, dict]) -> dict[int, list[str]]:
+    '''每个模板失效的引用说明，没有失效引用的模板不在结果中'''
+    report = check_references(templates)
+    result: dict[int, list[str]] = {}
+    for template_id, field, position, code in report.itertuples(index=False):
+        result.setdefault(template_id, []).append(f'{field}{f"（{position}）" if position else ""}：{code}')
+    return result
+
+
+if __name__ == '__main__':
+    import json
+    import time
+    from pathlib import Path
+    with open(Path(__file__).parent.parent / 'database' / '工序卡模板.json', encoding='utf-8') as file:
+        items = json.load(file)
+    print(get_dangling_references(dict(enumerate(items))) or '没有失效的引用')
+    templates = {}
+    for number in range(10000):
+        item = json.loads(json.dumps(items[number % len(items)]))
+        item['工步'] = item['工步'] * 5
+        if number % 100 == 0:
+            item['物料清单'] = item['物料清单'] + ['不存在的物料']
+        templates[number] = item
+    get_reference_index('物料')
+    started = time.perf_counter()
+    report = check_references(templates)
+    print(f'{len(templates)} 个模板：{len(report)} 个失效的引用，耗时 {(time.perf_counter() - started) * 1000:.0f} ms')
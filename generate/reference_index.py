@@ -0,0 +1,96 @@
+'''基础资料的编码索引
+
+物料、工艺装备、作业动作和构型（设计方案项）四张基础资料各建一个索引：去重后按文件顺序排列的编码、
+编码的集合、编码到行号和到选项位置的字典、编码到名称和显示标签的字典。索引在数据缓存中按文件内容建立，
+文件不变时所有会话、生成和维护页面共用同一份，页面每次重新运行时只做字典和集合的查找，不再遍历列表。
+建立索引时只从列式快照中读取编码和名称两列。
+'''
+from pathlib import Path
+import pandas as pd
+from generate.data_cache import get_data_cache
+from generate.csv_snapshot import read_snapshot
+
+database_path = Path(__file__).parent.parent / 'database'
+
+# 索引名称：(文件, 编码列, 名称列)
+REFERENCE_TABLES = {
+    '物料': (database_path / '物料基础资料.csv', '物料编码', '物料名称'),
+    '工艺装备': (database_path / '工艺装备基础资料.csv', '工艺装备编码', '工艺装备名称'),
+    '作业动作': (database_path / '作业动作库基础资料.csv', '作业动作编码', '作业动作名称'),
+    '构型': (database_path / '构型与设计方案项基础资料.csv', '设计方案项编码', '设计方案项名称'),
+}
+
+
+class ReferenceIndex:
+    '''一张基础资料的编码索引，建立后不再修改，可以在线程和会话之间共用'''
+
+    def __init__(self, frame: pd.DataFrame, code_column: str, name_column: str):
+        self.frame = frame
+        # 编码重复时以第一行为准
+        codes = frame[code_column].dropna().drop_duplicates()
+        # 先整体转换为 Python 列表，逐个遍历 pandas 的字符串列很慢
+        self.codes: tuple[str, ...] = tuple(codes.tolist())
+        self.code_set = frozenset(self.codes)
+        self.rows: dict[str, int] = dict(zip(self.codes, codes.index.tolist()))
+        self.positions: dict[str, int] = {code: position for position, code in enumerate(self.codes)}
+        self.names: dict[str, str] = dict(zip(self.codes, frame.loc[codes.index, name_column].fillna('').tolist()))
+        self.labels: dict[str, str] = {code: f'{code} {name}' if name else code for code, name in self.names.items()}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code) -> bool:
+        return code in self.code_set
+
+    def get_position(self, code, default: int = 0) -> int:
+        '''编码在选项中的位置，用于下拉框的默认选项，不存在时返回 default'''
+        return self.positions.get(code, default)
+
+    def contains_all(self, codes) -> bool:
+        '''所有编码都存在'''
+        return self.code_set.issuperset(codes or [])
+
+    def get_label(self, code) -> str:
+        '''下拉框中显示的“编码 名称”'''
+        return self.labels.get(code, str(code))
+
+    def get_row(self, code) -> dict | None:
+        '''编码对应的一行，只有编码和名称两列'''
+        row = self.rows.get(code)
+        return None if row is None else self.frame.loc[row].to_dict()
+
+
+def build_index(path: Path, code_column: str, name_column: str) -> ReferenceIndex:
+    '''只从快照中读取编码和名称两列'''
+    frame = read_snapshot(path, get_data_cache().get_file_fingerprint(path), [code_column, name_column])
+    return ReferenceIndex(frame, code_column, name_column)
+
+
+def get_reference_index(name: str) -> ReferenceIndex:
+    '''获取基础资料的编码索引，文件内容变化后自动重新建立'''
+    path, code_column, name_column = REFERENCE_TABLES[name]
+    return get_data_cache().get_file(path, lambda path: build_index(path, code_column, name_column), 'reference_index')
+
+
+if __name__ == '__main__':
+    import time
+    for name in REFERENCE_TABLES:
+        started = time.perf_counter()
+        index = get_reference_index(name)
+        built = time.perf_counter()
+        for code in index.codes:
+            index.get_position(code)
+            index.get_label(code)
+        print(f'{name}：{len(index)} 个编码，建立 {(built - started) * 1000:.2f} ms，'
+              f'查找 {(time.perf_counter() - built) * 1000000 / max(len(index), 1):.1f} μs/次')
+    frame = pd.DataFrame({'物料编码': [f'M{number:06d}' for number in range(100000)], '物料名称': '螺栓'})
+    started = time.perf_counter()
+    index = ReferenceIndex(frame, '物料编码', '物料名称')
+    built = time.perf_counter()
+    assert index.contains_all(index.codes[::1000]) and index.get_position('M099999') == 99999
+    # 页面中一次取出标签字典后逐个查找，与下拉框的 format_func 相同
+    labels = index.labels
+    labeled = [labels.get(code) for code in index.codes]
+    assert labeled[-1] == 'M099999 螺栓'
+    print(f'10 万个物料：建立 {(built - started) * 1000:.0f} ms，'
+          f'10 万个标签 {(time.perf_counter() - built) * 1000:.2f} ms')
@@ -0,0 +1,188 @@
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+from generate.config import RENDER_BACKEND
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    '''渲染后端的能力标识'''
+    # 是否可以在没有图形界面和 Office 的服务器上运行
+    headless: bool
+    # 同一进程内是否可以并发渲染多个工序卡
+    concurrent: bool
+    # 支持的平台，与 sys.platform 对应，为空表示不限制
+    platforms: tuple[str, ...] = ()
+
+
+class RenderSession(Protocol):
+    '''长期存活的渲染会话，在工作进程中打开一次后连续生成多份工序卡'''
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        '''渲染工序卡并返回 docx 的字节流'''
+        ...
+
+    def is_healthy(self) -> bool:
+        '''会话是否仍然可用'''
+        ...
+
+    def close(self) -> None:
+        '''释放会话占用的资源'''
+        ...
+
+
+class Renderer(Protocol):
+    '''工序卡渲染后端需要实现的接口'''
+    name: str
+    # 渲染逻辑或输出格式变化时需要递增，用于区分不同版本生成的文档
+    version: str
+    capabilities: Capabilities
+
+    def is_available(self) -> bool:
+        '''当前环境是否可以使用该后端'''
+        ...
+
+    def render_to_path(self, file_path: Path, item: dict) -> None:
+        '''渲染工序卡并保存到指定路径'''
+        ...
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        '''渲染工序卡并返回 docx 的字节流'''
+        ...
+
+    def open_session(self) -> RenderSession:
+        '''打开一个可以复用的渲染会话'''
+        ...
+
+
+class WordSession:
+    '''持有一个 Word 应用程序的会话，所有工序卡共用同一个 Word，关闭会话时退出 Word'''
+
+    def __init__(self, dispatch=None):
+        from generate.word_api import open_word
+        self.word = open_word(dispatch)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        from generate.word_api import render_document
+        temp_path = Path(self.temp_dir.name) / 'card.docx'
+        render_document(self.word, temp_path, item)
+        return temp_path.read_bytes()
+
+    def is_healthy(self) -> bool:
+        # Word 失去响应或被关闭时，访问属性会抛出 COM 异常
+        try:
+            self.word.Version
+        except Exception:
+            return False
+        return True
+
+    def close(self) -> None:
+        try:
+            self.word.Quit()
+        finally:
+            self.temp_dir.cleanup()
+
+
+class DocxSession:
+    '''docx 后端的会话，打开时预先编译模板'''
+
+    def __init__(self):
+        from generate.docx_api import template_path
+        from generate.template_cache import get_compiled_template
+        get_compiled_template(template_path)
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        from generate.docx_api import create_document_bytes
+        return create_document_bytes(item)
+
+    def is_healthy(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class WordRenderer:
+    '''通过 Word COM 接口绘制工序卡的后端'''
+    name = 'word'
+    version = '1'
+    capabilities = Capabilities(headless=False, concurrent=False, platforms=('win32',))
+
+    def is_available(self) -> bool:
+        if sys.platform != 'win32':
+            return False
+        try:
+            import win32com.client  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def render_to_path(self, file_path: Path, item: dict) -> None:
+        # 延迟导入，避免在没有 pywin32 的环境中导入失败
+        from generate.word_api import create_document
+        create_document(file_path, item)
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        # Word 只能保存到文件，这里借助临时目录中转
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir) / 'card.docx'
+            self.render_to_path(temp_path, item)
+            return temp_path.read_bytes()
+
+    def open_session(self) -> RenderSession:
+        return WordSession()
+
+
+class DocxRenderer:
+    '''基于 docx 模板直接生成工序卡的后端'''
+    name = 'docx'
+    version = '1'
+    capabilities = Capabilities(headless=True, concurrent=True)
+
+    def is_available(self) -> bool:
+        return True
+
+    def render_to_path(self, file_path: Path, item: dict) -> None:
+        from generate.docx_api import create_document
+        create_document(file_path, item)
+
+    def render_to_bytes(self, item: dict) -> bytes:
+        from generate.docx_api import create_document_bytes
+        return create_document_bytes(item)
+
+    def open_session(self) -> RenderSession:
+        return DocxSession()
+
+
+# ------------------------------------------
+#  渲染后端的注册与获取
+#  MARK: 渲染后端注册
+# ------------------------------------------
+
+renderers: dict[str, Renderer] = {}
+
+
+def register_renderer(renderer: Renderer) -> Renderer:
+    '''注册一个渲染后端，同名的后端会被覆盖'''
+    renderers[renderer.name] = renderer
+    return renderer
+
+
+def get_renderer(name: str | None = None) -> Renderer:
+    '''获取渲染后端，不指定名称时使用配置中的后端'''
+    name = name or RENDER_BACKEND
+    if name not in renderers:
+        raise ValueError(f'未知的渲染后端：{name}，可选的后端有：{'、'.join(renderers)}')
+    return renderers[name]
+
+
+def list_renderers(available_only: bool = False) -> list[Renderer]:
+    '''列出所有已注册的渲染后端'''
+    return [renderer for renderer in renderers.values() if not available_only or renderer.is_available()]
+
+
+register_renderer(WordRenderer())
+register_renderer(DocxRenderer())
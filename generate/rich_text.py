@@ -0,0 +1,172 @@
+'''带格式文字的构建
+
+一段文字由若干（文字，样式）片段组成，各片段的起止位置按实际的文字长度计算。
+各渲染后端按片段一次性设置格式，不再逐个字符设置，也不再依赖写死的偏移量。
+'''
+import copy
+from dataclasses import dataclass, replace
+from docx.oxml.ns import qn
+
+# 下划线类型（OOXML 中的取值）对应的 Word WdUnderline 常量
+UNDERLINE_CONSTANTS = {'none': 0, 'single': 1, 'double': 3, 'thick': 6}
+
+# rPr 中子元素的顺序，Word 要求按照规范中的顺序排列
+RUN_PROPERTY_ORDER = [
+    'rStyle', 'rFonts', 'b', 'bCs', 'i', 'iCs', 'caps', 'smallCaps', 'strike', 'dstrike',
+    'outline', 'shadow', 'emboss', 'imprint', 'noProof', 'snapToGrid', 'vanish', 'webHidden',
+    'color', 'spacing', 'w', 'kern', 'position', 'sz', 'szCs', 'highlight', 'u', 'effect',
+    'bdr', 'shd', 'fitText', 'vertAlign', 'rtl', 'cs', 'em', 'lang', 'eastAsianLayout',
+]
+
+
+@dataclass(frozen=True)
+class Style:
+    '''文字样式，值为 None 的属性沿用默认格式'''
+    font: str | None = None
+    size: float | None = None
+    bold: bool | None = None
+    underline: str | None = None
+
+    def merge(self, other: 'Style | None') -> 'Style':
+        '''用 other 中不为 None 的属性覆盖当前样式'''
+        if other is None:
+            return self
+        changes = {key: value for key, value in other.__dict__.items() if value is not None}
+        return replace(self, **changes)
+
+
+@dataclass(frozen=True)
+class Span:
+    '''一个片段在整段文字中的位置，start 从 0 开始'''
+    start: int
+    length: int
+    style: Style
+
+
+def set_run_property(properties, name: str, attributes: dict[str, str]):
+    '''按规范顺序设置 rPr 中的一个属性，已有的同名属性会被替换'''
+    existing = properties.find(qn(f'w:{name}'))
+    if existing is not None:
+        properties.remove(existing)
+    element = properties.makeelement(qn(f'w:{name}'), {qn(f'w:{key}'): value for key, value in attributes.items()})
+    index = RUN_PROPERTY_ORDER.index(name)
+    for child in properties:
+        localname = child.tag.split('}')[-1]
+        if localname in RUN_PROPERTY_ORDER and RUN_PROPERTY_ORDER.index(localname) > index:
+            child.addprevious(element)
+            return
+    properties.append(element)
+
+
+class RichText:
+    '''由若干带样式的片段组成的一段文字'''
+
+    def __init__(self, style: Style | None = None):
+        self.style = style or Style()
+        self.segments: list[tuple[str, Style]] = []
+
+    def add(self, text: str, style: Style | None = None) -> 'RichText':
+        '''追加一个片段，样式在默认样式的基础上覆盖，与前一个片段样式相同时合并'''
+        if not text:
+            return self
+        style = self.style.merge(style)
+        if self.segments and self.segments[-1][1] == style:
+            self.segments[-1] = (self.segments[-1][0] + text, style)
+        else:
+            self.segments.append((text, style))
+        return self
+
+    def field(self, label: str, value: str, value_style: Style | None = None) -> 'RichText':
+        '''追加“标签 + 值”形式的字段，标签使用默认样式'''
+        return self.add(label).add(value, value_style)
+
+    @property
+    def text(self) -> str:
+        return ''.join(text for text, _ in self.segments)
+
+    def spans(self) -> list[Span]:
+        '''按实际文字长度计算每个片段的位置'''
+        spans = []
+        start = 0
+        for text, style in self.segments:
+            spans.append(Span(start, len(text), style))
+            start += len(text)
+        return spans
+
+    # ------------------------------------------
+    #  输出为 WordprocessingML
+    #  MARK: WordprocessingML
+    # ------------------------------------------
+
+    def to_xml(self) -> str:
+        '''生成 run 的 xml 文本，每个片段一个 run，文字不做转义以便包含插槽'''
+        runs = []
+        for text, style in self.segments:
+            properties = ''
+            if style.font:
+                properties += f'<w:rFonts w:ascii="{style.font}" w:eastAsia="{style.font}" w:hAnsi="{style.font}"/>'
+            if style.bold:
+                properties += '<w:b/>'
+            properties += '<w:color w:val="000000"/>'
+            if style.size:
+                properties += f'<w:sz w:val="{round(style.size * 2)}"/>'
+            if style.underline:
+                properties += f'<w:u w:val="{style.underline}"/>'
+            text = text.replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">')
+            text = text.replace('\n', '</w:t><w:br/><w:t xml:space="preserve">')
+            runs.append(f'<w:r><w:rPr>{properties}</w:rPr><w:t xml:space="preserve">{text}</w:t></w:r>')
+        return ''.join(runs)
+
+    def fill_paragraph(self, paragraph, base_properties=None):
+        '''在段落节点末尾追加各片段的 run，格式在 base_properties 的基础上覆盖'''
+        for text, style in self.segments:
+            run = paragraph.makeelement(qn('w:r'), {})
+            properties = copy.deepcopy(base_properties) if base_properties is not None else run.makeelement(qn('w:rPr'), {})
+            if style.font:
+                set_run_property(properties, 'rFonts', {'ascii': style.font, 'eastAsia': style.font, 'hAnsi': style.font})
+            if style.bold is not None:
+                set_run_property(properties, 'b', {'val': '1' if style.bold else '0'})
+            if style.size:
+                set_run_property(properties, 'sz', {'val': str(round(style.size * 2))})
+            if style.underline:
+                set_run_property(properties, 'u', {'val': style.underline})
+            if len(properties):
+                run.append(properties)
+            for i, line in enumerate(text.split('\n')):
+                if i > 0:
+                    run.append(run.makeelement(qn('w:br'), {}))
+                t = run.makeelement(qn('w:t'), {})
+                t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+                t.text = line
+                run.append(t)
+            paragraph.append(run)
+
+    # ------------------------------------------
+    #  通过 Word COM 接口写入
+    #  MARK: Word COM
+    # ------------------------------------------
+
+    def apply_to_range(self, text_range):
+        '''写入 Word 的 Range：文字一次写入，之后每个片段只设置一次格式'''
+        text_range.Text = self.text
+        set_font(text_range.Font, self.style)
+        start = text_range.Start
+        for span in self.spans():
+            if span.style == self.style:
+                continue
+            segment_range = text_range.Duplicate
+            segment_range.SetRange(start + span.start, start + span.start + span.length)
+            set_font(segment_range.Font, span.style)
+
+
+def set_font(font, style: Style):
+    '''将样式写入 Word 的 Font 对象'''
+    if style.font:
+        font.Name = style.font
+    if style.size:
+        font.Size = style.size
+    if style.bold is not None:
+        font.Bold = style.bold
+    if style.underline:
+        font.Underline = UNDERLINE_CONSTANTS[style.underline]
+    font.Color = 0
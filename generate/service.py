@@ -0,0 +1,178 @@
+'''独立的渲染服务
+
+把渲染进程池放在单独的进程中，通过本机的 HTTP 接口提供服务，页面进程只负责界面，
+一次耗时的渲染不会影响其他会话；也可以启动多个服务副本，由页面轮流调用。
+
+接口：
+- POST /render：请求体为工序卡配置的 json，成功时返回 docx，失败时返回 {"error": "..."}
+- GET /health：返回进程池和缓存的统计信息
+
+运行方式：python -m generate.service --port 8765 --workers 2
+'''
+import sys
+import json
+import itertools
+import threading
+import argparse
+import urllib.error
+import urllib.request
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import Future, ThreadPoolExecutor
+from generate.config import SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_REQUESTS, POOL_SIZE, RENDER_TIMEOUT
+from generate.context import format_value
+from generate.worker_pool import RenderPool
+from generate.output_cache import OutputCache, submit
+
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+class ServiceError(RuntimeError):
+    '''渲染服务返回错误或无法连接'''
+
+
+class RenderService(ThreadingHTTPServer):
+    '''渲染服务，每个请求一个线程，同时接收的请求数量受 max_requests 限制'''
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], pool: RenderPool, cache: OutputCache | None,
+                 max_requests: int = SERVICE_MAX_REQUESTS):
+        super().__init__(address, RenderHandler)
+        self.pool = pool
+        self.cache = cache
+        self.slots = threading.BoundedSemaphore(max_requests)
+        self.rejected = 0
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server: RenderService
+
+    def send_json(self, status: HTTPStatus, content: dict):
+        body = json.dumps(content, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f'未知的接口：{self.path}'})
+            return
+        content = {'pool': self.server.pool.stats(), 'rejected': self.server.rejected}
+        if self.server.cache is not None:
+            content['cache'] = self.server.cache.stats()
+        self.send_json(HTTPStatus.OK, content)
+
+    def do_POST(self):
+        if self.path != '/render':
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f'未知的接口：{self.path}'})
+            return
+        try:
+            item = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as error:
+            self.send_json(HTTPStatus.BAD_REQUEST, {'error': f'请求内容不是有效的 json：{error}'})
+            return
+        # 排队的请求过多时直接拒绝，由客户端换一个副本或稍后重试
+        if not self.server.slots.acquire(blocking=False):
+            self.server.rejected += 1
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {'error': '渲染服务繁忙，请稍后再试'})
+            return
+        try:
+            docx_bytes = submit(self.server.pool, item, self.server.cache).result()
+        except Exception as error:
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error) or type(error).__name__})
+            return
+        finally:
+            self.server.slots.release()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', DOCX_TYPE)
+        self.send_header('Content-Length', str(len(docx_bytes)))
+        self.end_headers()
+        self.wfile.write(docx_bytes)
+
+    def log_message(self, format: str, *args):
+        # 只记录错误，正常的请求不输出日志
+        pass
+
+
+# ------------------------------------------
+#  页面使用的客户端
+#  MARK: 客户端
+# ------------------------------------------
+
+class RenderClient:
+    '''渲染服务的客户端，接口与 RenderPool 一致，多个服务副本轮流调用，某个副本不可用时换下一个
+
+    concurrency 为同时发出的请求数量，默认为每个副本 POOL_SIZE 个。
+    '''
+
+    def __init__(self, urls: list[str], concurrency: int | None = None, timeout: float = RENDER_TIMEOUT):
+        if not urls:
+            raise ValueError('没有配置渲染服务的地址')
+        self.urls = urls
+        self.timeout = timeout
+        self.backend = None
+        self.next_url = itertools.cycle(range(len(urls)))
+        self.executor = ThreadPoolExecutor(concurrency or len(urls) * POOL_SIZE, thread_name_prefix='render-client')
+
+    def submit(self, item: dict) -> Future:
+        '''提交一份工序卡的渲染请求，返回结果为 docx 字节流的 Future'''
+        return self.executor.submit(self.render, item)
+
+    def render(self, item: dict, timeout: float | None = None) -> bytes:
+        '''渲染一份工序卡，依次尝试各个副本'''
+        body = json.dumps(item, ensure_ascii=False, default=format_value).encode('utf-8')
+        start = next(self.next_url)
+        errors = []
+        for offset in range(len(self.urls)):
+            url = self.urls[(start + offset) % len(self.urls)]
+            request = urllib.request.Request(
+                f'{url}/render', data=body, method='POST', headers={'Content-Type': 'application/json'},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                    return response.read()
+            except urllib.error.HTTPError as error:
+                message = json.loads(error.read() or b'{}').get('error', str(error))
+                # 渲染本身失败时换副本也没有用，只有服务繁忙时才尝试下一个
+                if error.code != HTTPStatus.SERVICE_UNAVAILABLE:
+                    raise ServiceError(message) from error
+                errors.append(f'{url}：{message}')
+            except OSError as error:
+                errors.append(f'{url}：{error}')
+        raise ServiceError('所有渲染服务都不可用：\n' + '\n'.join(errors))
+
+    def stats(self) -> dict:
+        '''各个副本的统计信息'''
+        stats = {}
+        for url in self.urls:
+            try:
+                with urllib.request.urlopen(f'{url}/health', timeout=5) as response:
+                    stats[url] = json.loads(response.read())
+            except OSError as error:
+                stats[url] = {'error': str(error)}
+        return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m generate.service', description='启动本机的工序卡渲染服务')
+    parser.add_argument('--host', default=SERVICE_HOST, help='监听的地址，默认只监听本机')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='监听的端口')
+    parser.add_argument('-w', '--workers', type=int, default=POOL_SIZE, help='渲染工作进程数量')
+    parser.add_argument('-b', '--backend', default=None, help='渲染后端，默认使用 PCG_RENDER_BACKEND')
+    parser.add_argument('--no-cache', action='store_true', help='不使用生成结果缓存')
+    args = parser.parse_args(argv)
+    with RenderPool(args.backend, size=args.workers) as pool:
+        cache = None if args.no_cache else OutputCache()
+        with RenderService((args.host, args.port), pool, cache) as server:
+            print(f'渲染服务已启动：http://{args.host}:{server.server_port}，后端 {pool.backend}，{args.workers} 个工作进程')
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
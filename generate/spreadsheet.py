@@ -0,0 +1,336 @@
+'''基础资料的 Excel（.xlsx）导入和导出
+
+xlsx 是 zip 压缩包中的几个 xml 文件。读取时用 expat 分块解析第一个工作表，不建立 xml 元素树，
+每块解析出的行交给调用方后就释放；读到表头后先与目标表的列比较，不一致时不再读取后面的行。
+写入时按行直接写进压缩包中的工作表文件，单元格全部写为文本（内联字符串），编码中的前导 0 等不会被 Excel 改掉，
+也不需要共享字符串表。导出的文件在点击下载时才生成，先写到临时文件，再整体交给下载按钮。
+'''
+import re
+import zipfile
+import tempfile
+import posixpath
+from typing import IO, Callable, Iterable, Iterator
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+import pandas as pd
+from generate.record_merge import check_columns, normalize_value
+
+# 导出时每次转换和写入的行数
+CHUNK_SIZE = 10000
+# 读取时每次解析的 xml 字节数
+READ_SIZE = 1 << 16
+# xml 中不允许出现的控制字符
+ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def get_local_name(name: str) -> str:
+    '''去掉前缀的标签名，有的程序写出的 xlsx 带有 x: 等前缀'''
+    return name.rpartition(':')[2]
+
+
+def get_column_number(reference: str) -> int:
+    '''单元格引用中的列号，A1 为 0，AB3 为 27'''
+    number = 0
+    for character in reference:
+        if not character.isalpha():
+            break
+        number = number * 26 + ord(character.upper()) - 64
+    return number - 1
+
+
+def get_column_letter(number: int) -> str:
+    '''列号对应的字母，0 为 A'''
+    letters = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def parse_xml(file: IO[bytes], start: Callable[[str, dict], None], end: Callable[[str], None],
+              text: Callable[[str], None]) -> Iterator[None]:
+    '''用 expat 分块解析 xml，不建立元素树，每解析完一块产生一次，调用方在这时取走已经解析的结果'''
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = lambda name, attrs: start(get_local_name(name), attrs)
+    parser.EndElementHandler = lambda name: end(get_local_name(name))
+    parser.CharacterDataHandler = text
+    while chunk := file.read(READ_SIZE):
+        parser.Parse(chunk, False)
+        yield
+    parser.Parse(b'', True)
+    yield
+
+
+class TextCollector:
+    '''收集 t 标签中的文本，跳过注音（rPh）'''
+
+    def __init__(self):
+        self.parts: list[str] | None = None
+        self.phonetic = False
+
+    def start(self, name: str):
+        if name == 'rPh':
+            self.phonetic = True
+        elif name in ('t', 'v') and not self.phonetic:
+            self.parts = []
+
+    def end(self, name: str):
+        if name == 'rPh':
+            self.phonetic = False
+
+    def text(self, data: str):
+        if self.parts is not None and not self.phonetic:
+            self.parts.append(data)
+
+    def pop(self) -> str | None:
+        '''取出收集的文本，没有 t 或 v 标签时为 None'''
+        parts, self.parts = self.parts, None
+        return None if parts is None else ''.join(parts)
+
+
+def get_first_sheet(archive: zipfile.ZipFile) -> str:
+    '''第一个工作表在压缩包中的路径'''
+    sheets = []
+    targets = {}
+
+    def start_sheet(name: str, attrs: dict):
+        if name == 'sheet':
+            sheets.extend(value for key, value in attrs.items() if get_local_name(key) == 'id')
+
+    def start_relationship(name: str, attrs: dict):
+        if name == 'Relationship':
+            targets[attrs.get('Id')] = attrs.get('Target')
+
+    for part, start in (('xl/workbook.xml', start_sheet), ('xl/_rels/workbook.xml.rels', start_relationship)):
+        with archive.open(part) as file:
+            for _ in parse_xml(file, start, lambda name: None, lambda data: None):
+                pass
+    if not sheets:
+        raise ValueError('Excel 文件中没有工作表')
+    target = targets.get(sheets[0])
+    if target is None:
+        raise ValueError('Excel 文件中找不到第一个工作表')
+    return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+
+
+def read_shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    '''共享字符串表，单元格中的文本一般都存在这里；多段格式的文本拼接在一起'''
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    collector = TextCollector()
+    current: list[str] = []
+
+    def end(name: str):
+        collector.end(name)
+        if name == 't':
+            current.append(collector.pop() or '')
+        elif name == 'si':
+            strings.append(''.join(current))
+            current.clear()
+
+    with archive.open('xl/sharedStrings.xml') as file:
+        for _ in parse_xml(file, lambda name, attrs: collector.start(name), end, collector.text):
+            pass
+    return strings
+
+
+def format_number(value: str) -> str:
+    '''数字按 Excel 显示的 15 位有效数字，整数不带小数点'''
+    try:
+        return format(float(value), '.15g')
+    except ValueError:
+        return value
+
+
+def iter_rows(source) -> Iterator[list[str]]:
+    '''逐行读取第一个工作表，每行是文本的列表，中间空着的单元格为空字符串'''
+    with zipfile.ZipFile(source) as archive:
+        shared_strings = read_shared_strings(archive)
+        rows: list[list[str]] = []
+        values: list[str] = []
+        collector = TextCollector()
+        cell: dict = {}
+        inline: list[str] = []
+
+        def start(name: str, attrs: dict):
+            collector.start(name)
+            if name == 'c':
+                cell.update(reference=attrs.get('r'), type=attrs.get('t', 'n'))
+                inline.clear()
+            elif name == 'row':
+                values.clear()
+
+        def end(name: str):
+            collector.end(name)
+            if name == 't':
+                inline.append(collector.pop() or '')
+            elif name == 'v':
+                cell['value'] = collector.pop()
+            elif name == 'c':
+                value = cell.pop('value', None)
+                if cell['type'] == 'inlineStr':
+                    value = ''.join(inline)
+                elif value is None:
+                    value = ''
+                elif cell['type'] == 's':
+                    value = shared_strings[int(value)]
+                elif cell['type'] == 'n':
+                    value = format_number(value)
+                reference = cell['reference']
+                number = get_column_number(reference) if reference else len(values)
+                values.extend([''] * (number - len(values)))
+                values.append(value)
+            elif name == 'row':
+                rows.append(values.copy())
+
+        with archive.open(get_first_sheet(archive)) as file:
+            # 每次只保留一块 xml 中解析出的行
+            for _ in parse_xml(file, start, end, collector.text):
+                yield from rows
+                rows.clear()
+
+
+def read_xlsx(source, columns: list[str] | None = None) -> pd.DataFrame:
+    '''读取 xlsx 的第一个工作表，第一个非空行为表头，空行跳过；给出 columns 时读到表头就检查列是否一致'''
+    try:
+        rows = iter_rows(source)
+        header = next((row for row in rows if any(row)), [])
+        while header and header[-1] == '':
+            header.pop()
+        if columns is not None:
+            check_columns(columns, pd.DataFrame(columns=header))
+        width = len(header)
+        data = [(row + [''] * (width - len(row)))[:width] for row in rows if any(row)]
+    except (zipfile.BadZipFile, KeyError, expat.ExpatError) as error:
+        raise ValueError(f'无法读取 Excel 文件：{error}') from error
+    return pd.DataFrame(data, columns=header, dtype=str)
+
+
+# ------------------------------------------
+#  导出
+#  MARK: 导出
+# ------------------------------------------
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+ROOT_RELATIONSHIPS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+WORKBOOK_RELATIONSHIPS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="等线"/></font><font><b/><sz val="11"/><name val="等线"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="49" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="49" fontId="1" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyFont="1"/></cellXfs>
+</styleSheet>'''
+SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+              '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+              '</sheetView></sheetViews><sheetData>')
+SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def format_row(number: int, letters: list[str], values: Iterable, style: int) -> str:
+    '''一行的 xml，单元格为文本格式的内联字符串，空单元格不写'''
+    cells = []
+    for letter, value in zip(letters, values):
+        text = ILLEGAL_CHARACTERS.sub('', normalize_value(value))
+        if text:
+            cells.append(f'<c r="{letter}{number}" s="{style}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def write_xlsx(file: IO[bytes], columns: list[str], rows: Iterable[Iterable], sheet_name: str = 'Sheet1'):
+    '''把表头和逐行产生的数据写为 xlsx，写入时不保留已经写过的行；工作表名称最长 31 个字符'''
+    letters = [get_column_letter(number) for number in range(len(columns))]
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELATIONSHIPS)
+        archive.writestr('xl/workbook.xml', WORKBOOK.format(name=escape(sheet_name[:31], {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELATIONSHIPS)
+        archive.writestr('xl/styles.xml', STYLES)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_HEAD.encode('utf-8'))
+            sheet.write(format_row(1, letters, columns, 2).encode('utf-8'))
+            buffer = []
+            for number, row in enumerate(rows, 2):
+                buffer.append(format_row(number, letters, row, 1))
+                if len(buffer) >= CHUNK_SIZE:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer.clear()
+            sheet.write((''.join(buffer) + SHEET_TAIL).encode('utf-8'))
+
+
+def iter_frame(frame: pd.DataFrame) -> Iterator[list]:
+    '''按块把 DataFrame 转换为行，逐个遍历 pandas 的字符串列很慢'''
+    for start in range(0, len(frame), CHUNK_SIZE):
+        yield from frame.iloc[start:start + CHUNK_SIZE].to_numpy(dtype=object).tolist()
+
+
+def export_xlsx(frame: pd.DataFrame, sheet_name: str = 'Sheet1') -> bytes:
+    '''导出为 xlsx 的内容，先按行写入临时文件，下载按钮只接受 bytes 等类型，写完后整体读出'''
+    with tempfile.TemporaryFile() as file:
+        write_xlsx(file, [str(column) for column in frame.columns], iter_frame(frame), sheet_name)
+        file.seek(0)
+        return file.read()
+
+
+def export_csv(frame: pd.DataFrame) -> bytes:
+    '''导出为 csv 的内容，带 BOM 以便 Excel 直接打开时识别为 UTF-8'''
+    with tempfile.TemporaryFile() as file:
+        frame.to_csv(file, encoding='utf-8-sig', index=False, chunksize=CHUNK_SIZE)
+        file.seek(0)
+        return file.read()
+
+
+if __name__ == '__main__':
+    import io
+    import time
+    from pathlib import Path
+    from streamlit.elements.widgets.button import convert_data_to_bytes_and_infer_mime
+    from generate.record_merge import read_table
+    for csv_path in sorted((Path(__file__).parent.parent / 'database').glob('*.csv')):
+        frame = read_table(csv_path)
+        assert read_xlsx(io.BytesIO(export_xlsx(frame)), list(frame.columns)).equals(frame), csv_path
+        # 下载按钮点击时调用的函数的返回值必须是 st.download_button 能够处理的类型
+        for export in (export_xlsx, export_csv):
+            convert_data_to_bytes_and_infer_mime(export(frame), TypeError(f'{export.__name__} 返回的类型不能下载'))
+        assert read_table(io.BytesIO(export_csv(frame))).equals(frame), csv_path
+    frame = pd.DataFrame({'物料编码': [f'{number:06d}' for number in range(200000)], '物料名称': '螺栓<M8>&"垫圈"', '备注': ''})
+    started = time.perf_counter()
+    content = export_xlsx(frame)
+    exported = time.perf_counter()
+    result = read_xlsx(io.BytesIO(content), list(frame.columns))
+    print(f'20 万行：导出 {exported - started:.2f} s，导入 {time.perf_counter() - exported:.2f} s')
+    assert result.equals(frame)
+    try:
+        read_xlsx(io.BytesIO(export_xlsx(frame[['物料编码']])), list(frame.columns))
+    except ValueError as error:
+        print(error)
+    try:
+        read_xlsx(io.BytesIO(b'not a zip'))
+    except ValueError as error:
+        print(error)
+    print('Excel 检查通过')
@@ -0,0 +1,123 @@
+import io
+import re
+import copy
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from lxml import etree
+from jinja2 import Environment
+from docxtpl import DocxTemplate
+
+DOCUMENT_PART = 'word/document.xml'
+# 已经是压缩格式的媒体文件，重复压缩只会浪费时间
+STORED_SUFFIXES = {'.jpeg', '.jpg', '.png', '.gif', '.emf', '.wmf'}
+
+
+def get_file_digest(path: Path) -> str:
+    '''计算文件内容的哈希值'''
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompiledTemplate:
+    '''编译完成的 docx 模板
+
+    解析一次模板后保存：docxtpl 清理过的正文 jinja 模板、正文前后的 xml 片段，
+    以及除 document.xml 以外所有部件打包好的 zip，生成时只需要替换变量和追加正文。
+    '''
+
+    def __init__(self, path: Path, digest: str):
+        self.path = path
+        self.digest = digest
+        self.docx_template = DocxTemplate(path)
+        self.docx_template.render_init()
+        # 正文中的占位符被 Word 拆分到了多个 run 中，使用 docxtpl 的清理逻辑合并后再编译
+        body_xml = self.docx_template.patch_xml(self.docx_template.get_xml())
+        body_xml = re.sub(r'<w:p([ >])', r'\n<w:p\1', body_xml)
+        self.body = Environment(autoescape=True).from_string(body_xml)
+        # 正文以外的 document.xml 内容保持不变
+        root = copy.deepcopy(self.docx_template.docx.element)
+        for child in list(root.body):
+            root.body.remove(child)
+        head, tail = etree.tostring(root, encoding='unicode').split('<w:body/>')
+        self.head = head
+        self.tail = tail
+        self.package = self.build_package()
+
+    def build_package(self) -> bytes:
+        '''将模板中除正文外的部件预先打包，生成时在此基础上追加正文'''
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(buffer, mode='w') as target:
+            for info in source.infolist():
+                if info.filename == DOCUMENT_PART:
+                    continue
+                stored = Path(info.filename).suffix.lower() in STORED_SUFFIXES
+                target.writestr(
+                    info.filename,
+                    source.read(info),
+                    compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED,
+                )
+        return buffer.getvalue()
+
+    def render(self, context: dict):
+        '''替换模板中的变量，返回 document.xml 的根节点'''
+        body_xml = self.body.render(context)
+        body_xml = re.sub(r'\n<w:p([ >])', r'<w:p\1', body_xml)
+        body_xml = self.docx_template.resolve_listing(body_xml)
+        return etree.fromstring(f'{self.head}{body_xml}{self.tail}'.encode('utf-8'))
+
+    def save(self, root) -> bytes:
+        '''将渲染后的 document.xml 追加到预先打包的部件中，返回 docx 的字节流'''
+        buffer = io.BytesIO(self.package)
+        buffer.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(buffer, mode='a', compression=zipfile.ZIP_DEFLATED) as target:
+            target.writestr(DOCUMENT_PART, etree.tostring(root, encoding='UTF-8', standalone=True))
+        return buffer.getvalue()
+
+
+# ------------------------------------------
+#  进程内共享的模板缓存，按文件哈希区分版本
+#  MARK: 模板缓存
+# ------------------------------------------
+
+lock = threading.Lock()
+# 模板路径 -> ((修改时间, 文件大小), 文件哈希)
+file_stats: dict[Path, tuple[tuple[int, int], str]] = {}
+# 文件哈希 -> 编译好的模板
+compiled_templates: dict[str, CompiledTemplate] = {}
+
+
+def get_template_digest(path: Path) -> str:
+    '''获取模板文件的哈希值，修改时间和大小不变时不重新计算'''
+    path = path.absolute()
+    stat = path.stat()
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    with lock:
+        cached = file_stats.get(path)
+        if cached is None or cached[0] != stat_key:
+            digest = get_file_digest(path)
+            if cached is not None and cached[1] != digest:
+                compiled_templates.pop(cached[1], None)
+            file_stats[path] = (stat_key, digest)
+        return file_stats[path][1]
+
+
+def get_compiled_template(path: Path) -> CompiledTemplate:
+    '''获取编译好的模板，模板文件在磁盘上发生变化时自动重新编译'''
+    path = path.absolute()
+    digest = get_template_digest(path)
+    with lock:
+        if digest not in compiled_templates:
+            compiled_templates[digest] = CompiledTemplate(path, digest)
+        return compiled_templates[digest]
+
+
+def clear():
+    '''清空模板缓存'''
+    with lock:
+        file_stats.clear()
+        compiled_templates.clear()
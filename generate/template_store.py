@@ -0,0 +1,466 @@
+'''工序卡模板的 SQLite 存储
+
+模板、工步、动作和物料清单分表保存，模板编码、工序编码、适用车型和设计方案项建有索引。
+新增、修改和删除只写入对应模板的记录，不再整体重写所有模板；读取时每张表只查询一次。
+database/工序卡模板.json 仍然作为导入导出的格式，数据库不存在时自动从 json 导入。
+
+数据库使用 WAL 模式：每次修改只把改动的页追加到日志文件，提交时不立即 fsync，由后台线程定期
+执行检查点，把日志合并回数据库文件并清空日志（检查点过程中日志仍然保留，崩溃后重新打开时 SQLite
+会在数据库文件上重放日志）。为了让日志在两次合并之间保留，存储对象始终持有一个连接。
+
+每个模板有一个版本号，每次修改加一。修改和删除时带上读取时的版本号，版本号不一致说明其他人已经修改过，
+抛出 VersionConflict 而不是覆盖，由页面合并后重新保存。
+
+页面通过 get_template_store 共用同一个存储对象，读取所有模板的结果放在进程内的数据缓存中，
+以 SQLite 的 data_version 判断是否过期：任何连接（包括其他进程）提交修改后都会重新读取。
+
+运行方式：python -m generate.template_store export 工序卡模板.json
+'''
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import functools
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Iterator
+from generate.config import TEMPLATE_DB_PATH, TEMPLATE_CHECKPOINT_INTERVAL, TEMPLATE_JOURNAL_MAX_SIZE
+from generate.data_cache import get_data_cache
+
+json_path = Path(__file__).parent.parent / 'database' / '工序卡模板.json'
+
+# 模板字段与数据表列的对应关系
+TEMPLATE_FIELDS = [
+    ('模板编码', 'template_code'),
+    ('工序编码', 'process_code'),
+    ('工序名称', 'process_name'),
+    ('适用车型', 'vehicle_model'),
+    ('专业分类', 'classification'),
+    ('设计方案项', 'design_item'),
+]
+WORKSTEP_FIELDS = [
+    ('作业顺序', 'sequence'),
+    ('工步名称', 'name'),
+    ('资质要求', 'qualification'),
+    ('注意内容', 'notice'),
+    ('附件图片', 'attachment'),
+]
+WORKSTEP_FLAGS = [
+    ('是否关键工步', 'is_key'),
+    ('是否特殊过程', 'is_special'),
+    ('是否八防工序', 'is_eight_proof'),
+    ('是否五防工序', 'is_five_proof'),
+    ('是否关键质量控制点', 'is_quality_point'),
+]
+ACTION_FIELDS = [
+    ('作业动作编码', 'action_code'),
+    ('工艺参数要求', 'parameter'),
+    ('验证形式', 'verify_type'),
+    ('验证结果', 'verify_result'),
+]
+# 可以按值查找的字段，每个字段都有索引
+SEARCH_FIELDS = ['模板编码', '工序编码', '适用车型', '设计方案项']
+
+# 数据库的 user_version 不小于此值时表示已经导入过初始模板
+SEEDED_VERSION = 1
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    {', '.join(f'{column} TEXT' for _, column in TEMPLATE_FIELDS)},
+    extra TEXT,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS templates_template_code ON templates (template_code);
+CREATE INDEX IF NOT EXISTS templates_process_code ON templates (process_code);
+CREATE INDEX IF NOT EXISTS templates_vehicle_model ON templates (vehicle_model);
+CREATE INDEX IF NOT EXISTS templates_design_item ON templates (design_item);
+CREATE TABLE IF NOT EXISTS worksteps (
+    id INTEGER PRIMARY KEY,
+    template_id INTEGER NOT NULL REFERENCES templates (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sequence INTEGER,
+    name TEXT,
+    qualification TEXT,
+    notice TEXT,
+    attachment TEXT,
+    {', '.join(f'{column} INTEGER' for _, column in WORKSTEP_FLAGS)},
+    equipments TEXT NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS worksteps_template ON worksteps (template_id, position);
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    workstep_id INTEGER NOT NULL REFERENCES worksteps (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    {', '.join(f'{column} TEXT' for _, column in ACTION_FIELDS)},
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS actions_workstep ON actions (workstep_id, position);
+CREATE TABLE IF NOT EXISTS materials (
+    template_id INTEGER NOT NULL REFERENCES templates (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    material_code TEXT,
+    PRIMARY KEY (template_id, position)
+);
+'''
+
+
+def dump_extra(item: dict, known: set[str]) -> str | None:
+    '''表中没有对应列的字段保存为 json，导出时原样还原'''
+    extra = {key: value for key, value in item.items() if key not in known}
+    return json.dumps(extra, ensure_ascii=False, default=str) if extra else None
+
+
+class VersionConflict(RuntimeError):
+    '''保存时模板的版本号与读取时不一致，current 为最新的版本号，模板已被删除时为 None'''
+
+    def __init__(self, template_id: int, expected: int, current: int | None):
+        super().__init__(f'模板 {template_id} 已被其他人{'删除' if current is None else '修改'}（读取时版本 {expected}，最新版本 {current}）')
+        self.template_id = template_id
+        self.expected = expected
+        self.current = current
+
+
+def load_flag(value: int | None) -> bool | None:
+    return None if value is None else bool(value)
+
+
+class TemplateStore:
+    '''工序卡模板的存储，模板以自增的 id 标识（模板编码允许重复）'''
+
+    def __init__(self, path: Path = TEMPLATE_DB_PATH, seed_path: Path | None = json_path,
+                 checkpoint_interval: float = TEMPLATE_CHECKPOINT_INTERVAL, journal_max_size: int = TEMPLATE_JOURNAL_MAX_SIZE):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.journal_max_size = journal_max_size * 1024 * 1024
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 最后一个连接关闭时 SQLite 会合并并删除日志，这个连接保证日志一直保留，也用于执行检查点
+        self.keeper = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.keeper.execute('PRAGMA journal_mode = WAL')
+        self.keeper.executescript(SCHEMA)
+        # 旧版本的数据库没有版本号列
+        if 'version' not in {row[1] for row in self.keeper.execute('PRAGMA table_info(templates)')}:
+            self.keeper.execute('ALTER TABLE templates ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+            self.keeper.commit()
+        self.checkpoints = 0
+        self.closing = threading.Event()
+        self.thread = None
+        if checkpoint_interval > 0:
+            self.thread = threading.Thread(target=self.run_compactor, name='template-compactor', daemon=True)
+            self.thread.start()
+        if seed_path is not None and seed_path.exists():
+            self.seed(seed_path)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        '''打开一个连接，正常退出时提交事务，出错时回滚'''
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            connection.execute('PRAGMA foreign_keys = ON')
+            # WAL 模式下 NORMAL 只在检查点时 fsync，程序崩溃不会损坏数据库，断电时可能丢失最近的提交
+            connection.execute('PRAGMA synchronous = NORMAL')
+            if self.checkpoint_interval > 0:
+                # 提交时不自动合并日志，由后台线程负责
+                connection.execute('PRAGMA wal_autocheckpoint = 0')
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_journal_size(self) -> int:
+        '''WAL 日志的大小（字节）'''
+        journal_path = self.path.with_name(self.path.name + '-wal')
+        return journal_path.stat().st_size if journal_path.exists() else 0
+
+    def checkpoint(self) -> bool:
+        '''把日志合并回数据库文件并清空日志，有读取中的连接时只合并能合并的部分，返回是否全部完成'''
+        with self.lock:
+            busy, _, _ = self.keeper.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        self.checkpoints += 1
+        return not busy
+
+    def stats(self) -> dict:
+        return {'journal_size': self.get_journal_size(), 'checkpoints': self.checkpoints}
+
+    def close(self):
+        '''停止后台线程，合并日志后关闭'''
+        self.closing.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.checkpoint()
+        self.keeper.close()
+
+    def run_compactor(self):
+        '''后台线程：定期或日志过大时执行检查点'''
+        started = time.monotonic()
+        # 日志大小每秒检查一次，超过上限时不等到下一个周期
+        while not self.closing.wait(min(1.0, self.checkpoint_interval)):
+            size = self.get_journal_size()
+            if size == 0:
+                started = time.monotonic()
+                continue
+            if size > self.journal_max_size or time.monotonic() - started >= self.checkpoint_interval:
+                try:
+                    self.checkpoint()
+                except sqlite3.Error:
+                    # 数据库被其他进程锁定时下次再试
+                    continue
+                started = time.monotonic()
+
+    # ------------------------------------------
+    #  读取
+    #  MARK: 读取
+    # ------------------------------------------
+
+    def load(self, connection: sqlite3.Connection, where: str = '', params: tuple = (),
+             versions: dict[int, int] | None = None) -> dict[int, dict]:
+        '''读取满足条件的模板，每张表只查询一次，按 id 排序；传入 versions 时同时写入各模板的版本号'''
+        columns = ', '.join(column for _, column in TEMPLATE_FIELDS)
+        templates = {}
+        for row in connection.execute(f'SELECT id, {columns}, extra, version FROM templates {where} ORDER BY id', params):
+            item = {key: value for (key, _), value in zip(TEMPLATE_FIELDS, row[1:])}
+            item['工步'] = []
+            item['物料清单'] = []
+            item.update(json.loads(row[-2]) if row[-2] else {})
+            templates[row[0]] = item
+            if versions is not None:
+                versions[row[0]] = row[-1]
+        if not templates:
+            return templates
+        # 子表按模板 id 过滤，全部读取时不需要 IN 条件
+        ids = ', '.join(str(template_id) for template_id in templates)
+        condition = f'WHERE template_id IN ({ids})' if where else ''
+
+        worksteps = {}
+        fields = WORKSTEP_FIELDS + WORKSTEP_FLAGS
+        columns = ', '.join(column for _, column in fields)
+        query = f'SELECT id, template_id, {columns}, equipments, extra FROM worksteps {condition} ORDER BY template_id, position'
+        for row in connection.execute(query):
+            workstep = {}
+            for (key, column), value in zip(fields, row[2:]):
+                if column == 'attachment':
+                    value = None if value is None else json.loads(value)
+                elif (key, column) in WORKSTEP_FLAGS:
+                    value = load_flag(value)
+                workstep[key] = value
+            workstep['动作'] = []
+            workstep['工艺装备'] = json.loads(row[-2])
+            workstep.update(json.loads(row[-1]) if row[-1] else {})
+            templates[row[1]]['工步'].append(workstep)
+            worksteps[row[0]] = workstep
+
+        columns = ', '.join(column for _, column in ACTION_FIELDS)
+        query = f'SELECT workstep_id, {columns}, extra FROM actions'
+        if where:
+            query += f' WHERE workstep_id IN (SELECT id FROM worksteps {condition})'
+        for row in connection.execute(query + ' ORDER BY workstep_id, position'):
+            action = {key: value for (key, _), value in zip(ACTION_FIELDS, row[1:])}
+            action.update(json.loads(row[-1]) if row[-1] else {})
+            worksteps[row[0]]['动作'].append(action)
+
+        query = f'SELECT template_id, material_code FROM materials {condition} ORDER BY template_id, position'
+        for template_id, material_code in connection.execute(query):
+            templates[template_id]['物料清单'].append(material_code)
+        return templates
+
+    def get_all(self, versions: dict[int, int] | None = None) -> dict[int, dict]:
+        '''所有模板，按 id 排序'''
+        with self.connect() as connection:
+            return self.load(connection, versions=versions)
+
+    def get(self, template_id: int, versions: dict[int, int] | None = None) -> dict | None:
+        with self.connect() as connection:
+            return self.load(connection, 'WHERE id = ?', (template_id,), versions).get(template_id)
+
+    def get_data_version(self) -> int:
+        '''其他连接每提交一次修改，常驻连接看到的数据版本就会变化'''
+        with self.lock:
+            return self.keeper.execute('PRAGMA data_version').fetchone()[0]
+
+    def get_cached(self) -> tuple[dict[int, dict], dict[int, int]]:
+        '''所有模板及其版本号，进程内所有会话共用同一份，不能直接修改'''
+        def load():
+            versions = {}
+            return self.get_all(versions), versions
+        return get_data_cache().get((str(self.path.resolve()), 'templates'), self.get_data_version(), load)
+
+    def get_version(self, connection: sqlite3.Connection, template_id: int) -> int | None:
+        row = connection.execute('SELECT version FROM templates WHERE id = ?', (template_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def find(self, **values: str) -> dict[int, dict]:
+        '''按模板编码、工序编码、适用车型、设计方案项的值查找，多个条件同时满足，例如 find(适用车型='Tc1')'''
+        columns = dict(TEMPLATE_FIELDS)
+        for key in values:
+            if key not in SEARCH_FIELDS:
+                raise ValueError(f'不能按{key}查找，可以查找的字段：{'、'.join(SEARCH_FIELDS)}')
+        where = ' AND '.join(f'{columns[key]} = ?' for key in values)
+        with self.connect() as connection:
+            return self.load(connection, f'WHERE {where}' if where else '', tuple(values.values()))
+
+    def search(self, keyword: str, versions: dict[int, int] | None = None) -> dict[int, dict]:
+        '''查找任意一个可查找字段等于 keyword 的模板'''
+        columns = dict(TEMPLATE_FIELDS)
+        where = ' OR '.join(f'{columns[key]} = ?' for key in SEARCH_FIELDS)
+        with self.connect() as connection:
+            return self.load(connection, f'WHERE {where}', (keyword,) * len(SEARCH_FIELDS), versions)
+
+    # ------------------------------------------
+    #  写入
+    #  MARK: 写入
+    # ------------------------------------------
+
+    def insert_children(self, connection: sqlite3.Connection, template_id: int, item: dict):
+        '''写入一个模板的工步、动作和物料清单'''
+        known = {key for key, _ in WORKSTEP_FIELDS + WORKSTEP_FLAGS} | {'动作', '工艺装备'}
+        action_known = {key for key, _ in ACTION_FIELDS}
+        fields = WORKSTEP_FIELDS + WORKSTEP_FLAGS
+        columns = ', '.join(column for _, column in fields)
+        for position, workstep in enumerate(item.get('工步') or []):
+            values = []
+            for key, column in fields:
+                value = workstep.get(key)
+                if column == 'attachment' and value is not None:
+                    value = json.dumps(value, ensure_ascii=False, default=str)
+                values.append(value)
+            cursor = connection.execute(
+                f'INSERT INTO worksteps (template_id, position, {columns}, equipments, extra) '
+                f'VALUES (?, ?, {', '.join('?' * len(fields))}, ?, ?)',
+                (template_id, position, *values, json.dumps(workstep.get('工艺装备') or [], ensure_ascii=False),
+                 dump_extra(workstep, known)),
+            )
+            connection.executemany(
+                f'INSERT INTO actions (workstep_id, position, {', '.join(column for _, column in ACTION_FIELDS)}, extra) '
+                f'VALUES (?, ?, {', '.join('?' * len(ACTION_FIELDS))}, ?)',
+                [
+                    (cursor.lastrowid, index, *(action.get(key) for key, _ in ACTION_FIELDS), dump_extra(action, action_known))
+                    for index, action in enumerate(workstep.get('动作') or [])
+                ],
+            )
+        connection.executemany(
+            'INSERT INTO materials (template_id, position, material_code) VALUES (?, ?, ?)',
+            [(template_id, index, code) for index, code in enumerate(item.get('物料清单') or [])],
+        )
+
+    def get_template_values(self, item: dict) -> tuple:
+        known = {key for key, _ in TEMPLATE_FIELDS} | {'工步', '物料清单'}
+        return (*(item.get(key) for key, _ in TEMPLATE_FIELDS), dump_extra(item, known))
+
+    def add(self, item: dict, connection: sqlite3.Connection | None = None) -> int:
+        '''新增一个模板，返回模板 id'''
+        if connection is None:
+            with self.lock, self.connect() as connection:
+                return self.add(item, connection)
+        columns = ', '.join(column for _, column in TEMPLATE_FIELDS)
+        cursor = connection.execute(
+            f'INSERT INTO templates ({columns}, extra) VALUES ({', '.join('?' * (len(TEMPLATE_FIELDS) + 1))})',
+            self.get_template_values(item),
+        )
+        self.insert_children(connection, cursor.lastrowid, item)
+        return cursor.lastrowid
+
+    def update(self, template_id: int, item: dict, version: int | None = None) -> int:
+        '''修改一个模板：原地更新模板记录，重写该模板的工步、动作和物料清单，返回新的版本号
+
+        传入 version 时只有最新的版本号等于 version 才修改，否则抛出 VersionConflict。
+        '''
+        assignments = ', '.join(f'{column} = ?' for _, column in TEMPLATE_FIELDS)
+        condition = 'id = ?' if version is None else 'id = ? AND version = ?'
+        params = (template_id,) if version is None else (template_id, version)
+        with self.lock, self.connect() as connection:
+            cursor = connection.execute(
+                f'UPDATE templates SET {assignments}, extra = ?, version = version + 1 WHERE {condition}',
+                (*self.get_template_values(item), *params),
+            )
+            if cursor.rowcount == 0:
+                if version is None:
+                    raise KeyError(f'模板不存在：{template_id}')
+                raise VersionConflict(template_id, version, self.get_version(connection, template_id))
+            # 动作随工步级联删除
+            connection.execute('DELETE FROM worksteps WHERE template_id = ?', (template_id,))
+            connection.execute('DELETE FROM materials WHERE template_id = ?', (template_id,))
+            self.insert_children(connection, template_id, item)
+            return self.get_version(connection, template_id)  # type: ignore
+
+    def delete(self, template_id: int, version: int | None = None):
+        '''删除一个模板，工步、动作和物料清单级联删除
+
+        传入 version 时模板被其他人修改过则抛出 VersionConflict，已经被删除时不做处理。
+        '''
+        with self.lock, self.connect() as connection:
+            if version is None:
+                connection.execute('DELETE FROM templates WHERE id = ?', (template_id,))
+                return
+            cursor = connection.execute('DELETE FROM templates WHERE id = ? AND version = ?', (template_id, version))
+            current = self.get_version(connection, template_id)
+            if cursor.rowcount == 0 and current is not None:
+                raise VersionConflict(template_id, version, current)
+
+    # ------------------------------------------
+    #  json 导入导出
+    #  MARK: 导入导出
+    # ------------------------------------------
+
+    def seed(self, path: Path):
+        '''新建的数据库从 json 导入初始模板
+
+        是否导入在写事务中判断，多个进程同时启动时只有第一个导入，其余的等它提交后看到已经导入的标记。
+        导入后在 user_version 中记录，之后即使模板被全部删除也不会再次导入。
+        '''
+        with self.lock, self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if connection.execute('PRAGMA user_version').fetchone()[0] >= SEEDED_VERSION:
+                return
+            if connection.execute('SELECT 1 FROM templates LIMIT 1').fetchone() is None:
+                with open(path, mode='r', encoding='utf8') as file:
+                    for item in json.loads(file.read()):
+                        self.add(item, connection)
+            connection.execute(f'PRAGMA user_version = {SEEDED_VERSION}')
+
+    def import_items(self, items: list[dict], replace: bool = False) -> int:
+        '''导入模板列表，replace 为 True 时先清空已有的模板，返回导入的数量'''
+        with self.lock, self.connect() as connection:
+            if replace:
+                connection.execute('DELETE FROM templates')
+            for item in items:
+                self.add(item, connection)
+        return len(items)
+
+    def import_json(self, path: Path, replace: bool = False) -> int:
+        with open(path, mode='r', encoding='utf8') as file:
+            return self.import_items(json.loads(file.read()), replace)
+
+    def export_json(self) -> str:
+        '''导出为与 工序卡模板.json 相同格式的文本'''
+        return json.dumps(list(self.get_all().values()), indent=4, ensure_ascii=False, default=str)
+
+
+@functools.cache
+def get_template_store() -> TemplateStore:
+    '''进程内共用的工序卡模板数据库'''
+    return TemplateStore()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m generate.template_store', description='工序卡模板的导入导出')
+    parser.add_argument('command', choices=['import', 'export'], help='import：从 json 导入；export：导出为 json')
+    parser.add_argument('file', type=Path, help='json 文件的路径')
+    parser.add_argument('--replace', action='store_true', help='导入前清空已有的模板')
+    args = parser.parse_args(argv)
+    store = TemplateStore(seed_path=None, checkpoint_interval=0)
+    try:
+        if args.command == 'import':
+            print(f'导入了 {store.import_json(args.file, args.replace)} 个模板')
+        else:
+            args.file.write_text(store.export_json(), encoding='utf8')
+            print(f'已导出到 {args.file}')
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+'''工序卡的缩略图预览
+
+直接根据模板配置用 matplotlib 画出组装工序卡的大致版式（外框、表头、工步表格、物料清单），
+不需要完整生成 docx。缩略图按模板 id 和版本号缓存在内存和磁盘上，模板保存后版本号变化，自动重新绘制；
+缺少的缩略图在后台线程中绘制，绘制完成前先显示占位图，页面不需要等待。
+'''
+import io
+import base64
+import hashlib
+import warnings
+import threading
+import functools
+import contextlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib import font_manager
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from generate.config import THUMBNAIL_CACHE_PATH
+from generate.docx_api import FLAG_SYMBOLS
+from generate.template_store import get_template_store
+
+# 绘制逻辑变化时需要递增，使已经缓存的缩略图失效
+THUMBNAIL_VERSION = '1'
+# 缩略图的宽度（像素），高度按 A4 横向的比例计算
+THUMBNAIL_WIDTH = 480
+# 按顺序选择第一个已安装的中文字体
+FONT_FAMILIES = [
+    'Source Han Serif SC', 'Source Han Serif CN', 'Noto Serif CJK SC', 'SimSun', 'SimHei',
+    'Microsoft YaHei', 'Noto Sans CJK SC', 'WenQuanYi Zen Hei',
+]
+
+# A4 横向的页面尺寸及页边距（cm），与 Word 中的版式一致
+PAGE_WIDTH = 29.7
+PAGE_HEIGHT = 21.0
+LEFT = 2.2
+MARGIN = 0.5
+ROW_HEIGHT = 0.8
+# 工步表格的列名及宽度（cm）
+WORKSTEP_COLUMNS = [('序号', 1.2), ('工步名称', 4.0), ('状态要求', 3.0), ('操作过程', 6.0), ('控制点', 2.0), ('备注', 1.8)]
+MATERIAL_LEFT = 21.2
+# 还没有绘制好时显示的占位图
+PLACEHOLDER_URL = 'data:image/svg+xml;base64,' + base64.b64encode(
+    '<svg xmlns="http://www.w3.org/2000/svg" width="480" height="339"><rect width="100%" height="100%" fill="#f0f2f6"/>'
+    '<text x="50%" y="50%" font-size="40" fill="#808495" text-anchor="middle" dominant-baseline="middle">绘制中…</text></svg>'
+    .encode('utf-8')).decode('ascii')
+
+
+@functools.cache
+def get_font_families() -> tuple[str, ...]:
+    '''已安装的中文字体，都没有时使用 matplotlib 的默认字体'''
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    return tuple(family for family in FONT_FAMILIES if family in installed) or ('DejaVu Sans',)
+
+
+def clip(text: str, width: float, size: float) -> str:
+    '''按单元格宽度（cm）截断文字，字号为磅，中文字符近似按一个字号宽计算'''
+    limit = max(1, int(width / (size * 2.54 / 72)))
+    text = text.replace('\n', ' ')
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def draw_cell(ax, left: float, top: float, width: float, height: float, text: str,
+              size: float = 6, bold: bool = False, align: str = 'center'):
+    '''画一个带边框的单元格'''
+    ax.add_patch(Rectangle((left, top), width, height, fill=False, linewidth=0.4, edgecolor='black'))
+    if text:
+        x = left + width / 2 if align == 'center' else left + 0.15
+        ax.text(
+            x, top + height / 2, clip(text, width - 0.2, size), fontsize=size, fontweight='bold' if bold else 'normal',
+            ha=align, va='center', family=get_font_families(),
+        )
+
+
+def draw_card(item: dict) -> Figure:
+    '''画出组装工序卡的大致版式，坐标单位为 cm，原点在页面左上角'''
+    figure = Figure(figsize=(PAGE_WIDTH / 2.54, PAGE_HEIGHT / 2.54), dpi=THUMBNAIL_WIDTH / (PAGE_WIDTH / 2.54), facecolor='white')
+    ax = figure.add_axes((0, 0, 1, 1))
+    ax.set_xlim(0, PAGE_WIDTH)
+    ax.set_ylim(PAGE_HEIGHT, 0)
+    ax.axis('off')
+
+    # 外框及密级横幅
+    width = PAGE_WIDTH - LEFT - MARGIN
+    ax.add_patch(Rectangle((LEFT, MARGIN), width, PAGE_HEIGHT - 2 * MARGIN, fill=False, linewidth=1.2, edgecolor='black'))
+    ax.text(LEFT + 0.2, MARGIN + 0.35, '株机公司普通商密▲5年', fontsize=9, va='center', family=get_font_families())
+
+    # 表头：标题及工序信息
+    top = MARGIN + 0.8
+    draw_cell(ax, LEFT + 0.5, top, 4.0, 2 * ROW_HEIGHT, '组装工序卡', size=14, bold=True)
+    fields = [('工序名称', item.get('工序名称')), ('工序编码', item.get('工序编码')),
+              ('适用车型', item.get('适用车型')), ('专业分类', item.get('专业分类'))]
+    field_width = (width - 1.0 - 4.0) / len(fields)
+    for index, (label, value) in enumerate(fields):
+        left = LEFT + 4.5 + index * field_width
+        draw_cell(ax, left, top, field_width, ROW_HEIGHT, label, bold=True)
+        draw_cell(ax, left, top + ROW_HEIGHT, field_width, ROW_HEIGHT, str(value or ''))
+
+    # 工步表格，放不下的行省略
+    top += 2 * ROW_HEIGHT + 0.5
+    left = LEFT + 0.5
+    for name, column_width in WORKSTEP_COLUMNS:
+        draw_cell(ax, left, top, column_width, ROW_HEIGHT, name, bold=True)
+        left += column_width
+    worksteps = sorted(item.get('工步') or [], key=lambda ch: ch.get('作业顺序') or 0)
+    max_rows = int((PAGE_HEIGHT - MARGIN - 0.5 - top - ROW_HEIGHT) / ROW_HEIGHT)
+    for row, workstep in enumerate(worksteps[:max_rows]):
+        actions = '、'.join(
+            action['作业动作编码'] + (f'：{action['工艺参数要求']}' if action.get('工艺参数要求') else '')
+            for action in workstep.get('动作') or []
+        )
+        values = [
+            str(workstep.get('作业顺序') if workstep.get('作业顺序') is not None else ''),
+            str(workstep.get('工步名称') or ''),
+            str(workstep.get('注意内容') or ''),
+            actions,
+            ''.join(symbol for key, symbol in FLAG_SYMBOLS.items() if workstep.get(key)),
+            str(workstep.get('资质要求') or ''),
+        ]
+        left = LEFT + 0.5
+        for (_, column_width), value in zip(WORKSTEP_COLUMNS, values):
+            draw_cell(ax, left, top + (row + 1) * ROW_HEIGHT, column_width, ROW_HEIGHT, value,
+                      align='left' if column_width > 2.0 else 'center')
+            left += column_width
+    if len(worksteps) > max_rows:
+        ax.text(LEFT + 0.5, top + (max_rows + 1.5) * ROW_HEIGHT, f'…… 另有 {len(worksteps) - max_rows} 个工步',
+                fontsize=6, va='center', family=get_font_families())
+
+    # 物料清单
+    material_width = LEFT + width - 0.5 - MATERIAL_LEFT
+    draw_cell(ax, MATERIAL_LEFT, top, 1.2, ROW_HEIGHT, '序号', bold=True)
+    draw_cell(ax, MATERIAL_LEFT + 1.2, top, material_width - 1.2, ROW_HEIGHT, '物料清单', bold=True)
+    materials = item.get('物料清单') or []
+    for row, material in enumerate(materials[:max_rows]):
+        row_top = top + (row + 1) * ROW_HEIGHT
+        draw_cell(ax, MATERIAL_LEFT, row_top, 1.2, ROW_HEIGHT, str(row + 1))
+        draw_cell(ax, MATERIAL_LEFT + 1.2, row_top, material_width - 1.2, ROW_HEIGHT, str(material), align='left')
+    return figure
+
+
+def render_thumbnail(item: dict) -> bytes:
+    '''绘制缩略图，返回 PNG 的字节流'''
+    figure = draw_card(item)
+    buffer = io.BytesIO()
+    with warnings.catch_warnings():
+        # 没有中文字体的环境中缺字会产生大量警告，缩略图只是近似的版式，忽略即可
+        warnings.simplefilter('ignore')
+        FigureCanvasAgg(figure).print_png(buffer)
+    return buffer.getvalue()
+
+
+class ThumbnailRenderer:
+    '''按模板 id 和版本号缓存缩略图的 data URL，缺少的缩略图交给一个后台线程绘制
+
+    模板的版本号每次保存都会递增，页面上已经有每个模板的版本号，不需要再序列化模板内容计算哈希值。
+    每个模板只保留最新版本的缩略图；磁盘上的文件名带有数据库路径的哈希值，不同的数据库互不影响。
+    matplotlib 不保证线程安全，所以只用一个线程绘制。
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (数据库, 模板 id) -> (版本号, data URL)，绘制失败时 data URL 为 None，同一版本不再重试
+        self.urls: dict[tuple[str, int], tuple[int, str | None]] = {}
+        self.pending: set[tuple[str, int, int]] = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnail')
+
+    def get_path(self, scope: str, template_id: int, version: int) -> Path:
+        return THUMBNAIL_CACHE_PATH / f'{scope}-{template_id}-{version}-{THUMBNAIL_VERSION}.png'
+
+    def render(self, scope: str, template_id: int, version: int, item: dict):
+        '''在后台线程中绘制并保存缩略图，删除同一模板旧版本的文件'''
+        try:
+            data = render_thumbnail(item)
+            path = self.get_path(scope, template_id, version)
+            THUMBNAIL_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix('.tmp')
+            temp_path.write_bytes(data)
+            temp_path.replace(path)
+            url = to_url(data)
+            for old_path in THUMBNAIL_CACHE_PATH.glob(f'{scope}-{template_id}-*.png'):
+                if old_path != path:
+                    with contextlib.suppress(OSError):
+                        old_path.unlink()
+        except Exception as error:
+            warnings.warn(f'模板 {template_id} 的缩略图绘制失败：{error}', RuntimeWarning)
+            url = None
+        with self.lock:
+            self.pending.discard((scope, template_id, version))
+            if self.urls.get((scope, template_id), (-1, None))[0] <= version:
+                self.urls[(scope, template_id)] = (version, url)
+
+    def get_url(self, scope: str, template_id: int, version: int, item: dict) -> str | None:
+        '''已经绘制好的缩略图，还没有绘制时读取磁盘上的文件，都没有时提交后台绘制并返回占位图'''
+        with self.lock:
+            cached = self.urls.get((scope, template_id))
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            if (scope, template_id, version) in self.pending:
+                return PLACEHOLDER_URL
+        path = self.get_path(scope, template_id, version)
+        if path.exists():
+            url = to_url(path.read_bytes())
+            with self.lock:
+                self.urls[(scope, template_id)] = (version, url)
+            return url
+        with self.lock:
+            if (scope, template_id, version) not in self.pending:
+                self.pending.add((scope, template_id, version))
+                self.executor.submit(self.render, scope, template_id, version, item)
+        return PLACEHOLDER_URL
+
+    def has_pending(self) -> bool:
+        '''是否还有正在绘制的缩略图'''
+        with self.lock:
+            return bool(self.pending)
+
+
+def to_url(data: bytes) -> str:
+    return f'data:image/png;base64,{base64.b64encode(data).decode('ascii')}'
+
+
+@functools.cache
+def get_thumbnail_renderer() -> ThumbnailRenderer:
+    '''进程内共用的缩略图缓存'''
+    return ThumbnailRenderer()
+
+
+def get_thumbnail_urls(items: dict[int, dict], versions: dict[int, int]) -> list[str | None]:
+    '''模板数据库中一组模板的缩略图 data URL，用于表格中的图片列，顺序与 items 相同，还没有绘制好的为占位图'''
+    scope = hashlib.sha1(str(get_template_store().path.resolve()).encode('utf-8')).hexdigest()[:8]
+    renderer = get_thumbnail_renderer()
+    return [renderer.get_url(scope, template_id, versions[template_id], item) for template_id, item in items.items()]
+
+
+if __name__ == '__main__':
+    import time
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        THUMBNAIL_CACHE_PATH = Path(directory)
+        renderer = ThumbnailRenderer()
+        item = {'工序名称': '安装', '工序编码': 'A1', '工步': [{'作业顺序': 1, '工步名称': '紧固'}], '物料清单': ['螺栓']}
+        started = time.perf_counter()
+        assert renderer.get_url('test', 1, 1, item) == PLACEHOLDER_URL
+        print(f'提交绘制 {(time.perf_counter() - started) * 1000:.2f} ms')
+        while renderer.has_pending():
+            time.sleep(0.05)
+        url = renderer.get_url('test', 1, 1, item)
+        assert url is not None and url.startswith('data:image/png')
+        started = time.perf_counter()
+        for _ in range(1000):
+            renderer.get_url('test', 1, 1, item)
+        print(f'命中 {(time.perf_counter() - started):.3f} ms/行')
+        assert ThumbnailRenderer().get_url('test', 1, 1, item) == url
+        assert renderer.get_url('test', 1, 2, item | {'工步': item['工步'] * 2}) == PLACEHOLDER_URL
+        while renderer.has_pending():
+            time.sleep(0.05)
+        assert [path.name for path in Path(directory).glob('*.png')] == [f'test-1-2-{THUMBNAIL_VERSION}.png']
+        assert renderer.get_url('test', 1, 2, item) not in (url, PLACEHOLDER_URL)
+    print('缩略图检查通过')
@@ -0,0 +1,80 @@
+'''在能够 import uno 的 python 中运行的 LibreOffice 转换进程
+
+uno 模块只有 LibreOffice 自带的 python（或安装了 python3-uno 的系统 python）才有，页面所在的 python 一般没有，
+所以由 pdf_converter 用这样的 python 单独启动本脚本，连接常驻的 soffice 进程后按行读取转换请求：
+
+    python uno_bridge.py <端口> <连接超时秒数>
+
+标准输入每行一个 json：{"docx": ..., "pdf": ...}，标准输出每行返回 {"ok": true} 或 {"ok": false, "error": ...}；
+连接成功后先输出一行 {"ready": true}。标准输入关闭后退出 LibreOffice。
+LibreOffice 自带的 python 版本可能较旧，本文件只使用标准库，也不使用新版本的语法。
+'''
+import sys
+import json
+import time
+import uno
+from com.sun.star.beans import PropertyValue
+
+
+def make_property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def connect(port, timeout):
+    '''连接 soffice 的 UNO 接口，soffice 还在启动时重试'''
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local_context)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            context = resolver.resolve('uno:socket,host=127.0.0.1,port=%d;urp;StarOffice.ComponentContext' % port)
+            break
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+    return context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+
+
+def convert(desktop, docx_path, pdf_path):
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(docx_path), '_blank', 0, (make_property('Hidden', True),),
+    )
+    try:
+        document.storeToURL(uno.systemPathToFileUrl(pdf_path), (make_property('FilterName', 'writer_pdf_Export'),))
+    finally:
+        document.close(True)
+
+
+def reply(message):
+    sys.stdout.write(json.dumps(message, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    try:
+        desktop = connect(int(sys.argv[1]), float(sys.argv[2]))
+    except Exception as error:
+        reply({'ready': False, 'error': str(error)})
+        return 1
+    reply({'ready': True})
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            convert(desktop, request['docx'], request['pdf'])
+        except Exception as error:
+            reply({'ok': False, 'error': str(error) or type(error).__name__})
+        else:
+            reply({'ok': True})
+    try:
+        desktop.terminate()
+    except Exception:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,487 @@
+'''常驻的渲染工作进程池
+
+每个工作进程只打开一次渲染会话（例如只启动一次 Word），之后连续生成多份工序卡。
+请求先进入队列，由监督线程分配给空闲的工作进程，监督线程同时负责：
+
+- 工作进程生成指定份数或占用内存超过上限后，正常退出并启动新的进程替换；
+- 定期对空闲的工作进程做健康检查，检查失败的进程会被替换；
+- 渲染超时或异常退出的工作进程会被强制结束，对应的请求返回错误。
+
+进程池与具体的渲染后端无关，工作进程通过后端的 open_session 打开会话。
+
+运行方式：python -m generate.worker_pool，使用 docx 后端和假的 Word 对象检查进程池
+'''
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+import traceback
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from generate.config import (
+    RENDER_BACKEND, POOL_SIZE, POOL_MAX_TASKS, POOL_MAX_MEMORY, RENDER_TIMEOUT, HEALTH_CHECK_INTERVAL,
+)
+
+# 工作进程启动失败后，等待多久（秒）再重新启动
+RESTART_DELAY = 1.0
+# 监督线程每轮等待消息的最长时间（秒）
+POLL_INTERVAL = 0.1
+
+
+class WorkerError(RuntimeError):
+    '''工作进程渲染失败、超时或异常退出'''
+
+
+def get_memory_usage() -> int:
+    '''获取当前进程占用的内存（字节），无法获取时返回 0'''
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def open_backend_session(backend: str | None):
+    '''打开指定渲染后端的会话'''
+    from generate.renderer import get_renderer
+    return get_renderer(backend).open_session()
+
+
+def run_worker(connection, session_factory, args: tuple):
+    '''工作进程的主循环：打开会话后依次处理收到的命令，直到收到 stop 或连接断开'''
+    try:
+        session = session_factory(*args)
+    except Exception:
+        connection.send(('error', traceback.format_exc(), get_memory_usage()))
+        return
+    try:
+        connection.send(('ready', None, get_memory_usage()))
+        while True:
+            try:
+                command, payload = connection.recv()
+            except EOFError:
+                break
+            if command == 'stop':
+                break
+            if command == 'ping':
+                healthy = session.is_healthy()
+                connection.send(('ok' if healthy else 'error', '健康检查失败', get_memory_usage()))
+                continue
+            try:
+                result = session.render_to_bytes(payload)
+            except Exception:
+                connection.send(('error', traceback.format_exc(), get_memory_usage()))
+            else:
+                connection.send(('ok', result, get_memory_usage()))
+    finally:
+        session.close()
+
+
+class Worker:
+    '''监督线程中的一个工作进程及其当前状态'''
+
+    def __init__(self, context, session_factory, args: tuple):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_worker, args=(child_connection, session_factory, args), daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+        # 正在执行的命令及对应的请求，健康检查没有对应的请求
+        self.command: str | None = 'start'
+        self.future: Future | None = None
+        self.started = time.monotonic()
+        self.checked = time.monotonic()
+        self.tasks = 0
+        self.memory = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.ready and self.command is None
+
+    def send(self, command: str, payload=None, future: Future | None = None):
+        # 先记录请求，发送失败时 replace 让这个请求返回错误，而不是一直处于运行中
+        self.command = command
+        self.future = future
+        self.started = time.monotonic()
+        self.connection.send((command, payload))
+
+    def kill(self):
+        '''强制结束工作进程'''
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self, timeout: float):
+        '''通知工作进程关闭会话后退出，超时未退出时强制结束'''
+        try:
+            self.connection.send(('stop', None))
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class RenderPool:
+    '''常驻的渲染工作进程池
+
+    backend 为渲染后端名称，为空时使用配置中的后端；session_factory 与 args 用于替换打开会话的方式，
+    例如使用假的 Word 对象检查进程池，session_factory 必须是可以被 pickle 的模块级函数。
+    max_memory 的单位为 MB，0 表示不限制。
+    '''
+
+    def __init__(self, backend: str | None = None, size: int = POOL_SIZE, max_tasks: int = POOL_MAX_TASKS,
+                 max_memory: int = POOL_MAX_MEMORY, timeout: float = RENDER_TIMEOUT,
+                 health_interval: float = HEALTH_CHECK_INTERVAL, session_factory=None, args: tuple = ()):
+        self.size = max(1, size)
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory * 1024 * 1024
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.backend = backend or RENDER_BACKEND
+        if session_factory is None:
+            session_factory, args = open_backend_session, (self.backend,)
+        self.session_factory = session_factory
+        self.args = args
+        # 使用 spawn 启动工作进程，与 Windows 的行为一致，也避免复制 streamlit 进程中的线程状态
+        self.context = multiprocessing.get_context('spawn')
+        self.requests: queue.Queue[tuple[Future, dict]] = queue.Queue()
+        self.workers: list[Worker | None] = []
+        self.restart_at: list[float] = []
+        self.lock = threading.Lock()
+        self.wakeup_reader, self.wakeup_writer = self.context.Pipe(duplex=False)
+        self.thread: threading.Thread | None = None
+        self.closing = False
+        self.counters = {'completed': 0, 'failed': 0, 'timeouts': 0, 'recycled': 0, 'crashed': 0}
+
+    def __enter__(self) -> 'RenderPool':
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self) -> 'RenderPool':
+        '''启动工作进程和监督线程'''
+        with self.lock:
+            if self.thread is not None:
+                return self
+            self.workers = [self.spawn() for _ in range(self.size)]
+            self.restart_at = [0.0] * self.size
+            self.thread = threading.Thread(target=self.supervise, name='render-pool', daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+        return self
+
+    def submit(self, item: dict) -> Future:
+        '''提交一份工序卡的渲染请求，返回结果为 docx 字节流的 Future'''
+        future = Future()
+        with self.lock:
+            if self.closing:
+                raise RuntimeError('渲染进程池已经关闭')
+            self.requests.put((future, item))
+            self.wakeup_writer.send(None)
+        return future
+
+    def render(self, item: dict, timeout: float | None = None) -> bytes:
+        '''渲染一份工序卡，等待并返回 docx 字节流'''
+        return self.submit(item).result(timeout)
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        '''等待所有工作进程打开会话，超时返回 False'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.stats()['ready'] < self.size:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def stats(self) -> dict:
+        '''进程池的运行统计'''
+        with self.lock:
+            workers = [worker for worker in self.workers if worker is not None]
+            return self.counters | {
+                'workers': len(workers),
+                'ready': sum(worker.ready for worker in workers),
+                'busy': sum(not worker.idle for worker in workers),
+                'queued': self.requests.qsize(),
+            }
+
+    def close(self):
+        '''停止接收请求，未开始的请求返回错误，并关闭所有工作进程'''
+        with self.lock:
+            if self.closing:
+                return
+            self.closing = True
+            self.wakeup_writer.send(None)
+        if self.thread is not None:
+            self.thread.join()
+        atexit.unregister(self.close)
+
+    # ------------------------------------------
+    #  监督线程
+    #  MARK: 监督线程
+    # ------------------------------------------
+
+    def spawn(self) -> Worker:
+        return Worker(self.context, self.session_factory, self.args)
+
+    def supervise(self):
+        '''监督线程的主循环'''
+        while not self.closing:
+            self.restart_workers()
+            self.dispatch()
+            self.collect()
+            self.check_timeouts()
+            self.check_health()
+        self.shutdown()
+
+    def restart_workers(self):
+        '''为空出的位置启动新的工作进程'''
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if worker is None and now >= self.restart_at[index]:
+                self.workers[index] = self.spawn()
+
+    def dispatch(self):
+        '''把队列中的请求分配给空闲的工作进程'''
+        for worker in self.workers:
+            if worker is None or not worker.idle:
+                continue
+            while True:
+                try:
+                    future, item = self.requests.get_nowait()
+                except queue.Empty:
+                    return
+                # 已经取消的请求直接丢弃
+                if future.set_running_or_notify_cancel():
+                    break
+            try:
+                worker.send('render', item, future)
+            except OSError:
+                self.replace(worker, WorkerError('工作进程异常退出'), 'crashed')
+
+    def collect(self):
+        '''接收工作进程返回的消息'''
+        connections = {worker.connection: worker for worker in self.workers if worker is not None}
+        for connection in wait([self.wakeup_reader, *connections], timeout=POLL_INTERVAL):
+            if connection is self.wakeup_reader:
+                while self.wakeup_reader.poll():
+                    self.wakeup_reader.recv()
+                continue
+            worker = connections[connection]
+            try:
+                status, payload, memory = connection.recv()
+            except (EOFError, OSError):
+                self.replace(worker, WorkerError('工作进程异常退出'), 'crashed')
+                continue
+            worker.memory = memory
+            self.handle(worker, status, payload)
+
+    def handle(self, worker: Worker, status: str, payload):
+        '''处理工作进程返回的一条消息'''
+        command, future = worker.command, worker.future
+        worker.command = worker.future = None
+        if command == 'start':
+            if status == 'ready':
+                worker.ready = True
+            else:
+                # 会话打开失败时让一个排队的请求带上错误返回，避免请求无限等待
+                self.replace(worker, None, 'crashed', delay=RESTART_DELAY)
+                self.fail_next(WorkerError(f'渲染会话启动失败：\n{payload}'))
+            return
+        worker.checked = time.monotonic()
+        if command == 'ping':
+            if status != 'ok':
+                self.replace(worker, None, 'crashed')
+            return
+        worker.tasks += 1
+        if status == 'ok':
+            self.counters['completed'] += 1
+            future.set_result(payload)
+        else:
+            self.counters['failed'] += 1
+            future.set_exception(WorkerError(payload))
+        if worker.tasks >= self.max_tasks or (self.max_memory and worker.memory > self.max_memory):
+            self.retire(worker)
+
+    def check_timeouts(self):
+        '''强制结束启动或渲染超时的工作进程'''
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker is None or worker.command is None:
+                continue
+            if now - worker.started > self.timeout:
+                self.replace(worker, WorkerError(f'渲染超过 {self.timeout} 秒未完成'), 'timeouts')
+
+    def check_health(self):
+        '''对长时间空闲的工作进程做健康检查'''
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker is None or not worker.idle:
+                continue
+            if not worker.process.is_alive():
+                self.replace(worker, None, 'crashed')
+            elif now - worker.checked > self.health_interval:
+                try:
+                    worker.send('ping')
+                except OSError:
+                    self.replace(worker, None, 'crashed')
+
+    def replace(self, worker: Worker, error: Exception | None, counter: str, delay: float = 0.0):
+        '''强制结束工作进程，正在处理的请求返回错误，之后在原位置启动新的进程'''
+        index = self.workers.index(worker)
+        worker.kill()
+        if worker.future is not None:
+            self.counters['failed'] += 1
+            worker.future.set_exception(error or WorkerError('工作进程异常退出'))
+        self.counters[counter] += 1
+        self.workers[index] = None
+        self.restart_at[index] = time.monotonic() + delay
+
+    def retire(self, worker: Worker):
+        '''让工作进程正常退出（例如退出 Word），并在原位置启动新的进程'''
+        index = self.workers.index(worker)
+        self.counters['recycled'] += 1
+        # 退出 Word 可能需要几秒，在后台等待，不阻塞其他请求
+        threading.Thread(target=worker.stop, args=(self.timeout,), daemon=True).start()
+        self.workers[index] = self.spawn()
+
+    def fail_next(self, error: Exception):
+        '''让队列中的下一个请求返回错误'''
+        try:
+            future, _ = self.requests.get_nowait()
+        except queue.Empty:
+            return
+        if future.set_running_or_notify_cancel():
+            self.counters['failed'] += 1
+            future.set_exception(error)
+
+    def shutdown(self):
+        '''关闭所有工作进程，未完成的请求返回错误'''
+        for worker in self.workers:
+            if worker is None:
+                continue
+            if worker.future is not None:
+                worker.future.set_exception(WorkerError('渲染进程池已经关闭'))
+            worker.stop(self.timeout)
+        self.workers = []
+        while True:
+            try:
+                future, _ = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(WorkerError('渲染进程池已经关闭'))
+
+
+# ------------------------------------------
+#  使用假的 Word 对象检查进程池，不需要安装 Office
+#  MARK: 自检
+# ------------------------------------------
+
+class FakeCOMObject:
+    '''假的 COM 对象：任意属性的读写和调用都可以进行，SaveAs 时写出一个占位文件'''
+
+    def __init__(self, delay: float = 0.0):
+        object.__setattr__(self, 'delay', delay)
+
+    def __getattr__(self, name: str):
+        if name == 'SaveAs':
+            return self.save_as
+        return FakeCOMObject(self.delay)
+
+    def __setattr__(self, name: str, value):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return FakeCOMObject(self.delay)
+
+    def __iter__(self):
+        return iter(())
+
+    def __add__(self, other):
+        return self
+
+    __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = __truediv__ = __rtruediv__ = __add__
+
+    def save_as(self, file_name: str, FileFormat: int = 12):
+        time.sleep(self.delay)
+        Path(file_name).write_bytes(b'PK\x03\x04fake')
+
+
+class FakeDispatch:
+    '''代替 win32com.client.Dispatch，返回假的 Word 应用程序'''
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def __call__(self, prog_id: str) -> FakeCOMObject:
+        return FakeCOMObject(self.delay)
+
+
+def open_fake_word_session(delay: float = 0.0):
+    '''打开一个使用假 Word 对象的会话，delay 为每份工序卡 SaveAs 时的等待时间'''
+    from generate.renderer import WordSession
+    return WordSession(FakeDispatch(delay))
+
+
+def run_check() -> list[str]:
+    '''检查进程池的分配、重启和超时，返回发现的问题'''
+    from generate.conformance import get_sample_items, compare
+    from generate.renderer import get_renderer
+    problems = []
+    items = get_sample_items()
+    docx_renderer = get_renderer('docx')
+
+    # docx 后端：进程池的结果与直接渲染一致，生成 2 份后重启
+    with RenderPool('docx', size=2, max_tasks=2) as pool:
+        futures = [pool.submit(item) for item in items * 2]
+        results = [future.result(60) for future in futures]
+        for index, (item, result) in enumerate(zip(items * 2, results)):
+            problems.extend(compare(f'docx 请求 {index + 1}', docx_renderer.render_to_bytes(item), result))
+        stats = pool.stats()
+        if stats['completed'] != len(futures) or stats['recycled'] < len(futures) // 2 - 1:
+            problems.append(f'docx：统计不正确 {stats}')
+
+    # 假的 Word：空闲时做健康检查，且在同一个 Word 中连续生成
+    with RenderPool(size=1, max_tasks=100, health_interval=0.2, session_factory=open_fake_word_session) as pool:
+        if pool.render({}, timeout=30)[:2] != b'PK':
+            problems.append('word：假的 Word 没有生成文件')
+        time.sleep(0.6)
+        pool.render({}, timeout=30)
+        stats = pool.stats()
+        if stats['recycled'] or stats['crashed']:
+            problems.append(f'word：工作进程不应被替换 {stats}')
+
+    # 假的 Word：渲染超时的进程被结束，之后的请求由新的进程处理
+    with RenderPool(size=1, timeout=3, session_factory=open_fake_word_session, args=(10.0,)) as pool:
+        try:
+            pool.render({}, timeout=30)
+            problems.append('word：渲染超时没有返回错误')
+        except WorkerError:
+            pass
+        if pool.stats()['timeouts'] != 1:
+            problems.append(f'word：超时统计不正确 {pool.stats()}')
+    return problems
+
+
+if __name__ == '__main__':
+    problems = run_check()
+    for problem in problems:
+        print(problem)
+    print('进程池检查通过' if not problems else f'发现 {len(problems)} 个问题')
+    sys.exit(1 if problems else 0)
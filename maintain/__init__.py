@@ -1,48 +1,134 @@
 import streamlit as st
 import pandas as pd
 from pathlib import Path
+from generate.data_cache import get_data_cache, read_csv
+from generate.record_merge import apply_diff, diff_frames, read_table, save_rows
+from generate.spreadsheet import export_csv, export_xlsx, read_xlsx
 
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_data(path: Path):
-    '''获取本地csv中的数据'''
-    return pd.read_csv(path, encoding='utf-8')
+def get_data(path: Path) -> pd.DataFrame:
+    '''获取本地csv中的数据，整个服务共用一份，文件变化后自动重新读取'''
+    return read_csv(path)
+
+
+def show_cache_stats():
+    '''显示进程内数据缓存的占用和命中率'''
+    stats = get_data_cache().stats()
+    st.metric('命中率', f'{stats['hit_ratio']:.1%}', help=f'命中 {stats['hits']} 次，加载 {stats['misses']} 次')
+    st.metric('占用内存', f'{stats['memory'] / 1024 / 1024:.2f} MB', help=f'共 {stats['entries']} 份数据')
+    st.dataframe(
+        pd.DataFrame({'数据': list(stats['items']), '占用(KB)': [size / 1024 for size in stats['items'].values()]}),
+        hide_index=True,
+    )
+
+
+def import_preview(path: Path, uploaded_file) -> bool:
+    '''按编码比较上传的数据与现有数据，显示新增、修改、删除的行，确认后只应用这些行，返回上传的文件是否已经处理完'''
+    cached = st.session_state.get(f'diff_{path.stem}')
+    if cached is None or cached[0] != uploaded_file.file_id:
+        try:
+            current = read_table(path)
+            if uploaded_file.name.lower().endswith('.xlsx'):
+                # Excel 读到表头就检查列，不一致时不再读取后面的行
+                incoming = read_xlsx(uploaded_file, list(current.columns))
+            else:
+                incoming = read_table(uploaded_file)
+            diff = diff_frames(current, incoming)
+        except ValueError as error:
+            st.error(f'无法导入：{error}')
+            return False
+        st.session_state[f'diff_{path.stem}'] = cached = (uploaded_file.file_id, diff)
+    diff = cached[1]
+    with st.container(border=True):
+        st.markdown('**上传的数据与现有数据的比较**')
+        delete = st.toggle('删除上传的数据中没有的行', help='上传的只是部分数据时不要开启')
+        st.info(diff.summary(delete))
+        frames = [diff.inserts, diff.updates, diff.deletes] if delete else [diff.inserts, diff.updates]
+        for tab, frame in zip(st.tabs([f'{name}（{len(frame)}）' for name, frame in zip(['新增', '修改', '删除'], frames)]), frames):
+            with tab:
+                st.dataframe(frame.reset_index(drop=True), hide_index=True)
+        with st.container(horizontal=True):
+            confirm_label = st.button('确认导入', icon=':material/check:', disabled=not any(len(frame) for frame in frames))
+            cancel_label = st.button('取消导入', icon=':material/close:')
+    if confirm_label:
+        count, conflicts = apply_diff(path, diff, delete)
+        st.session_state[f'conflicts_{path.stem}'] = conflicts
+        st.session_state[f'message_{path.stem}'] = f'导入成功，改动了{count}行' + (f'，{len(conflicts)}行冲突' if conflicts else '')
+    elif not cancel_label:
+        return False
+    st.session_state.pop(f'diff_{path.stem}', None)
+    return True
 
 
 def page_make(path: Path):
     '''通用的基础资料维护页面生成'''
-    st.info('少量的维护可以直接在页面更改，大量更新建议下载模板进行更新，模板中会带有现有的数据，目前没有做excel的处理，需要将excel导出为csv才能上传')
-    st.warning('目前没有做多人同时操作的隔离，所以需要注意维护数据时的冲突问题')
+    st.info('少量的维护可以直接在页面更改，大量更新建议下载模板修改后上传，上传后按编码与现有数据比较，确认后只应用新增、修改、删除的行，'
+            '支持 Excel（.xlsx）和 csv，Excel 只读取第一个工作表')
+    st.caption('多人同时维护时，保存只写入自己修改的行；其他人已经修改了同一行时保留其他人的内容，并提示冲突的行')
     num_rows = 'fixed'
-    temp_data = get_data(path)
+    # 编辑中的数据固定为开始编辑时的版本，没有未保存的修改时显示最新的数据
+    generation = st.session_state.get(f'generation_{path.stem}', 0)
+    editor_key = f'editor_{path.stem}_{generation}'
+    editor_state = st.session_state.get(editor_key) or {}
+    latest_data = get_data(path)
+    if not any(editor_state.get(name) for name in ('edited_rows', 'added_rows', 'deleted_rows')) \
+            or f'base_{path.stem}' not in st.session_state:
+        st.session_state[f'base_{path.stem}'] = latest_data
+    temp_data = st.session_state[f'base_{path.stem}']
+    if temp_data is not latest_data:
+        st.caption('其他人已经更新了数据，保存时只合并你修改的行，放弃修改后显示最新的数据')
+    conflicts = st.session_state.pop(f'conflicts_{path.stem}', None)
+    if conflicts:
+        st.warning('以下行其他人已经修改，没有写入你的修改，请确认最新的数据后重新修改：\n\n' +
+                   '\n'.join(f'- {conflict}' for conflict in conflicts))
+    message = st.session_state.pop(f'message_{path.stem}', None)
+    if message is not None:
+        st.toast(message, icon='🚨' if conflicts else '🎉')
     with st.container(horizontal=True):
         with st.container(width='content'):
+            # 点击下载时才生成文件
             st.download_button(
                 label='下载批量更新模板',
-                data=temp_data.to_csv().encode('utf-8'),
-                file_name='模板.csv',
+                data=lambda: export_xlsx(temp_data, path.stem),
+                file_name=f'{path.stem}.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                icon=':material/download:',
+            )
+            st.download_button(
+                label='下载 csv 格式',
+                data=lambda: export_csv(temp_data),
+                file_name=f'{path.stem}.csv',
                 mime='text/csv',
                 icon=':material/download:',
+                type='tertiary',
             )
-            refresh_label = st.button('手动刷新页面缓存', icon=':material/refresh:')
+            refresh_label = st.button('放弃修改并刷新', icon=':material/refresh:')
             save_label = st.button('保存到后台中', icon=':material/save:')
+            with st.popover('缓存统计', icon=':material/memory:'):
+                show_cache_stats()
 
         with st.container():
-            uploaded_file = st.file_uploader('**上传批量更新的数据**', type=['csv'])
+            uploaded_file = st.file_uploader('**上传批量更新的数据**', type=['xlsx', 'csv'], key=f'upload_{path.stem}_{generation}')
             add_label = st.toggle('启用新增(会导致排序功能失效，不影响修改)')
 
     if add_label:
         num_rows = 'dynamic'
-    change_df = st.data_editor(get_data(path), height='content', num_rows=num_rows, hide_index=True)
+    change_df = st.data_editor(temp_data, height='content', num_rows=num_rows, hide_index=True, key=editor_key)
 
     if save_label:
-        change_df.to_csv(path, encoding='utf-8', index=False)
-        get_data.clear()
-        st.toast('保存成功', icon='🎉')
-    if refresh_label:
-        get_data.clear()
-        st.toast('缓存刷新成功', icon='🎉')
-    if not uploaded_file is None:
-        pd.read_csv(uploaded_file, encoding='utf-8').to_csv(path, encoding='utf-8', index=False)
-        get_data.clear()
-        st.toast('更新数据成功', icon='🎉')
+        # 与开始编辑时的数据比较，只把改动的行合并到最新的文件中
+        count, conflicts = save_rows(path, temp_data, change_df)
+        st.session_state[f'conflicts_{path.stem}'] = conflicts
+        if conflicts:
+            st.session_state[f'message_{path.stem}'] = f'保存成功，{len(conflicts)}行与其他人的修改冲突，未写入'
+        else:
+            st.session_state[f'message_{path.stem}'] = f'保存成功，共{count}行'
+    elif refresh_label:
+        get_data_cache().invalidate(path)
+        st.session_state[f'message_{path.stem}'] = '刷新成功'
+    elif uploaded_file is None or not import_preview(path, uploaded_file):
+        return
+    # 换一个新的编辑器和上传框，丢弃已经保存或放弃的修改
+    st.session_state[f'generation_{path.stem}'] = generation + 1
+    st.session_state.pop(f'base_{path.stem}', None)
+    st.rerun()
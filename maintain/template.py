@@ -1,50 +1,52 @@
 import streamlit as st
 import pandas as pd
 import json
-from typing import Any
-from pathlib import Path
+import copy
+from typing import Any, Callable
+from generate.thumbnail import PLACEHOLDER_URL, get_thumbnail_renderer, get_thumbnail_urls
+from generate.template_store import VersionConflict, get_template_store
+from generate.data_cache import get_data_cache
+from generate.record_merge import merge_template
+from generate.reference_index import get_reference_index
+from generate.reference_check import check_references, get_dangling_references
 
-root_path = Path(__file__).parent.parent / 'database'
-path = root_path / '工序卡模板.json'
-action_path = root_path / '作业动作库基础资料.csv'
-configuration_poath = root_path / '构型与设计方案项基础资料.csv'
-equipment_path = root_path / '工艺装备基础资料.csv'
-material_path = root_path / '物料基础资料.csv'
 
+def get_template_data() -> tuple[dict[int, dict], dict[int, int]]:
+    '''获取模板数据库中的所有模板及其版本号，键为模板 id，所有会话共用，修改前需要复制'''
+    return get_template_store().get_cached()
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_template_data() -> dict:
-    '''获取本地模板配置文件中的数据'''
-    with open(path, mode='r', encoding='utf8') as file:
-        return json.loads(file.read())
 
+@st.fragment(run_every=1)
+def wait_thumbnails():
+    '''缩略图在后台绘制，全部绘制完成后重新运行页面显示出来'''
+    if not get_thumbnail_renderer().has_pending():
+        st.rerun()
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_total_configuration() -> list[str]:
-    '''获取所有目前的设计方案项'''
-    configuration_data = pd.read_csv(configuration_poath, encoding='utf-8')
-    return list(configuration_data['设计方案项编码'])
 
+def get_reference_format(index) -> Callable[[Any], str]:
+    '''下拉框中显示“编码 名称”的函数，基础资料中已经不存在的编码单独标注
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_total_equipment() -> list[str]:
-    '''获取所有目前的工艺装备'''
-    configuration_data = pd.read_csv(equipment_path, encoding='utf-8')
-    return list(configuration_data['工艺装备编码'])
+    标签字典在这里取一次，每个选项只做一次字典查找，不再每个选项都经过数据缓存。
+    '''
+    labels = index.labels
+    return lambda code: labels.get(code) or f'{code}（基础资料中不存在）'
 
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_total_material() -> list[str]:
-    '''获取所有目前的物料'''
-    configuration_data = pd.read_csv(material_path, encoding='utf-8')
-    return list(configuration_data['物料编码'])
+def reference_selectbox(label: str, name: str, value):
+    '''选择一个基础资料编码，当前值已经不存在时仍然保留并标注，不会被静默替换为第一个选项'''
+    index = get_reference_index(name)
+    options, position = index.codes, index.get_position(value)
+    if value is not None and value not in index:
+        options, position = (*index.codes, value), len(index.codes)
+    return st.selectbox(label, options, position, format_func=get_reference_format(index))
 
 
-@st.cache_data(ttl=3600, show_time=True, scope='session')
-def get_total_action() -> list[str]:
-    '''获取所有目前的工作'''
-    configuration_data = pd.read_csv(action_path, encoding='utf-8')
-    return list(configuration_data['作业动作编码'])
+def reference_multiselect(label: str, name: str, values: list):
+    '''选择多个基础资料编码，已经不存在的编码仍然保留并标注，不会被静默清空'''
+    index = get_reference_index(name)
+    missing = [value for value in dict.fromkeys(values or []) if value not in index]
+    options = (*index.codes, *missing) if missing else index.codes
+    return st.multiselect(label, options, values or None, format_func=get_reference_format(index))
 
 
 def get_template() -> dict[str, Any]:
@@ -97,7 +99,8 @@ def get_workstep_action_template() -> dict[str, Any]:
 
 @st.dialog('工序卡模板新增/修改详情', width='large', dismissible=False)
 def detail_view():
-    copy_data = st.session_state['page_item']
+    if st.session_state['page_conflict'] is not None:
+        conflict_view()
     st.text('模板单据头信息')
     with st.container(horizontal=True):
         st.session_state['page_item']['模板编码'] = st.text_input('模板编码', value=st.session_state['page_item']['模板编码'])
@@ -106,16 +109,8 @@ def detail_view():
     with st.container(horizontal=True):
         st.session_state['page_item']['适用车型'] = st.text_input('适用车型', value=st.session_state['page_item']['适用车型'])
         st.session_state['page_item']['专业分类'] = st.text_input('专业分类', value=st.session_state['page_item']['专业分类'])
-        total_configuration = get_total_configuration()
-        index = 0
-        if st.session_state['page_item']['设计方案项'] in total_configuration:
-            index = total_configuration.index(st.session_state['page_item']['设计方案项'])
-        st.session_state['page_item']['设计方案项'] = st.selectbox('设计方案项', total_configuration, index)
-    total_material = get_total_material()
-    default = None
-    if set(st.session_state['page_item']['物料清单']) <= set(total_material):
-        default = st.session_state['page_item']['物料清单']
-    st.session_state['page_item']['物料清单'] = st.multiselect('物料清单', total_material, default)
+        st.session_state['page_item']['设计方案项'] = reference_selectbox('设计方案项', '构型', st.session_state['page_item']['设计方案项'])
+    st.session_state['page_item']['物料清单'] = reference_multiselect('物料清单', '物料', st.session_state['page_item']['物料清单'])
 
     st.text('模板的工步分录')
     temp_df = pd.DataFrame(
@@ -193,20 +188,75 @@ def detail_view():
             st.toast(f'删除成功', icon='🎉')
             st.rerun()
     elif submit_label:
-        local_data = list(get_template_data())
-        local_data.append(st.session_state['page_item'])
-        with open(path, mode='w', encoding='utf8') as file:
-            file.write(json.dumps(local_data, indent=4, ensure_ascii=False, default=str))
-        get_template_data.clear()
+        # 引用了基础资料中不存在的编码时不保存
+        dangling = get_dangling_references({0: st.session_state['page_item']}).get(0)
+        if dangling:
+            st.error('以下引用在基础资料中不存在，请修改后再提交：\n\n' + '\n'.join(f'- {text}' for text in dangling))
+            return
+        # 只写入当前模板的记录，新增时没有模板 id
+        if st.session_state['page_template_id'] is None:
+            get_template_store().add(st.session_state['page_item'])
+        elif not save_template(st.session_state['page_item'], st.session_state['page_template_version']):
+            st.rerun()
         st.session_state['page_path'] = ''
         st.rerun()
     elif cancel_label:
-        local_data = list(get_template_data())
-        local_data.append(copy_data)
-        with open(path, mode='w', encoding='utf8') as file:
-            file.write(json.dumps(local_data, indent=4, ensure_ascii=False, default=str))
-        get_template_data.clear()
+        # 修改的内容只在页面中，取消时不需要写回
         st.session_state['page_path'] = ''
+        st.session_state['page_conflict'] = None
+        st.rerun()
+
+
+def save_template(item: dict, version: int) -> bool:
+    '''按打开时的版本号保存模板，其他人修改过时按字段合并：没有冲突的字段直接保存，有冲突时记录下来由用户选择'''
+    store = get_template_store()
+    template_id = st.session_state['page_template_id']
+    try:
+        store.update(template_id, item, version)
+        st.session_state['page_conflict'] = None
+        return True
+    except VersionConflict as error:
+        if error.current is None:
+            st.session_state['page_conflict'] = {'deleted': True, 'fields': [], 'theirs': {}}
+            return False
+    versions = {}
+    theirs = store.get(template_id, versions)
+    if theirs is None:
+        st.session_state['page_conflict'] = {'deleted': True, 'fields': [], 'theirs': {}}
+        return False
+    merged, conflicts = merge_template(st.session_state['page_base'], item, theirs)
+    st.session_state['page_item'] = merged
+    st.session_state['page_base'] = theirs
+    st.session_state['page_template_version'] = versions[template_id]
+    if conflicts:
+        st.session_state['page_conflict'] = {'deleted': False, 'fields': conflicts, 'theirs': theirs}
+        return False
+    # 只有一方修改的字段已经合并，按最新的版本号重新保存
+    return save_template(merged, versions[template_id])
+
+
+def conflict_view():
+    '''显示保存时与其他人修改冲突的字段，选择保留自己的修改或使用最新的数据'''
+    conflict = st.session_state['page_conflict']
+    if conflict['deleted']:
+        st.error('该模板已被其他人删除，可以另存为新的模板或取消修改', icon=':material/warning:')
+        if st.button('另存为新模板', icon=':material/save_as:'):
+            get_template_store().add(st.session_state['page_item'])
+            st.session_state['page_conflict'] = None
+            st.session_state['page_path'] = ''
+            st.rerun()
+        return
+    st.error(f'其他人同时修改了以下字段：{'、'.join(conflict['fields'])}，其余字段已经合并', icon=':material/warning:')
+    mine_label = st.button('保留我的修改', icon=':material/check:')
+    theirs_label = st.button('使用最新的数据', icon=':material/sync:')
+    if mine_label:
+        if save_template(st.session_state['page_item'], st.session_state['page_template_version']):
+            st.session_state['page_path'] = ''
+        st.rerun()
+    elif theirs_label:
+        for key in conflict['fields']:
+            st.session_state['page_item'][key] = copy.deepcopy(conflict['theirs'].get(key))
+        st.session_state['page_conflict'] = None
         st.rerun()
 
 
@@ -225,11 +275,7 @@ def detail_workstep_view():
         st.session_state['page_workstep_item']['是否五防工序'] = st.checkbox('是否五防工序', value=st.session_state['page_workstep_item']['是否五防工序'])
         st.session_state['page_workstep_item']['是否关键质量控制点'] = st.checkbox('是否关键质量控制点', value=st.session_state['page_workstep_item']['是否关键质量控制点'])
 
-    total_equipment = get_total_equipment()
-    default = None
-    if set(st.session_state['page_workstep_item']['工艺装备']) <= set(total_equipment):
-        default = st.session_state['page_workstep_item']['工艺装备']
-    st.session_state['page_workstep_item']['工艺装备'] = st.multiselect('工艺装备', total_equipment, default)
+    st.session_state['page_workstep_item']['工艺装备'] = reference_multiselect('工艺装备', '工艺装备', st.session_state['page_workstep_item']['工艺装备'])
 
     st.text('模板工步的动作分录')
     temp_df = pd.DataFrame(
@@ -287,11 +333,8 @@ def detail_workstep_view():
 def detail_workstep_action_view():
     copy_data = st.session_state['page_workstep_action_item']
     with st.container(horizontal=True):
-        total_data = get_total_action()
-        index = 0
-        if st.session_state['page_workstep_action_item']['作业动作编码'] in total_data:
-            index = total_data.index(st.session_state['page_workstep_action_item']['作业动作编码'])
-        st.session_state['page_workstep_action_item']['作业动作编码'] = st.selectbox('作业动作编码', total_data, index)
+        st.session_state['page_workstep_action_item']['作业动作编码'] = reference_selectbox(
+            '作业动作编码', '作业动作', st.session_state['page_workstep_action_item']['作业动作编码'])
         st.session_state['page_workstep_action_item']['工艺参数要求'] = st.text_input('工艺参数要求', value=st.session_state['page_workstep_action_item']['工艺参数要求'])
     with st.container(horizontal=True):
         total_data = ['定量', '定性']
@@ -320,6 +363,18 @@ def detail_workstep_action_view():
         st.rerun()
 
 
+def show_reference_report(templates: dict[int, dict]):
+    '''显示所有模板中失效的基础资料引用'''
+    report = check_references(templates)
+    if report.empty:
+        st.success('所有模板引用的基础资料都存在', icon=':material/check:')
+        return
+    report.insert(1, '模板编码', [templates[template_id]['模板编码'] for template_id in report['模板']])
+    report.insert(2, '工序名称', [templates[template_id]['工序名称'] for template_id in report['模板']])
+    st.warning(f'{report['模板'].nunique()}个模板中有{len(report)}个引用在基础资料中不存在', icon=':material/warning:')
+    st.dataframe(report.drop(columns='模板'), hide_index=True)
+
+
 # ------------------------------------------
 #  主页面定义的开始
 #  MARK: 主页面定义
@@ -330,61 +385,99 @@ def main():
     title = '工序卡模板维护'
     st.set_page_config(page_title=title, layout='wide')
     st.title(title)
-    st.warning('目前没有做多人同时操作的隔离，所以需要注意维护数据时的冲突问题')
+    st.caption('多人同时维护时，保存只写入自己修改的字段；其他人同时修改了同一模板的同一字段时，会提示选择保留哪一方的修改')
 
     with st.container(horizontal=True):
         add_label = st.button('新增', icon=':material/add:', shortcut='alt+w')
         change_label = st.button('修改', icon=':material/edit:', shortcut='alt+e')
         delete_label = st.button('删除', icon=':material/delete:', shortcut='alt+d')
         refresh_label = st.button('刷新', icon=':material/refresh:', shortcut='alt+f')
-
-    local_data = get_template_data()
+        check_label = st.button('检查引用', icon=':material/rule:', help='检查模板引用的设计方案项、物料、工艺装备和作业动作是否还在基础资料中')
+        st.download_button(
+            '导出', data=get_template_store().export_json, file_name='工序卡模板.json', mime='application/json',
+            icon=':material/download:', on_click='ignore',
+        )
+        with st.popover('导入', icon=':material/upload:'):
+            uploaded_file = st.file_uploader('工序卡模板.json', type=['json'])
+            replace = st.toggle('清空现有的模板后导入')
+            import_label = st.button('开始导入', icon=':material/send:', disabled=uploaded_file is None)
+    # 按索引字段查找，不需要读取所有模板
+    keyword = st.text_input('查找', placeholder='输入模板编码、工序编码、适用车型或设计方案项', label_visibility='collapsed')
+
+    if keyword.strip():
+        versions = {}
+        local_data = get_template_store().search(keyword.strip(), versions)
+    else:
+        local_data, versions = get_template_data()
+    thumbnails = get_thumbnail_urls(local_data, versions)
+    template_ids = list(local_data)
+    local_data = list(local_data.values())
     temp_data = pd.DataFrame({
         '模板编码': [item['模板编码'] for item in local_data],  # pyright: ignore[reportArgumentType]
         '工序编码': [item['工序编码'] for item in local_data],  # pyright: ignore[reportArgumentType]
         '工序名称': [item['工序名称'] for item in local_data],  # pyright: ignore[reportArgumentType]
         '适用车型': [item['适用车型'] for item in local_data],  # pyright: ignore[reportArgumentType]
         '专业分类': [item['专业分类'] for item in local_data],  # pyright: ignore[reportArgumentType]
+        '预览': thumbnails,
     })
 
-    event = st.dataframe(temp_data, hide_index=True, on_select='rerun', selection_mode='single-row')
+    event = st.dataframe(
+        temp_data, hide_index=True, on_select='rerun', selection_mode='single-row',
+        column_config={'预览': st.column_config.ImageColumn('预览', help='工序卡版式的缩略图')},
+    )
 
     # ------------------------------------------
     #  标志位按钮处理
     #  MARK: 标志位按钮处理
     # ------------------------------------------
+    if check_label:
+        show_reference_report(dict(zip(template_ids, local_data)))
+    if import_label and uploaded_file is not None:
+        items = json.loads(uploaded_file.getvalue())
+        count = get_template_store().import_items(items, replace)
+        dangling = get_dangling_references(dict(enumerate(items)))
+        if dangling:
+            st.toast(f'导入了{count}个模板，其中{len(dangling)}个模板引用了不存在的基础资料，可以点击“检查引用”查看', icon='🚨')
+        else:
+            st.toast(f'导入了{count}个模板', icon='🎉')
+        st.rerun()
     if refresh_label:
-        get_template_data.clear()
-        get_total_configuration.clear()
-        get_total_equipment.clear()
-        get_total_material.clear()
-        get_total_action.clear()
+        # 数据变化后读取时会自动重新加载，这里强制重新读取一次
+        get_data_cache().invalidate()
         st.rerun()
 
     if add_label:
         st.session_state['page_item'] = get_template()
+        st.session_state['page_template_id'] = None
+        st.session_state['page_conflict'] = None
         st.session_state['page_path'] = 'main'
         detail_view()
     elif change_label:
         if len(event.selection.rows) == 0:  # type: ignore
             st.toast(f'未选择任何行无法修改', icon='🚨')
         else:
-            st.session_state['page_item'] = local_data[event.selection.rows[0]]  # type: ignore
-            del local_data[event.selection.rows[0]]  # type: ignore
-            with open(path, mode='w', encoding='utf8') as file:
-                file.write(json.dumps(local_data, indent=4, ensure_ascii=False, default=str))
+            # 缓存中的模板所有会话共用，修改前复制一份
+            st.session_state['page_item'] = copy.deepcopy(local_data[event.selection.rows[0]])  # type: ignore
+            st.session_state['page_template_id'] = template_ids[event.selection.rows[0]]  # type: ignore
+            # 打开时的内容和版本号，保存时用于判断和合并其他人的修改
+            st.session_state['page_base'] = copy.deepcopy(st.session_state['page_item'])
+            st.session_state['page_template_version'] = versions[st.session_state['page_template_id']]
+            st.session_state['page_conflict'] = None
             st.session_state['page_path'] = 'main'
-            get_template_data.clear()
             detail_view()
     elif delete_label:
         if len(event.selection.rows) == 0:  # type: ignore
             st.toast(f'未选择任何行无法修改', icon='🚨')
         else:
-            del local_data[event.selection.rows[0]]  # type: ignore
-            with open(path, mode='w', encoding='utf8') as file:
-                file.write(json.dumps(local_data, indent=4, ensure_ascii=False, default=str))
-            get_template_data.clear()
-            st.rerun()
+            template_id = template_ids[event.selection.rows[0]]  # type: ignore
+            try:
+                get_template_store().delete(template_id, versions[template_id])
+            except VersionConflict:
+                st.toast('该模板已被其他人修改，请刷新后确认再删除', icon='🚨')
+            else:
+                st.rerun()
+    elif not check_label and PLACEHOLDER_URL in thumbnails:
+        wait_thumbnails()
 
 
 # dialog的路由页面参数存储初始化
@@ -393,6 +486,15 @@ if 'page_path' not in st.session_state:
 # 页面修改的对应单据的id初始化
 if 'page_item' not in st.session_state:
     st.session_state['page_item'] = get_template()
+if 'page_template_id' not in st.session_state:
+    st.session_state['page_template_id'] = None
+if 'page_template_version' not in st.session_state:
+    st.session_state['page_template_version'] = None
+if 'page_base' not in st.session_state:
+    st.session_state['page_base'] = get_template()
+# 保存时与其他人修改冲突的信息
+if 'page_conflict' not in st.session_state:
+    st.session_state['page_conflict'] = None
 if 'page_workstep_item' not in st.session_state:
     st.session_state['page_workstep_item'] = get_workstep_template()
 if 'page_workstep_action_item' not in st.session_state: